@@ -48,6 +48,7 @@ app.add_command(name="assign-emodels", cmd=ngv.assign_emodels)
 app.add_command(name="finalize-astrocytes", cmd=ngv.finalize_astrocytes)
 app.add_command(name="microdomains", cmd=ngv.build_microdomains)
 app.add_command(name="gliovascular-connectivity", cmd=ngv.gliovascular_connectivity)
+app.add_command(name="gliovascular-merge", cmd=ngv.merge_gliovascular_connectivity)
 app.add_command(
     name="attach-endfeet-info-to-gliovascular-connectivity",
     cmd=ngv.attach_endfeet_info_to_gliovascular_connectivity,
@@ -61,6 +62,7 @@ app.add_command(
 
 app.add_command(name="synthesis", cmd=ngv.synthesis)
 app.add_command(name="glialglial-connectivity", cmd=ngv.build_glialglial_connectivity)
+app.add_command(name="vasculature-mesh-cache", cmd=ngv.build_vasculature_mesh_cache)
 app.add_command(name="endfeet-area", cmd=ngv.build_endfeet_surface_meshes)
 app.add_command(name="config-file", cmd=ngv.ngv_config)
 app.add_command(name="refined-surface-mesh", cmd=ngv.refine_surface_mesh)
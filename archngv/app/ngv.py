@@ -11,7 +11,13 @@ from atlas_commons.app_utils import assert_properties
 from voxcell import ROIMask
 
 from archngv.app.logger import LOGGER
-from archngv.app.utils import load_ngv_manifest, write_json
+from archngv.app.utils import (
+    hdf5_storage_options,
+    load_ngv_manifest,
+    seed_option,
+    task_chunk_size_option,
+    write_json,
+)
 
 
 @click.command()
@@ -49,13 +55,7 @@ def assign_emodels(input, hoc, output):
 @click.option("--atlas", help="Atlas URL / path", required=True)
 @click.option("--atlas-cache", help="Path to atlas cache folder", default=None, show_default=True)
 @click.option("--vasculature", help="Path to vasculature node population", required=True)
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@seed_option
 @click.option("--population-name", help="Name of astrocyte node population", required=True)
 @click.option("-o", "--output", help="Path to output SONATA nodes file", required=True)
 def cell_placement(config, atlas, atlas_cache, vasculature, seed, population_name, output):
@@ -161,15 +161,19 @@ def finalize_astrocytes(somata_file, emodels_file, output):
 )
 @click.option("--atlas", help="Atlas URL / path", required=True)
 @click.option("--atlas-cache", help="Path to atlas cache folder", default=None, show_default=True)
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@seed_option
 @click.option("-o", "--output-file-path", help="Path to output hdf5 file", required=True)
-def build_microdomains(config, astrocytes, atlas, atlas_cache, seed, output_file_path):
+@hdf5_storage_options
+def build_microdomains(
+    config,
+    astrocytes,
+    atlas,
+    atlas_cache,
+    seed,
+    output_file_path,
+    hdf5_chunk_size,
+    hdf5_compression,
+):
     """Generate astrocyte microdomain tessellation as a partition of space into convex
     polygons."""
     # pylint: disable=too-many-locals
@@ -272,7 +276,12 @@ def build_microdomains(config, astrocytes, atlas, atlas_cache, seed, output_file
     )
 
     LOGGER.info("Export overlapping microdomains...")
-    export_microdomains(output_file_path, corrected_microdomains, global_scale_factors)
+    export_microdomains(
+        output_file_path,
+        corrected_microdomains,
+        global_scale_factors,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
+    )
     LOGGER.info("Done!")
 
 
@@ -285,50 +294,144 @@ def build_microdomains(config, astrocytes, atlas, atlas_cache, seed, output_file
 )
 @click.option("--microdomains", help="Path to microdomains structure (HDF5)", required=True)
 @click.option("--vasculature", help="Path to vasculature sonata dataset", required=True)
+@seed_option
+@click.option("--parallel", help="Parallelize with 'multiprocessing'", is_flag=True)
 @click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
+    "--astrocyte-id-range",
+    help="Connect only the astrocytes with ids in [BEG, END), writing a partial edge file",
     type=int,
-    default=0,
-    show_default=True,
+    nargs=2,
+    default=None,
+)
+@click.option(
+    "--shard",
+    help="Connect only the INDEX-th of COUNT contiguous astrocyte ranges, writing a partial "
+    "edge file",
+    type=int,
+    nargs=2,
+    default=None,
 )
 @click.option("--population-name", help="Name of the edges population", required=True)
 @click.option("--output", help="Path to output edges HDF5 (data)", required=True)
+@hdf5_storage_options
 def gliovascular_connectivity(
-    config, astrocytes, microdomains, vasculature, seed, population_name, output
+    config,
+    astrocytes,
+    microdomains,
+    vasculature,
+    seed,
+    parallel,
+    astrocyte_id_range,
+    shard,
+    population_name,
+    output,
+    hdf5_chunk_size,
+    hdf5_compression,
 ):
     """
     Build connectivity between astrocytes and the vasculature graph.
+
+    With --astrocyte-id-range or --shard a partial edge population is written, and the
+    partial populations are combined with gliovascular-merge.
     """
-    # pylint: disable=too-many-locals
+    # pylint: disable=too-many-arguments
     from vascpy import PointVasculature
 
-    from archngv.building.connectivity.gliovascular import generate_gliovascular_edge_properties
-    from archngv.building.exporters import write_edge_population
+    from archngv.building.connectivity.gliovascular import (
+        astrocyte_id_range_of,
+        generate_gliovascular_edge_properties,
+        write_gliovascular_edge_population,
+    )
     from archngv.core.datasets import Microdomains
+    from archngv.exceptions import NGVError
 
     LOGGER.info("Seed: %d", seed)
     numpy.random.seed(seed)
 
     astrocytes = voxcell.CellCollection.load_sonata(astrocytes)
 
+    try:
+        astrocyte_id_range = astrocyte_id_range_of(len(astrocytes), astrocyte_id_range, shard)
+    except NGVError as e:
+        raise click.UsageError(str(e)) from e
+
     LOGGER.info("Generating gliovascular connectivity...")
-    astrocyte_ids, vasculature_ids, properties = generate_gliovascular_edge_properties(
+    metrics = {}
+    edges = generate_gliovascular_edge_properties(
         astrocytes=astrocytes,
         astrocytic_domains=Microdomains(microdomains),
         vasculature=PointVasculature.load_sonata(vasculature),
         params=load_ngv_manifest(config)["gliovascular_connectivity"],
+        seed=seed,
+        n_workers=-1 if parallel else 1,
+        metrics=metrics,
+        astrocyte_ids=numpy.arange(*astrocyte_id_range) if astrocyte_id_range else None,
     )
 
+    metrics_path = Path(output).with_suffix(".metrics.json")
+    LOGGER.info("Writing gliovascular metrics to %s", metrics_path)
+    write_json(metrics_path, metrics)
+
     LOGGER.info("Exporting sonata edges...")
-    write_edge_population(
-        output_path=output,
-        population_name=population_name,
-        source_population=voxcell.CellCollection.load_sonata(vasculature),
-        target_population=astrocytes,
-        source_node_ids=vasculature_ids,
-        target_node_ids=astrocyte_ids,
-        properties=properties,
+    write_gliovascular_edge_population(
+        output,
+        population_name,
+        voxcell.CellCollection.load_sonata(vasculature),
+        astrocytes,
+        edges,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
+        astrocyte_id_range=astrocyte_id_range,
+    )
+
+    LOGGER.info("Done!")
+
+
+@click.command()
+@click.option(
+    "--shards",
+    help="Path to a partial gliovascular edges HDF5, as many times as the shards",
+    multiple=True,
+    required=True,
+)
+@click.option(
+    "--astrocytes",
+    help="Path to the sonata file with astrocyte's positions",
+    required=True,
+)
+@click.option("--vasculature", help="Path to vasculature sonata dataset", required=True)
+@click.option("--population-name", help="Name of the edges population", required=True)
+@click.option("--output", help="Path to output edges HDF5 (data)", required=True)
+@hdf5_storage_options
+def merge_gliovascular_connectivity(
+    shards,
+    astrocytes,
+    vasculature,
+    population_name,
+    output,
+    hdf5_chunk_size,
+    hdf5_compression,
+):
+    """
+    Merge the partial gliovascular edge populations of gliovascular-connectivity shards.
+    """
+    from archngv.building.connectivity.gliovascular import (
+        merge_gliovascular_shards,
+        write_gliovascular_edge_population,
+    )
+
+    astrocytes = voxcell.CellCollection.load_sonata(astrocytes)
+
+    LOGGER.info("Merging %d gliovascular shards...", len(shards))
+    edges = merge_gliovascular_shards(shards, population_name, len(astrocytes))
+
+    LOGGER.info("Exporting sonata edges...")
+    write_gliovascular_edge_population(
+        output,
+        population_name,
+        voxcell.CellCollection.load_sonata(vasculature),
+        astrocytes,
+        edges,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
     )
 
     LOGGER.info("Done!")
@@ -341,14 +444,10 @@ def gliovascular_connectivity(
 @click.option("--endfeet-meshes-path", help="Path to HDF5 endfeet meshes", required=True)
 @click.option("--vasculature-sonata", help="Path to nodes for vasculature (HDF5)", required=True)
 @click.option("--morph-dir", help="Path to morphology folder", required=True)
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@seed_option
 @click.option("--parallel", help="Parallelize with 'multiprocessing'", is_flag=True)
+@task_chunk_size_option
+@hdf5_storage_options
 def attach_endfeet_info_to_gliovascular_connectivity(
     input_file,
     output_file,
@@ -358,7 +457,11 @@ def attach_endfeet_info_to_gliovascular_connectivity(
     morph_dir,
     seed,
     parallel,
+    chunk_size,
+    hdf5_chunk_size,
+    hdf5_compression,
 ):
+    # pylint: disable=too-many-arguments
     """
     Finalizes gliovascular connectivity. It needs to be ran after synthesis and endfeet
     area growing. It copies to the input GliovascularConnectivity population and adds
@@ -380,14 +483,11 @@ def attach_endfeet_info_to_gliovascular_connectivity(
     """
     import shutil
 
-    from vascpy import PointVasculature
-
-    from archngv.app.utils import apply_parallel_function
     from archngv.building.endfeet_reconstruction.gliovascular_properties import (
         endfeet_mesh_properties,
     )
     from archngv.building.exporters import add_properties_to_edge_population
-    from archngv.core.datasets import CellData, EndfootSurfaceMeshes, GliovascularConnectivity
+    from archngv.core.datasets import GliovascularConnectivity
 
     gv_connectivity = GliovascularConnectivity(input_file)
 
@@ -395,18 +495,26 @@ def attach_endfeet_info_to_gliovascular_connectivity(
     # population.
     properties = endfeet_mesh_properties(
         seed=seed,
-        astrocytes=CellData(astrocytes),
-        gliovascular_connectivity=gv_connectivity,
-        vasculature=PointVasculature.load_sonata(vasculature_sonata),
-        endfeet_meshes=EndfootSurfaceMeshes(endfeet_meshes_path),
-        morph_dir=morph_dir,
-        map_function=apply_parallel_function if parallel else map,
+        paths={
+            "astrocytes": astrocytes,
+            "gliovascular_connectivity": input_file,
+            "vasculature": vasculature_sonata,
+            "endfeet_meshes": endfeet_meshes_path,
+            "morph_dir": morph_dir,
+        },
+        n_workers=-1 if parallel else 1,
+        chunk_size=chunk_size,
     )
     # copy gv file to the output location
     shutil.copyfile(input_file, output_file)
 
     # add the new properties to the copied out file
-    add_properties_to_edge_population(output_file, gv_connectivity.name, properties)
+    add_properties_to_edge_population(
+        output_file,
+        gv_connectivity.name,
+        properties,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
+    )
 
 
 @click.command()
@@ -431,15 +539,10 @@ def attach_endfeet_info_to_gliovascular_connectivity(
     help="Path to the spatial-index-synapses directory",
     required=True,
 )
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@seed_option
 @click.option("--population-name", help="The name of the edge population", required=True)
 @click.option("-o", "--output-path", help="Path to output file (SONATA Edges HDF5)", required=True)
+@hdf5_storage_options
 def neuroglial_connectivity(
     neurons_path,
     astrocytes_path,
@@ -449,9 +552,11 @@ def neuroglial_connectivity(
     seed,
     population_name,
     output_path,
+    hdf5_chunk_size,
+    hdf5_compression,
 ):
     """Generate connectivity between neurons (N) and astrocytes (G)"""
-    # pylint: disable=too-many-locals
+    # pylint: disable=too-many-locals,too-many-arguments
 
     from archngv.building.connectivity.neuroglial_generation import (
         generate_neuroglial_edge_properties,
@@ -482,6 +587,7 @@ def neuroglial_connectivity(
         source_node_ids=astrocyte_ids,
         target_node_ids=neuron_ids,
         properties=properties,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
     )
     LOGGER.info("Done!")
 
@@ -498,13 +604,9 @@ def neuroglial_connectivity(
 @click.option("--synaptic-data-path", help="Path to HDF5 with synapse positions", required=True)
 @click.option("--morph-dir", help="Path to morphology folder", required=True)
 @click.option("--parallel", help="Parallelize with 'multiprocessing'", is_flag=True)
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@task_chunk_size_option
+@seed_option
+@hdf5_storage_options
 def attach_morphology_info_to_neuroglial_connectivity(
     input_file_path,
     output_file_path,
@@ -513,8 +615,12 @@ def attach_morphology_info_to_neuroglial_connectivity(
     synaptic_data_path,
     morph_dir,
     parallel,
+    chunk_size,
     seed,
+    hdf5_chunk_size,
+    hdf5_compression,
 ):
+    # pylint: disable=too-many-arguments
     """For each astrocyte-neuron connection annotate the closest morphology section,
     segment, offset for each synapse.
 
@@ -525,14 +631,14 @@ def attach_morphology_info_to_neuroglial_connectivity(
     """
     import shutil
 
-    from archngv.app.utils import apply_parallel_function
     from archngv.building.exporters import add_properties_to_edge_population
     from archngv.building.morphology_synthesis.neuroglial_properties import (
         astrocyte_morphology_properties,
     )
-    from archngv.core.datasets import CellData, NeuroglialConnectivity
+    from archngv.core.datasets import NeuroglialConnectivity
 
     paths = {
+        "astrocytes": astrocytes_path,
         "microdomains": microdomains_path,
         "synaptic_data": synaptic_data_path,
         "neuroglial_connectivity": input_file_path,
@@ -543,33 +649,39 @@ def attach_morphology_info_to_neuroglial_connectivity(
 
     properties = astrocyte_morphology_properties(
         seed=seed,
-        astrocytes=CellData(astrocytes_path),
         n_connections=len(ng_connectivity),
         paths=paths,
-        map_function=apply_parallel_function if parallel else map,
+        n_workers=-1 if parallel else 1,
+        chunk_size=chunk_size,
     )
 
     # make a copy of the original and modify
     shutil.copyfile(input_file_path, output_file_path)
 
     # add the new properties to the copied out file
-    add_properties_to_edge_population(output_file_path, ng_connectivity.name, properties)
+    add_properties_to_edge_population(
+        output_file_path,
+        ng_connectivity.name,
+        properties,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
+    )
 
 
 @click.command(name="glialglial-connectivity")
 @click.option("--astrocytes", help="Path to HDF5 with somata positions and radii", required=True)
 @click.option("--touches-dir", help="Path to touches directory", required=True)
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@seed_option
 @click.option("--population-name", help="Name of the edge population", required=True)
 @click.option("--output-connectivity", help="Path to output HDF5 (connectivity)", required=True)
+@hdf5_storage_options
 def build_glialglial_connectivity(
-    astrocytes, touches_dir, seed, population_name, output_connectivity
+    astrocytes,
+    touches_dir,
+    seed,
+    population_name,
+    output_connectivity,
+    hdf5_chunk_size,
+    hdf5_compression,
 ):
     """Generate connectivitiy between astrocytes (G-G)"""
     # pylint: disable=redefined-argument-from-local,too-many-locals
@@ -593,40 +705,93 @@ def build_glialglial_connectivity(
         source_node_ids=data.pop("source_node_id").to_numpy(),
         target_node_ids=data.pop("target_node_id").to_numpy(),
         properties=data,
+        storage={"chunk_size": hdf5_chunk_size, "compression": hdf5_compression},
     )
     LOGGER.info("Done!")
 
 
+@click.command(name="vasculature-mesh-cache")
+@click.option("--vasculature-mesh-path", help="Path to vasculature mesh", required=True)
+@click.option("--compact", help="Store int32 ids and float32 geometry", is_flag=True)
+@click.option("-o", "--output-path", help="Path to output file (HDF5)", required=True)
+def build_vasculature_mesh_cache(vasculature_mesh_path, compact, output_path):
+    """Convert the vasculature surface mesh to a binary cache with its vertex adjacency and
+    triangle areas, which is memory mapped instead of parsed when loaded."""
+    import openmesh
+
+    from archngv.building.exporters import export_vasculature_surface_mesh
+    from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
+
+    LOGGER.info("Load vasculature mesh at %s", vasculature_mesh_path)
+    mesh = VasculatureSurfaceMesh.from_openmesh(openmesh.read_trimesh(vasculature_mesh_path))
+
+    if compact:
+        mesh = mesh.compact()
+
+    LOGGER.info("Export to HDF5...")
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    export_vasculature_surface_mesh(output_path, mesh)
+
+    LOGGER.info("Done!")
+
+
 @click.command(name="endfeet-area")
 @click.option("--config-path", help="Path to YAML config", required=True)
-@click.option("--vasculature-mesh-path", help="Path to vasculature mesh", required=True)
+@click.option(
+    "--vasculature-mesh-path",
+    help="Path to vasculature mesh, or to its cache (see vasculature-mesh-cache)",
+    required=True,
+)
 @click.option(
     "--gliovascular-connectivity-path",
     help="Path to sonata gliovascular file",
     required=True,
 )
+@seed_option
 @click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
+    "--reference-vasculature-mesh",
+    help=(
+        "Store the endfeet as triangle ids into the vasculature mesh, instead of copying "
+        "their points and triangles"
+    ),
+    is_flag=True,
+)
+@click.option(
+    "--compact",
+    help=(
+        "Process the mesh with int32 ids and float32 geometry and travel times, to reduce the "
+        "peak memory. Best combined with a compact mesh cache."
+    ),
+    is_flag=True,
 )
+@click.option("--parallel", help="Parallelize with 'multiprocessing'", is_flag=True)
 @click.option("-o", "--output-path", help="Path to output file (HDF5)", required=True)
+@hdf5_storage_options
 def build_endfeet_surface_meshes(
     config_path,
     vasculature_mesh_path,
     gliovascular_connectivity_path,
     seed,
+    reference_vasculature_mesh,
+    compact,
+    parallel,
     output_path,
+    hdf5_chunk_size,
+    hdf5_compression,
 ):
+    # pylint: disable=too-many-arguments
     """Generate the astrocytic endfeet geometries on the surface of the vasculature
     mesh."""
+    import h5py
     import openmesh
 
     from archngv.building.endfeet_reconstruction.area_generation import endfeet_area_generation
-    from archngv.building.exporters import export_endfeet_meshes
+    from archngv.building.exporters import (
+        export_endfeet_mesh_references,
+        export_endfeet_meshes,
+    )
     from archngv.core.datasets import GliovascularConnectivity
+    from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
 
     numpy.random.seed(seed)
     LOGGER.info("Seed: %d", seed)
@@ -634,7 +799,10 @@ def build_endfeet_surface_meshes(
     config = load_ngv_manifest(config_path)["endfeet_surface_meshes"]
 
     LOGGER.info("Load vasculature mesh at %s", vasculature_mesh_path)
-    vasculature_mesh = openmesh.read_trimesh(vasculature_mesh_path)
+    if h5py.is_hdf5(vasculature_mesh_path):
+        vasculature_mesh = VasculatureSurfaceMesh.load(vasculature_mesh_path)
+    else:
+        vasculature_mesh = openmesh.read_trimesh(vasculature_mesh_path)
 
     endfeet_points = GliovascularConnectivity(
         gliovascular_connectivity_path
@@ -645,10 +813,19 @@ def build_endfeet_surface_meshes(
         vasculature_mesh=vasculature_mesh,
         parameters=config,
         endfeet_points=endfeet_points,
+        n_workers=-1 if parallel else 1,
+        compact=compact,
     )
 
+    storage = {"chunk_size": hdf5_chunk_size, "compression": hdf5_compression}
+
     LOGGER.info("Export to HDF5...")
-    export_endfeet_meshes(output_path, data_generator, len(endfeet_points))
+    if reference_vasculature_mesh:
+        export_endfeet_mesh_references(
+            output_path, data_generator, len(endfeet_points), vasculature_mesh_path, storage
+        )
+    else:
+        export_endfeet_meshes(output_path, data_generator, len(endfeet_points), storage)
 
     LOGGER.info("Done!")
 
@@ -700,13 +877,7 @@ def _synthesize(astrocyte_index, seed, paths, config):
 )
 @click.option("--out-morph-dir", help="Path to output morphology folder", required=True)
 @click.option("--parallel", help="Use Dask's mpi client", is_flag=True)
-@click.option(
-    "--seed",
-    help="Pseudo-random generator seed",
-    type=int,
-    default=0,
-    show_default=True,
-)
+@seed_option
 def synthesis(
     config_path,
     tns_distributions_path,
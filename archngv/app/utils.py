@@ -5,16 +5,62 @@
 import json
 import os
 from pathlib import Path
-from typing import Any, Dict, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import click
 import numpy
 import yaml
 
+from archngv.exceptions import NGVError
+
 REQUIRED_PATH = click.Path(exists=True, readable=True, dir_okay=False, resolve_path=True)
 
 PathLike = Union[str, Path]
 
+# number of astrocytes processed by each task of the parallel attach commands
+TASK_CHUNK_SIZE = 64
+
+
+def seed_option(command):
+    """Adds the pseudo-random generator seed option to a command."""
+    return click.option(
+        "--seed",
+        help="Pseudo-random generator seed",
+        type=int,
+        default=0,
+        show_default=True,
+    )(command)
+
+
+def task_chunk_size_option(command):
+    """Adds the number of astrocytes processed by each parallel task option to a command."""
+    return click.option(
+        "--chunk-size",
+        help="Number of astrocytes processed by each parallel task",
+        type=int,
+        default=TASK_CHUNK_SIZE,
+        show_default=True,
+    )(command)
+
+
+def hdf5_storage_options(command):
+    """Adds the chunking and compression options of the output hdf5 datasets to a command."""
+    command = click.option(
+        "--hdf5-compression",
+        help="Compression filter of the output datasets. Uncompressed if not given",
+        type=click.Choice(["gzip", "lzf"]),
+        default=None,
+    )(command)
+    return click.option(
+        "--hdf5-chunk-size",
+        help=(
+            "Number of rows in each chunk of the output datasets. If not given, compressed "
+            "datasets are chunked according to their typical group length"
+        ),
+        type=int,
+        default=None,
+    )(command)
+
 
 def load_ngv_manifest(filepath: PathLike) -> Dict[str, Any]:
     """Loads a manifest configuration file.
@@ -82,16 +128,58 @@ def choose_connectome(circuit):
     return next(iter(circuit.connectome.values()))
 
 
-def apply_parallel_function(function, data_generator):
-    """Apply the function on the data generator in parallel and yield the results
+def chunk_ranges(n_elements: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """Splits the ids [0, n_elements) into consecutive (beg, end) ranges of chunk_size ids."""
+    if chunk_size < 1:
+        raise NGVError(f"Chunk size must be positive. Got {chunk_size}")
+
+    return [(beg, min(beg + chunk_size, n_elements)) for beg in range(0, n_elements, chunk_size)]
+
+
+def apply_parallel_function(
+    function: Callable[[Any], Any],
+    chunks: Iterable[Any],
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple = (),
+    finalizer: Optional[Callable[[], None]] = None,
+    n_workers: int = -1,
+) -> Iterator[Any]:
+    """Apply the function on each chunk in parallel and yield the results.
+
+    Each worker process is set up once with initializer(*initargs), e.g. to open the input
+    datasets, so that the tasks carry only the chunks, e.g. ranges of ids.
+
+    Args:
+        function: The function to apply on each chunk.
+        chunks: The tasks of the function.
+        initializer: Called once in each worker before its first task.
+        initargs: The arguments of the initializer.
+        finalizer: Called after the last chunk if they are processed in the current process,
+            e.g. to release what the initializer has set up.
+        n_workers: Number of processes, -1 for all the cores. If 1, the chunks are processed
+            in the current process.
+
     Notes:
-        The results are unordered
+        The results are yielded in the order of the chunks.
     """
-    import joblib
-
-    return joblib.Parallel(verbose=150, n_jobs=-1)(
-        joblib.delayed(function)(data) for data in data_generator
-    )
+    if n_workers == 1:
+        try:
+            if initializer is not None:
+                initializer(*initargs)
+            yield from map(function, chunks)
+        finally:
+            if finalizer is not None:
+                finalizer()
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=None if n_workers == -1 else n_workers,
+        initializer=initializer,
+        initargs=initargs,
+    ) as executor:
+        yield from executor.map(function, chunks)
 
 
 def readonly_morphology(filepath, position):
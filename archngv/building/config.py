@@ -153,6 +153,7 @@ def _add_ngv_sonata_nodes_edges(config: dict, root_dir: Path, manifest: dict) ->
                         "type": Population.VASCULATURE,
                         "vasculature_file": _make_abs(root_dir, manifest["vasculature"]),
                         "vasculature_mesh": _make_abs(root_dir, manifest["vasculature_mesh"]),
+                        "vasculature_mesh_cache": "$BASE_DIR/meshes/vasculature_surface_mesh.h5",
                     }
                 },
             },
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: Apache-2.0
+
+""" Read-only CSR adjacency of the vasculature graph, for walking its edges with array
+indexing instead of sparse matrix queries.
+"""
+import numpy as np
+
+from archngv.utils.segmented import offsets_from_counts
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+def _csr(keys, neighbors, n_vertices):
+    """Groups the edges by key vertex with their neighbors sorted in ascending order.
+
+    Returns:
+        offsets: array[int64, (n_vertices + 1,)]
+        neighbors: array[int64, (E,)]
+        edge_ids: array[int64, (E,)]
+    """
+    edge_ids = np.lexsort((neighbors, keys))
+    offsets = offsets_from_counts(np.bincount(keys, minlength=n_vertices))
+    return (
+        _readonly(offsets),
+        _readonly(neighbors[edge_ids]),
+        _readonly(edge_ids.astype(np.int64)),
+    )
+
+
+class EdgeAdjacency:
+    """Compact in/out adjacency of a directed graph, built once from its edges.
+
+    Args:
+        edges: array[int, (E, 2)]
+            The (start, end) vertices of each edge.
+        n_vertices: int
+            The number of vertices. If None, it is inferred from the edges.
+
+    Notes:
+        The neighbors of each vertex are sorted in ascending order, therefore the first
+        predecessor and successor are the same as the ones of vascpy's adjacency matrix.
+        For duplicate edges the smallest edge id is kept in the lookup.
+    """
+
+    def __init__(self, edges, n_vertices=None):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+        if n_vertices is None:
+            n_vertices = int(edges.max()) + 1 if len(edges) > 0 else 0
+
+        self.n_vertices = n_vertices
+        self.edges = _readonly(edges.copy())
+
+        self.out_offsets, self.out_vertices, self.out_edges = _csr(
+            edges[:, 0], edges[:, 1], n_vertices
+        )
+        self.in_offsets, self.in_vertices, self.in_edges = _csr(
+            edges[:, 1], edges[:, 0], n_vertices
+        )
+
+        # (u, v) keys sorted in the order of the out edges, for the edge id lookups
+        self._keys = _readonly(
+            np.repeat(np.arange(n_vertices, dtype=np.int64), np.diff(self.out_offsets)) * n_vertices
+            + self.out_vertices
+        )
+
+    @classmethod
+    def from_vasculature(cls, vasculature):
+        """Creates the adjacency of a PointVasculature."""
+        return cls(vasculature.edges, n_vertices=len(vasculature.points))
+
+    @property
+    def n_edges(self):
+        """Returns the number of edges."""
+        return len(self.edges)
+
+    def successors(self, vertex):
+        """Returns the children of the vertex."""
+        return self.out_vertices[self.out_offsets[vertex] : self.out_offsets[vertex + 1]]
+
+    def predecessors(self, vertex):
+        """Returns the parents of the vertex."""
+        return self.in_vertices[self.in_offsets[vertex] : self.in_offsets[vertex + 1]]
+
+    def outgoing_edges(self, vertex):
+        """Returns the ids of the edges starting from the vertex, sorted by end vertex."""
+        return self.out_edges[self.out_offsets[vertex] : self.out_offsets[vertex + 1]]
+
+    def incoming_edges(self, vertex):
+        """Returns the ids of the edges ending to the vertex, sorted by start vertex."""
+        return self.in_edges[self.in_offsets[vertex] : self.in_offsets[vertex + 1]]
+
+    def first_outgoing_edges(self, vertices):
+        """Returns the id of the edge to the first successor of each vertex, -1 if none.
+
+        Args:
+            vertices: array[int, (N,)]
+
+        Returns:
+            edge_ids: array[int64, (N,)]
+        """
+        return self._first_edges(self.out_offsets, self.out_edges, vertices)
+
+    def first_incoming_edges(self, vertices):
+        """Returns the id of the edge from the first predecessor of each vertex, -1 if none.
+
+        Args:
+            vertices: array[int, (N,)]
+
+        Returns:
+            edge_ids: array[int64, (N,)]
+        """
+        return self._first_edges(self.in_offsets, self.in_edges, vertices)
+
+    @staticmethod
+    def _first_edges(offsets, edge_ids, vertices):
+        vertices = np.asarray(vertices, dtype=np.int64)
+        starts = offsets[vertices]
+        has_edges = starts < offsets[vertices + 1]
+
+        result = np.full(len(vertices), fill_value=-1, dtype=np.int64)
+        result[has_edges] = edge_ids[starts[has_edges]]
+        return result
+
+    def edge_index(self, start_vertex, end_vertex):
+        """Returns the id of the edge (start_vertex, end_vertex), -1 if it does not exist."""
+        return int(self.edge_indices([start_vertex], [end_vertex])[0])
+
+    def edge_indices(self, start_vertices, end_vertices):
+        """Returns the ids of the edges (start_vertices[i], end_vertices[i]), -1 for the
+        pairs that are not connected.
+
+        Args:
+            start_vertices: array[int, (N,)]
+            end_vertices: array[int, (N,)]
+
+        Returns:
+            edge_ids: array[int64, (N,)]
+        """
+        keys = np.asarray(start_vertices, dtype=np.int64) * self.n_vertices + np.asarray(
+            end_vertices, dtype=np.int64
+        )
+
+        # the first position of each key, i.e. the smallest id for duplicate edges
+        positions = np.searchsorted(self._keys, keys, side="left")
+        positions[positions == len(self._keys)] = 0
+
+        result = np.full(len(keys), fill_value=-1, dtype=np.int64)
+        if len(self._keys) > 0:
+            found = self._keys[positions] == keys
+            result[found] = self.out_edges[positions[found]]
+        return result
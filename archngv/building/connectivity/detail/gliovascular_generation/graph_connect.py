@@ -5,33 +5,227 @@
 import logging
 
 import numpy as np
-from brain_indexer import PointIndexBuilder
+from scipy.spatial import cKDTree
 
+from archngv.app.utils import chunk_ranges
+from archngv.core.datasets import Microdomains
 from archngv.spatial import collision
-from archngv.utils.statistics import truncated_normal
+from archngv.utils.statistics import histogram_summary, truncated_normal
 
 L = logging.getLogger(__name__)
 
+# number of astrocytes processed by each task
+DOMAIN_CHUNK_SIZE = 512
 
-def _points_inside_domain(domain, bbox_potential_targets):
+
+def _points_inside_domain(domain, positions, radii):
     """Find which targets are inside the convex domain"""
-    points = bbox_potential_targets.loc[:, ("x", "y", "z")].to_numpy()
-    radii = bbox_potential_targets.loc[:, "r"].to_numpy()
     return collision.convex_shape_with_spheres(
-        domain.face_points, domain.face_normals, points, radii
+        domain.face_points, domain.face_normals, positions, radii
     )
 
 
+def _bounding_box_candidates(positions, bounding_boxes):
+    """Returns the ids of the positions inside each bounding box.
+
+    Args:
+        positions: array[float, (N, 3)]
+        bounding_boxes: array[float, (K, 6)] [xmin, ymin, zmin, xmax, ymax, zmax]
+
+    Returns:
+        candidate_ids: array[int64, (M,)]
+        offsets: array[int64, (K + 1,)]
+            The sorted ids of the positions inside the i-th bounding box are
+            candidate_ids[offsets[i]: offsets[i + 1]].
+    """
+    from archngv.utils.segmented import offsets_from_counts
+
+    if len(positions) == 0 or len(bounding_boxes) == 0:
+        return np.empty(0, dtype=np.int64), np.zeros(len(bounding_boxes) + 1, dtype=np.int64)
+
+    mins, maxs = bounding_boxes[:, :3], bounding_boxes[:, 3:]
+
+    # the ball circumscribing each box contains all the positions in the box
+    candidates = cKDTree(positions).query_ball_point(
+        0.5 * (mins + maxs), r=0.5 * np.linalg.norm(maxs - mins, axis=1), return_sorted=True
+    )
+
+    counts = np.fromiter(map(len, candidates), dtype=np.int64, count=len(candidates))
+    candidate_ids = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in candidates])
+    box_ids = np.repeat(np.arange(len(bounding_boxes)), counts)
+
+    candidate_positions = positions[candidate_ids]
+    mask = np.all(
+        (mins[box_ids] <= candidate_positions) & (candidate_positions <= maxs[box_ids]), axis=1
+    )
+
+    return candidate_ids[mask], offsets_from_counts(
+        np.bincount(box_ids[mask], minlength=len(bounding_boxes))
+    )
+
+
+def astrocyte_random_generator(seed, astrocyte_id):
+    """Returns the random generator of the astrocyte's stream.
+
+    The stream is spawned from the global seed and the astrocyte id, therefore it does not
+    depend on which process, or in which order, the astrocyte is processed.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(astrocyte_id),)))
+
+
+def _connect_domains(
+    cell_ids,
+    domains,
+    candidate_ids,
+    candidate_offsets,
+    potential_targets,
+    reachout_strategy_function,
+    endfeet_distribution,
+    seed,
+):
+    """Connects a chunk of domains to their potential targets.
+
+    Args:
+        cell_ids: array[int, (N,)]
+        domains: Microdomains
+            The domains are loaded one at a time, only if there are targets in their bounding
+            box.
+        candidate_ids: array[int64, (M,)]
+        candidate_offsets: array[int64, (N + 1,)]
+            The potential targets in the bounding box of the i-th domain are
+            candidate_ids[candidate_offsets[i]: candidate_offsets[i + 1]].
+        potential_targets: PotentialTargets
+        reachout_strategy_function: function
+        endfeet_distribution: scipy.stats frozen distribution
+        seed: int
+
+    Returns:
+        domain_indices: array[int64, (K,)]
+            The index of the domain in the chunk for each edge.
+        target_ids: array[int64, (K,)]
+        targets_per_domain: array[int64, (N,)]
+            The number of potential targets inside each domain.
+        endfeet_per_domain: array[int32, (N,)]
+            The number of endfeet drawn for each domain.
+    """
+    rngs = [astrocyte_random_generator(seed, cell_id) for cell_id in cell_ids]
+
+    # the first draw of each stream is the number of endfeet of the astrocyte
+    endfeet_per_domain = (
+        endfeet_distribution.ppf([rng.random() for rng in rngs]).round().astype(np.int32)
+    )
+
+    domain_indices = []
+    target_ids = []
+    targets_per_domain = np.zeros(len(cell_ids), dtype=np.int64)
+
+    for i, (cell_id, rng) in enumerate(zip(cell_ids, rngs)):
+        n_endfeet = endfeet_per_domain[i]
+        idx = candidate_ids[candidate_offsets[i] : candidate_offsets[i + 1]]
+
+        if idx.size == 0:
+            continue
+
+        domain = domains.domain_object(int(cell_id))
+
+        idx = idx[
+            _points_inside_domain(
+                domain, potential_targets.positions[idx], potential_targets.radii[idx]
+            )
+        ]
+        targets_per_domain[i] = idx.size
+
+        if n_endfeet <= 0 or idx.size == 0:
+            continue
+
+        if n_endfeet < len(idx):
+            idx = idx[
+                reachout_strategy_function(
+                    domain.centroid,
+                    potential_targets.positions[idx],
+                    potential_targets.section_ids[idx],
+                    n_endfeet,
+                    rng,
+                )
+            ]
+
+        domain_indices.append(np.full(len(idx), fill_value=i, dtype=np.int64))
+        target_ids.append(np.asarray(idx, dtype=np.int64))
+
+    if not domain_indices:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            targets_per_domain,
+            endfeet_per_domain,
+        )
+
+    return (
+        np.concatenate(domain_indices),
+        np.concatenate(target_ids),
+        targets_per_domain,
+        endfeet_per_domain,
+    )
+
+
+def _connect_domains_from_file(cell_ids, domains_path, *args):
+    """Same as _connect_domains, opening the microdomains in the worker process."""
+    with Microdomains(domains_path) as domains:
+        return _connect_domains(cell_ids, domains, *args)
+
+
+def _domain_bounding_boxes(domains, cell_ids, chunk_size):
+    """Returns the bounding boxes [xmin, ymin, zmin, xmax, ymax, zmax] of the domains, reading
+    their points in packed chunks.
+    """
+    bounding_boxes = np.empty((len(cell_ids), 6), dtype=np.float64)
+
+    for beg, end in chunk_ranges(len(cell_ids), chunk_size):
+        points, offsets = domains.get_groups("points", cell_ids[beg:end])
+        bounding_boxes[beg:end, :3] = np.minimum.reduceat(points, offsets[:-1])
+        bounding_boxes[beg:end, 3:] = np.maximum.reduceat(points, offsets[:-1])
+
+    return bounding_boxes
+
+
+def _domains_metrics(n_candidate_targets, edges, targets_per_domain, endfeet_per_domain):
+    """Returns the metrics of domains_to_vasculature."""
+    return {
+        "n_astrocytes": len(targets_per_domain),
+        "n_edges": len(edges),
+        "n_candidate_targets": n_candidate_targets,
+        "targets_per_domain": histogram_summary(targets_per_domain),
+        "endfeet_per_domain": histogram_summary(endfeet_per_domain),
+        # the domains with more targets than endfeet, which deploy the strategy
+        "n_reachout_selections": int(
+            np.count_nonzero((endfeet_per_domain > 0) & (endfeet_per_domain < targets_per_domain))
+        ),
+    }
+
+
 def domains_to_vasculature(
-    cell_ids, reachout_strategy_function, potential_targets, domains, properties
+    cell_ids,
+    reachout_strategy_function,
+    potential_targets,
+    domains,
+    properties,
+    seed=0,
+    n_workers=1,
+    chunk_size=DOMAIN_CHUNK_SIZE,
 ):
     """
     Args:
         cell_ids: array[int, (N,)]
         reachout_strategy_function: function
-        potential_targets: pandas.DataFrame
-        domains: list[Microdomain]
+        potential_targets: PotentialTargets
+        domains: Microdomains
         properties: dict
+        seed: int
+            The seed from which the random stream of each astrocyte is spawned.
+        n_workers: int
+            Number of processes (joblib convention, -1 for all the cores).
+        chunk_size: int
+            Number of astrocytes processed by each task.
 
     1. Generate structural connectivity from the geometrical aspects
     of hulls and target spheres.
@@ -45,48 +239,68 @@ def domains_to_vasculature(
         Astrocyte - Target edges: array (K, 2)
             Edges for each astrocyte connecting to multiple targets.
                 e.g. [[astro_0, target_2], [atro_0, target_3], [astro_1, target_10] ...]
-    """
-    L.info("Endfeet Distribution Parameters %s", properties["endfeet_distribution"])
 
-    domain_target_edges = []
-    index = PointIndexBuilder.from_numpy(
-        positions=potential_targets.loc[:, ("x", "y", "z")].to_numpy(),
-        ids=np.arange(len(potential_targets), dtype=int),
-    )
+        Metrics: dict
+            The number of edges, the targets and endfeet per domain histograms and the
+            number of reachout selections.
 
-    n_distr = truncated_normal(*properties["endfeet_distribution"])
-    endfeet_per_domain = n_distr.rvs(size=len(cell_ids)).round().astype(np.int32)
-
-    for domain_index, cell_id in enumerate(cell_ids):
-        n_endfeet = endfeet_per_domain[domain_index]
-
-        if n_endfeet == 0:
-            continue
+    Notes:
+        The random choices of each astrocyte come from its own stream, therefore the result
+        is the same for any number of workers and chunk size.
+    """
+    L.info("Endfeet Distribution Parameters %s", properties["endfeet_distribution"])
 
-        domain = domains[int(cell_id)]
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
 
-        points = np.array(domain.bounding_box)
-        idx = index.box_query(points[:3], points[3:], fields="id")
+    # the potential targets in the bounding box of each domain, found all at once
+    candidate_ids, candidate_offsets = _bounding_box_candidates(
+        potential_targets.positions, _domain_bounding_boxes(domains, cell_ids, chunk_size)
+    )
 
-        if idx.size == 0:
-            continue
+    endfeet_distribution = truncated_normal(*properties["endfeet_distribution"])
 
-        bbox_potential_targets = potential_targets.iloc[idx]
+    chunks = chunk_ranges(len(cell_ids), chunk_size)
 
-        are_inside_domain_mask = _points_inside_domain(domain, bbox_potential_targets)
+    def tasks(chunk_domains):
+        """The chunks with either the domains or, for the worker processes, their path."""
+        for beg, end in chunks:
+            yield (
+                cell_ids[beg:end],
+                chunk_domains,
+                candidate_ids[candidate_offsets[beg] : candidate_offsets[end]],
+                candidate_offsets[beg : end + 1] - candidate_offsets[beg],
+                potential_targets,
+                reachout_strategy_function,
+                endfeet_distribution,
+                seed,
+            )
 
-        if not are_inside_domain_mask.any():
-            continue
+    if n_workers == 1:
+        results = [_connect_domains(*task) for task in tasks(domains)]
+    else:
+        import joblib
 
-        domain_potential_targets = bbox_potential_targets[are_inside_domain_mask]
+        # large arrays, i.e. the potential targets, are memory mapped and shared read-only and
+        # each worker loads the domains of its chunks from the file
+        results = joblib.Parallel(n_jobs=n_workers)(
+            joblib.delayed(_connect_domains_from_file)(*task) for task in tasks(domains.filepath)
+        )
 
-        if n_endfeet >= len(domain_potential_targets):
-            selected = domain_potential_targets.index
-        else:
-            selected = reachout_strategy_function(
-                domain.centroid, domain_potential_targets, n_endfeet
-            )
+    if not results:
+        empty = np.empty(0, dtype=np.int64)
+        edges = np.empty((0, 2), dtype=np.int64)
+        return edges, _domains_metrics(len(candidate_ids), edges, empty, empty)
 
-        domain_target_edges.extend((domain_index, target_index) for target_index in selected)
+    astrocyte_target_edges = np.column_stack(
+        (
+            np.concatenate([result[0] + beg for (beg, _), result in zip(chunks, results)]),
+            np.concatenate([result[1] for result in results]),
+        )
+    )
 
-    return np.asarray(domain_target_edges)
+    return astrocyte_target_edges, _domains_metrics(
+        len(candidate_ids),
+        astrocyte_target_edges,
+        np.concatenate([result[2] for result in results]),
+        np.concatenate([result[3] for result in results]),
+    )
@@ -9,40 +9,53 @@ import numpy as np
 
 from archngv.exceptions import NGVError
 from archngv.utils.linear_algebra import rowwise_dot
+from archngv.utils.segmented import expand_ranges, offsets_from_counts
 
 L = logging.getLogger(__name__)
 
 
-def _argsort_components(source, components):
+def _sorted_section_components(source, positions, section_ids):
     """
-    Sorts the N components with respect to the distance of the closest point
-    in each component to the source.
+    Groups the points into components by section and sorts the components with respect
+    to the distance of their closest point to the source.
 
     Args:
         source: array[float, (3,)]
-        components list[pandas.DataFrame]:
-            A list of dataframes containing the positions of the connected component
-            elements.
+        positions: array[float, (M, 3)]
+            The positions of the elements of all the components.
+        section_ids: array[int, (M,)]
+            The section of each element.
 
     Returns:
-        sorted_indices ndarray: int[(N,)]
-            The sorted indices that correspond to the components array
-        closest_vertices ndarray: int[(N,)]
-            The closest global vertex of each component.
+        components: array[int64, (M,)]
+            The indices in positions of the elements, grouped by component. Within each
+            component the indices are in ascending order.
+        offsets: array[int64, (N + 1,)]
+            The elements of the i-th sorted component are components[offsets[i]: offsets[i + 1]]
+        closest_vertices: array[int64, (N,)]
+            The closest vertex of each sorted component, as an index in positions.
+
+    Notes:
+        A lexsort on (section, distance) brings the closest vertex first in each section,
+        ties going to the smallest index.
     """
-    closest_vertices = np.empty(len(components), dtype=np.int64)
-    closest_distances = np.empty(len(components), dtype=np.float32)
+    distances = np.linalg.norm(source - positions, axis=1)
 
-    for i, comp in enumerate(components):
-        points = comp.loc[:, ("x", "y", "z")]
+    by_distance = np.lexsort((distances, section_ids))
+    _, starts, sizes = np.unique(section_ids[by_distance], return_index=True, return_counts=True)
+    closest_vertices = by_distance[starts]
 
-        distances = np.linalg.norm(source - points, axis=1)
-        closest_pos = np.argmin(distances)
+    # same groups, but with ascending indices within each section
+    by_index = np.argsort(section_ids, kind="stable")
 
-        closest_vertices[i] = comp.index[closest_pos]
-        closest_distances[i] = distances[closest_pos]
+    sorted_indices = np.argsort(distances[closest_vertices].astype(np.float32), kind="stable")
+    sizes = sizes[sorted_indices]
 
-    return np.argsort(closest_distances, kind="stable"), closest_vertices
+    return (
+        by_index[expand_ranges(starts[sorted_indices], sizes)],
+        offsets_from_counts(sizes),
+        closest_vertices[sorted_indices],
+    )
 
 
 def _distribute_elements_in_buckets(n_elements, bucket_capacities):
@@ -111,68 +124,68 @@ def _distribute_elements_in_buckets(n_elements, bucket_capacities):
     return elements_per_bucket
 
 
-def _select_component_targets(source, comp, n_elements):
+def _select_component_targets(source, points, n_elements):
     """
-    Selects n_elements from the component comp points.
+    Selects n_elements from the component points.
 
     Args:
         source ndarray: float[(3,)]
             The coordinates of the source node which represents the position
             of the astrocytic soma.
-        comp pandas.DataFrame:
-            A dataframe that contains the coordinates of the potential targets
-            we want to choose from.
+        points ndarray: float[(M, 3)]
+            The coordinates of the potential targets we want to choose from.
 
         n_elements: int
             Number of elements to choose.
 
     Returns:
-        target_indices: array[int, (n_elements,)]
+        target_indices: array[int64, (n_elements,)]
+            The indices of the selected points, in ascending order.
 
     Notes:
         First point is always the closest. Every next point maximizes
         the minimum distance to the previously selected points in the loop.
+        A running minimum distance of each point to the selected ones is updated
+        with one vectorized pass per selected point. Ties are resolved in favor of
+        the smallest index.
     """
-    points = comp.loc[:, ("x", "y", "z")].to_numpy(copy=False)
-
-    first_pos = np.argmin(np.linalg.norm(source - points, axis=1))
+    selected = np.empty(max(n_elements, 1), dtype=np.int64)
+    selected[0] = np.argmin(np.linalg.norm(source - points, axis=1))
 
-    occupied = {first_pos}
-    available = set(range(len(points)))
-    available.remove(first_pos)
+    vectors = points - points[selected[0]]
+    scores = rowwise_dot(vectors, vectors).astype(np.float64)
 
-    vectors = points - points[first_pos]
-    scores = rowwise_dot(vectors, vectors)
+    for i in range(1, n_elements):
+        # the selected points are excluded from the next candidates
+        scores[selected[i - 1]] = -np.inf
 
-    for _ in range(n_elements - 1):
-        # find the available index that has max respective score
-        best_index = max(available, key=lambda k: scores[k])
+        selected[i] = np.argmax(scores)
 
-        occupied.add(best_index)
-        available.remove(best_index)
+        # update the distance to the closest point
+        # if the new point is not the closest the previous one is kept
+        vectors = points - points[selected[i]]
+        np.minimum(scores, rowwise_dot(vectors, vectors), out=scores)
 
-        for f_index in available:
-            vec = points[f_index] - points[best_index]
-            # update the distance to the closest point
-            # if the new point is not the closest the previous one is kept
-            scores[f_index] = min(np.dot(vec, vec), scores[f_index])
+    return np.sort(selected)
 
-    occupied = np.asarray(list(occupied))
-    return comp.index[occupied]
 
-
-def _maximum_reachout(source, targets, n_classes):
+def _maximum_reachout(source, positions, section_ids, n_classes, _rng=None):
     """
     Args:
         source ndarray: float[(3,)]
             Coordinates representing the astrocyte's soma position.
-        targets pandas.DataFrame:
-            A dataframe with the coordinates of the potential targets.
+        positions ndarray: float[(M, 3)]
+            The coordinates of the potential targets.
+        section_ids ndarray: int[(M,)]
+            The vasculature section of each potential target.
         n_classes int:
             Number of classes to return
+        _rng: numpy.random.Generator
+            Unused, the selection is deterministic.
 
     Returns:
         selected_indices: array[int, (n_classes,)]
+            The indices of the selected targets.
 
     Notes:
     Given an array of available targets select a subset of the of size n_classes,
@@ -195,38 +208,40 @@ def _maximum_reachout(source, targets, n_classes):
        point is selected so as to maximize its distance with all other selected points
        so far in the iteration.
     """
-    components = [df for _, df in targets.groupby("vasculature_section_id")]
-    sorted_indices, closest_vertices = _argsort_components(source, components)
+    components, offsets, closest_vertices = _sorted_section_components(
+        source, positions, section_ids
+    )
 
     # assign the closest components if we have less classes than comps
-    if n_classes <= len(components):
-        return closest_vertices[sorted_indices[:n_classes]]
-
-    # sort components by closest point inside each compoenent to the source
-    sorted_components = [components[sorted_index] for sorted_index in sorted_indices]
-    component_sizes = np.fromiter(map(len, sorted_components), np.int64)
+    if n_classes <= len(closest_vertices):
+        return closest_vertices[:n_classes]
 
     # find how many targets we will have in each component given the number their
     # available points
-    n_elements_per_component = _distribute_elements_in_buckets(n_classes, component_sizes)
+    n_elements_per_component = _distribute_elements_in_buckets(n_classes, np.diff(offsets))
 
     selected = np.empty(n_classes, dtype=np.int64)
 
     n = 0
-    for comp, n_elements in zip(sorted_components, n_elements_per_component):
-        selected[n : n + n_elements] = _select_component_targets(source, comp, n_elements)
+    for beg, end, n_elements in zip(offsets[:-1], offsets[1:], n_elements_per_component):
+        comp = components[beg:end]
+        selected[n : n + n_elements] = comp[
+            _select_component_targets(source, positions[comp], n_elements)
+        ]
         n += n_elements
 
     return selected
 
 
-def _random_selection(_, targets, n_classes):
-    """Returns a random subsample on n_classes elements from
-    the distance array
+def _random_selection(_, positions, __, n_classes, rng=None):
+    """Returns the indices of a random subsample on n_classes elements from
+    the positions array, drawn from the rng generator if given or from the
+    global numpy one otherwise.
     """
-    n_classes = min(n_classes, len(targets))
-    idx = np.random.choice(np.arange(len(targets)), size=n_classes, replace=False)
-    return targets.index[idx]
+    n_classes = min(n_classes, len(positions))
+    if rng is None:
+        return np.random.choice(np.arange(len(positions)), size=n_classes, replace=False)
+    return rng.choice(len(positions), size=n_classes, replace=False)
 
 
 REACHOUT_STRATEGIES = {
@@ -1,9 +1,34 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """graph targeting"""
+from dataclasses import dataclass
+
 import numpy as np
 
 
+@dataclass
+class PotentialTargets:
+    """Potential endfeet targets on the vasculature skeleton, stored as a struct of arrays.
+
+    Attributes:
+        positions: array[float64, (N, 3)] The coordinates of the targets.
+        radii: array[float, (N,)] The vasculature radius at each target.
+        edge_indices: array[int, (N,)] The vasculature edge each target is located on.
+        section_ids: array[int64, (N,)] The vasculature section of each target.
+        segment_ids: array[int64, (N,)] The vasculature segment of each target.
+    """
+
+    positions: np.ndarray
+    radii: np.ndarray
+    edge_indices: np.ndarray
+    section_ids: np.ndarray
+    segment_ids: np.ndarray
+
+    def __len__(self) -> int:
+        """Returns the number of targets."""
+        return len(self.positions)
+
+
 def create_targets(points, edges, parameters):
     """Distributes points across the edges of the graph without taking into
     account the geometrical characteristics of the data structure such as
@@ -20,36 +45,36 @@ def create_targets(points, edges, parameters):
 
 
 def _distribution_on_line_graph(segment_starts, segment_ends, linear_density):
-    """Distributes points with respect to linear density"""
+    """Distributes points with respect to linear density
 
+    The targets are placed every 1 / linear_density along the concatenation of the segments,
+    starting from the beginning of the first one. Each target is assigned to the segment
+    (start, end] that contains it, skipping the zero-length segments.
+    """
     seg_vecs = np.subtract(segment_ends, segment_starts)
     seg_lens = np.linalg.norm(seg_vecs, axis=1)
 
     N_targets = int(round(np.sum(seg_lens) * linear_density))
 
-    targets = np.empty((N_targets, 3), dtype=np.float64)
-    seg_idx = np.empty(N_targets, dtype=np.uintp)
+    # zero length segments cannot contain targets
+    nonzero_ids = np.flatnonzero(seg_lens > 0.0)
 
-    dy = 1.0 / linear_density
-    cum_len = -dy
+    if N_targets == 0 or nonzero_ids.size == 0:
+        return np.empty((0, 3), dtype=np.float64), np.empty(0, dtype=np.uintp)
 
-    s_index = n = 0
-    while n < N_targets:
-        v_len = seg_lens[s_index]
+    # accumulate in double precision to avoid drifting along long graphs
+    cum_ends = np.cumsum(seg_lens[nonzero_ids], dtype=np.float64)
 
-        if v_len <= 0.0:
-            s_index += 1
-            continue
+    positions = np.arange(N_targets, dtype=np.float64) / linear_density
+    positions = positions[positions <= cum_ends[-1]]
 
-        u_vec = seg_vecs[s_index, :] / v_len
+    # first segment the end of which is at or after the position
+    containing = np.searchsorted(cum_ends, positions, side="left")
 
-        while cum_len + dy <= v_len and n < N_targets:
-            cum_len += dy
-            seg_idx[n] = s_index
-            targets[n, :] = segment_starts[s_index, :] + u_vec * cum_len
-            n += 1
+    seg_idx = nonzero_ids[containing]
+    local_positions = positions - (cum_ends[containing] - seg_lens[seg_idx])
 
-        cum_len -= v_len
-        s_index += 1
+    u_vecs = seg_vecs[seg_idx] / seg_lens[seg_idx, np.newaxis]
+    targets = segment_starts[seg_idx] + u_vecs * local_positions[:, np.newaxis]
 
-    return targets[:n], seg_idx[:n]
+    return targets, seg_idx.astype(np.uintp)
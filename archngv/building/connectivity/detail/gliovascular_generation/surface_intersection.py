@@ -8,6 +8,11 @@ import math
 import numpy as np
 from ngv_ctools.fast_marching_method import second_order_solutions
 
+from archngv.building.connectivity.detail.gliovascular_generation.graph_adjacency import (
+    EdgeAdjacency,
+)
+from archngv.utils.linear_algebra import rowwise_dot
+
 EPS = 1e-6
 
 
@@ -175,14 +180,139 @@ def cylinder_intersections(V, S, T, TC, R2):
     return second_order_solutions(c2, c1, c0)
 
 
-def _resolve_segment_direction(start_pos, end_pos, start_rad, end_rad):
-    """Swaps the start and end of a truncated cone so that the small side comes always first."""
-    if start_rad - end_rad > EPS:
-        return end_pos, start_pos, end_rad, start_rad
-    return start_pos, end_pos, start_rad, end_rad
+def second_order_solutions_batch(a, b, c):
+    """Vectorized counterpart of ngv_ctools' second_order_solutions.
+
+    Args:
+        a, b, c: array[float, (N,)]
+            The coefficients of the equations a * t^2 + b * t + c = 0
+
+    Returns:
+        roots: array[float64, (N, 2)]
+            The two roots of each equation. Missing roots are nan. Linear equations and
+            equations with a zero discriminant have only the first root.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    c = np.asarray(c, dtype=np.float64)
+
+    roots = np.full((len(a), 2), fill_value=np.nan, dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        linear = np.abs(a) < EPS
+        has_root = linear & (np.abs(b) >= EPS)
+        roots[has_root, 0] = -c[has_root] / b[has_root]
+
+        discriminant = b * b - 4.0 * a * c
+
+        single = ~linear & (np.abs(discriminant) < EPS)
+        roots[single, 0] = -0.5 * b[single] / a[single]
+
+        # numerically stable form of the two roots
+        double = ~linear & (discriminant >= EPS)
+        q = -0.5 * (
+            b[double] + np.where(b[double] < 0.0, -1.0, 1.0) * np.sqrt(discriminant[double])
+        )
+        roots[double, 0] = q / a[double]
+        roots[double, 1] = c[double] / q
+
+    return roots
+
 
+def _intersect_segments(segments, edge_ids, target_points, target_to_soma_vecs):
+    """Intersects the target-soma lines with the cones/cylinders of their segments.
 
-def surface_intersect(astrocyte_positions, potential_targets, astrocyte_target_edges, vasculature):
+    Args:
+        segments: tuple of the segment start and end points and radii.
+        edge_ids: array[int, (N,)]
+        target_points: array[float32, (N, 3)]
+        target_to_soma_vecs: array[float32, (N, 3)]
+
+    Returns:
+        surface_points: array[float, (N, 3)]
+            The intersection points, nan if there is no valid root.
+        left: array[float, (N,)]
+            The signed distance of the intersection from the start of the segment.
+        right: array[float, (N,)]
+            The signed distance of the intersection from the end of the segment.
+
+    Notes:
+        Cones are oriented from the small to the big radius, therefore left and right refer to
+        the oriented segment.
+    """
+    # pylint: disable=too-many-locals
+    T_EPS = 1e-1  # margin of error in the parametric t e.g 0.1 of length of segment
+
+    segments_start, segments_end, radii_start, radii_end = segments
+
+    beg_points = segments_start[edge_ids]
+    end_points = segments_end[edge_ids]
+    beg_radii = radii_start[edge_ids]
+    end_radii = radii_end[edge_ids]
+
+    lengths = np.linalg.norm(beg_points - end_points, axis=1)
+
+    is_cylinder = np.abs(beg_radii - end_radii) < EPS
+
+    # make sure that the cones are oriented from the small radius to the big one
+    to_swap = ~is_cylinder & (beg_radii - end_radii > EPS)
+    beg_points[to_swap], end_points[to_swap] = end_points[to_swap], beg_points[to_swap]
+    beg_radii[to_swap], end_radii[to_swap] = end_radii[to_swap], beg_radii[to_swap]
+
+    a = np.empty(len(edge_ids), dtype=np.float64)
+    b = np.empty_like(a)
+    c = np.empty_like(a)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        directions = (end_points - beg_points) / lengths[:, None]
+
+        # cylinders, see cylinder_intersections
+        cyl = is_cylinder
+        V, TC = directions[cyl], target_to_soma_vecs[cyl]
+        ST = target_points[cyl] - beg_points[cyl]
+        A = TC - V * rowwise_dot(TC, V)[:, None]
+        B = ST - V * rowwise_dot(ST, V)[:, None]
+        a[cyl] = rowwise_dot(A, A)
+        b[cyl] = 2.0 * rowwise_dot(A, B)
+        c[cyl] = rowwise_dot(B, B) - end_radii[cyl] ** 2
+
+        # truncated cones, see cone_intersections
+        con = ~is_cylinder
+        D, TC = directions[con], target_to_soma_vecs[con]
+        r, R, L = beg_radii[con], end_radii[con], lengths[con]
+        tip_lengths = L * r / (R - r)
+        cos_angle2 = np.cos(np.arctan2(r, tip_lengths)) ** 2
+        VT = target_points[con] - (beg_points[con] - tip_lengths[:, None] * D)
+
+        # with M = D D^T - cos^2 I, x^T M y = <D, x><D, y> - cos^2 <x, y>
+        D_VT, D_TC = rowwise_dot(D, VT), rowwise_dot(D, TC)
+        a[con] = D_TC * D_TC - cos_angle2 * rowwise_dot(TC, TC)
+        b[con] = 2.0 * (D_TC * D_VT - cos_angle2 * rowwise_dot(TC, VT))
+        c[con] = D_VT * D_VT - cos_angle2 * rowwise_dot(VT, VT)
+
+        roots = second_order_solutions_batch(a, b, c)
+
+        # segment extent validity
+        in_extent = (-T_EPS < roots) & (roots < 1.0 + T_EPS)
+        fractions = np.where(
+            in_extent[:, 0], roots[:, 0], np.where(in_extent[:, 1], roots[:, 1], np.nan)
+        )
+
+        surface_points = target_points + target_to_soma_vecs * fractions[:, None]
+        left = rowwise_dot(directions, surface_points - beg_points)
+        right = rowwise_dot(directions, surface_points - end_points)
+
+    return surface_points, left, right
+
+
+def surface_intersect(
+    astrocyte_positions,
+    potential_targets,
+    astrocyte_target_edges,
+    vasculature,
+    adjacency=None,
+    metrics=None,
+):
     """From the line segments starting from target points on the skeleton of the vasculature
     graph and ending to the astrocytic somata the intersection with the surface of the cones or
     cyliners is calculated.
@@ -190,14 +320,18 @@ def surface_intersect(astrocyte_positions, potential_targets, astrocyte_target_e
     Args:
         astrocyte_positions: array[float, (N, 3)]
             Positions of the astrocytic somata.
-        potential_targets: Dataframe of length M
-            The potential targets to connect to. The following columns are required:
-            x, y, z, edge_index
-            where edge_id is the edge index of the vasculature the target is located
+        potential_targets: PotentialTargets of length M
+            The potential targets to connect to. Their positions and the indices of the
+            vasculature edges they are located on are used.
         astrocyte_target_edges: array[int, (K)]
             The edges between astrocyte somata and targets. Note that K < M
         vasculature: Vasculature
             The vasculature geometry/topology
+        adjacency: EdgeAdjacency
+            The adjacency of the vasculature graph. If None, it is created.
+        metrics: dict
+            If given, it is filled with the number of pairs that were established, that
+            walked to neighboring segments and the total number of walking steps.
 
     Returns:
        surface_target_positions: array[float, (N, 3)]
@@ -206,139 +340,89 @@ def surface_intersect(astrocyte_positions, potential_targets, astrocyte_target_e
            The respective astrocyte index for each intersection.
        vasculature_edge_idx: array[int, (N,)]
            The respective vasculature edge index for each intersecion.
-    """
-    #  pylint: disable=too-many-locals,too-many-branches,too-many-statements
-    T_EPS = 1e-1  # margin of error in the parametric t e.g 0.1 of length of segment
 
-    astrocyte_positions = astrocyte_positions.astype(np.float32)
+    Notes:
+        The intersections of all the pairs are solved at once on the segment of their target.
+        If the intersection falls before or after the segment, the pair walks to the previous
+        or next segment respectively and it is solved again, for up to 10 steps. Only the
+        walking pairs are revisited at each step.
+    """
+    # pylint: disable=too-many-locals
+    max_steps = 10
 
     segments_start, segments_end = vasculature.segment_points.astype(np.float32)
-    sg_radii_start, sg_radii_end = 0.5 * vasculature.segment_diameters.astype(np.float32)
-    edges = vasculature.edges.astype(np.int64)
-    graph = vasculature.adjacency_matrix
+    radii_start, radii_end = 0.5 * vasculature.segment_diameters.astype(np.float32)
+    segments = (segments_start, segments_end, radii_start, radii_end)
+
+    if adjacency is None:
+        adjacency = EdgeAdjacency.from_vasculature(vasculature)
+    edges = adjacency.edges
 
-    somata_idx, target_idx = astrocyte_target_edges.T.astype(np.int64)
+    somata_idx, target_idx = np.asarray(astrocyte_target_edges, dtype=np.int64).reshape(-1, 2).T
 
     # get target properties
-    target_edge_indices = potential_targets.loc[target_idx, "edge_index"].to_numpy(dtype=np.int64)
-    target_positions = potential_targets.loc[target_idx, ["x", "y", "z"]].to_numpy(dtype=np.float32)
+    target_positions = potential_targets.positions[target_idx].astype(np.float32)
+    target_to_soma_vecs = astrocyte_positions[somata_idx].astype(np.float32) - target_positions
 
-    n_connections = len(astrocyte_target_edges)
+    n_connections = len(somata_idx)
     surface_target_positions = np.empty((n_connections, 3), dtype=np.float32)
-    surface_astros_idx = np.empty(n_connections, dtype=np.int64)
-    vasculature_edge_idx = np.empty_like(surface_astros_idx)
-
-    n_established = 0
-    for astro_id, edge_id, target_point in zip(somata_idx, target_edge_indices, target_positions):
-        target_to_soma_vec = astrocyte_positions[astro_id] - target_point
-
-        for _ in range(10):
-            # we have to determine if the intersection is with the current
-            # segment or with a neighboring one. Therefore the intersection
-            # is set to not_resolved until the correct segment is found or
-            # the astro-target segment is contained in a truncated cone
-
-            segment_beg_point = segments_start[edge_id]
-            segment_end_point = segments_end[edge_id]
-
-            segment_beg_radius = sg_radii_start[edge_id]
-            segment_end_radius = sg_radii_end[edge_id]
-
-            segment_length = np.linalg.norm(segment_beg_point - segment_end_point)
-
-            if abs(segment_beg_radius - segment_end_radius) < EPS:  # cylinder
-                # unit length direction of the cone
-                cone_direction = (segment_end_point - segment_beg_point) / segment_length
-                roots = cylinder_intersections(
-                    cone_direction,
-                    segment_beg_point,
-                    target_point,
-                    target_to_soma_vec,
-                    segment_end_radius**2,
-                )
-
-            else:  # truncated cone
-                # make sure that the vector is always from the small radius to the big one
-                (
-                    segment_beg_point,
-                    segment_end_point,
-                    segment_beg_radius,
-                    segment_end_radius,
-                ) = _resolve_segment_direction(
-                    segment_beg_point,
-                    segment_end_point,
-                    segment_beg_radius,
-                    segment_end_radius,
-                )
-
-                # unit length direction of the cone
-                cone_direction = (segment_end_point - segment_beg_point) / segment_length
-
-                # opening angle of the truncated cone
-                cone_angle = opening_angle(segment_beg_radius, segment_end_radius, segment_length)
-
-                # coordinates of the tip of the truncated cone
-                cone_tip = (
-                    segment_beg_point
-                    - truncated_length(segment_beg_radius, segment_end_radius, segment_length)
-                    * cone_direction
-                )
-
-                # target - astro segment angle with the line of the segment
-                # min and max angles determined from the size of the caps
-                roots = cone_intersections(
-                    cone_direction,
-                    cone_tip,
-                    target_point,
-                    target_to_soma_vec,
-                    cone_angle,
-                )
-
-            # segment extent validity
-            if -T_EPS < roots[0] < 1.0 + T_EPS:
-                fraction = roots[0]
-            elif -T_EPS < roots[1] < 1.0 + T_EPS:
-                fraction = roots[1]
-            else:
-                # if the roots are not in [0, 1] then they aren't valid to proceed
-                break
-
-            surface_point = target_point + target_to_soma_vec * fraction
-            left = np.dot(cone_direction, surface_point - segment_beg_point)
-            right = np.dot(cone_direction, surface_point - segment_end_point)
-
-            # after determining the point on the surface
-            # validate its inclusion in the finite geometry
-            if left > 0.0 > right:
-                surface_astros_idx[n_established] = astro_id
-                vasculature_edge_idx[n_established] = edge_id
-                surface_target_positions[n_established] = surface_point
-                n_established += 1
-                break
-
-            if left < 0.0 and right < 0.0:  # check previous segment
-                cid = edges[edge_id][0]
-                # the int casting is a fix because np.uin64 is converted
-                # to float if added to a regular int
-                parents = graph.predecessors(cid)
-
-                if parents.size > 0:
-                    edge_id = graph.edge_index(parents[0], cid)
-                else:  # if there is no parent
-                    break
-
-            elif left > 0.0 and right > 0.0:  # check next segment
-                pid = edges[edge_id][1]
-                children = graph.successors(pid)
-                if children.size > 0:
-                    edge_id = graph.edge_index(pid, children[0])
-                else:  # if there are no children
-                    break
-            else:
-                break
+    vasculature_edge_idx = potential_targets.edge_indices[target_idx].astype(np.int64)
+    established = np.zeros(n_connections, dtype=bool)
+
+    # the pairs that still need to be resolved
+    active = np.arange(n_connections, dtype=np.int64)
+    n_walks = np.zeros(n_connections, dtype=np.int64)
+
+    for _ in range(max_steps):
+        if active.size == 0:
+            break
+
+        surface_points, left, right = _intersect_segments(
+            segments,
+            vasculature_edge_idx[active],
+            target_positions[active],
+            target_to_soma_vecs[active],
+        )
+
+        # after determining the point on the surface validate its inclusion in the finite geometry
+        inside = (left > 0.0) & (right < 0.0)
+        surface_target_positions[active[inside]] = surface_points[inside]
+        established[active[inside]] = True
+
+        # nan comparisons are false, therefore the pairs without valid roots are dropped
+        to_previous = (left < 0.0) & (right < 0.0)
+        to_next = (left > 0.0) & (right > 0.0)
+
+        walking = np.flatnonzero(to_previous | to_next)
+        walking_pairs = active[walking]
+        current_edges = edges[vasculature_edge_idx[walking_pairs]]
+
+        # the edge from the first parent of the start vertex or to the first child
+        # of the end vertex, -1 if there is no parent or child respectively
+        next_edges = np.where(
+            to_previous[walking],
+            adjacency.first_incoming_edges(current_edges[:, 0]),
+            adjacency.first_outgoing_edges(current_edges[:, 1]),
+        )
+
+        keep = next_edges >= 0
+        vasculature_edge_idx[walking_pairs[keep]] = next_edges[keep]
+        active = walking_pairs[keep]
+        n_walks[active] += 1
+
+    if metrics is not None:
+        metrics.update(
+            {
+                "n_pairs": n_connections,
+                "n_established": int(np.count_nonzero(established)),
+                "n_fallbacks": int(np.count_nonzero(n_walks)),
+                "n_fallback_steps": int(n_walks.sum()),
+                "n_established_after_fallback": int(np.count_nonzero(established & (n_walks > 0))),
+            }
+        )
 
     return (
-        surface_target_positions[:n_established],
-        surface_astros_idx[:n_established],
-        vasculature_edge_idx[:n_established],
+        surface_target_positions[established],
+        somata_idx[established],
+        vasculature_edge_idx[established],
     )
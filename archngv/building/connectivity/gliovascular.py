@@ -6,23 +6,32 @@
 # pylint: disable = no-name-in-module
 
 import logging
+import time
 
 import numpy as np
-import pandas as pd
 
+from archngv.building.connectivity.detail.gliovascular_generation.graph_adjacency import (
+    EdgeAdjacency,
+)
 from archngv.building.connectivity.detail.gliovascular_generation.graph_connect import (
     domains_to_vasculature,
 )
 from archngv.building.connectivity.detail.gliovascular_generation.graph_reachout import strategy
 from archngv.building.connectivity.detail.gliovascular_generation.graph_targeting import (
+    PotentialTargets,
     create_targets,
 )
 from archngv.building.connectivity.detail.gliovascular_generation.surface_intersection import (
     surface_intersect,
 )
+from archngv.exceptions import NGVError
+from archngv.utils.segmented import offsets_from_counts
 
 L = logging.getLogger(__name__)
 
+# the [beg, end) astrocyte id range of a partial gliovascular edge population
+SHARD_RANGE_ATTRIBUTE = "astrocyte_id_range"
+
 
 def _vasculature_annotation_from_edges(vasculature, edge_indices):
     edge_properties = vasculature.edge_properties
@@ -49,20 +58,25 @@ def _create_point_sampling_on_vasculature_skeleton(vasculature, graph_targeting_
 
     section_ids, segment_ids = _vasculature_annotation_from_edges(vasculature, edge_indices)
 
-    return pd.DataFrame(
-        {
-            "x": positions[:, 0],
-            "y": positions[:, 1],
-            "z": positions[:, 2],
-            "r": radii,
-            "edge_index": edge_indices,
-            "vasculature_section_id": section_ids,
-            "vasculature_segment_id": segment_ids,
-        }
+    return PotentialTargets(
+        positions=positions,
+        radii=radii,
+        edge_indices=edge_indices,
+        section_ids=section_ids,
+        segment_ids=segment_ids,
     )
 
 
-def generate_gliovascular(cell_ids, astrocytic_positions, astrocytic_domains, vasculature, params):
+def generate_gliovascular(
+    cell_ids,
+    astrocytic_positions,
+    astrocytic_domains,
+    vasculature,
+    params,
+    seed=0,
+    n_workers=1,
+    metrics=None,
+):
     """For each astrocyte id find the connections to the vasculature
 
     Args:
@@ -71,6 +85,11 @@ def generate_gliovascular(cell_ids, astrocytic_positions, astrocytic_domains, va
         astrocytic_domains: Microdomains
         vasculature: Vasculature
         params: gliovascular parameters dict
+        seed: seed of the per astrocyte random streams
+        n_workers: number of processes for connecting the astrocytes to the vasculature
+        metrics: if a dict is given, it is filled with the wall time and the cardinalities
+            of each step, under the target_creation, domain_assignment and
+            surface_intersection keys.
 
     Returns:
         endfeet_positions: array[float, (M, 3)]
@@ -79,28 +98,51 @@ def generate_gliovascular(cell_ids, astrocytic_positions, astrocytic_domains, va
         endfeet_to_vasculature_mapping: array[int, (M, 2)]
             section_id, segment_id for each endfoot
     """
+    metrics = {} if metrics is None else metrics
+
     L.info("STEP 1: Generating potential targets...")
+    start = time.perf_counter()
     skeleton_seeds = _create_point_sampling_on_vasculature_skeleton(
         vasculature, params["graph_targeting"]
     )
+    metrics["target_creation"] = {
+        "wall_time": time.perf_counter() - start,
+        "n_potential_targets": len(skeleton_seeds),
+    }
 
     L.info("STEP 2: Connecting astrocytes with vasculature skeleton graph...")
-    astrocyte_skeleton_pairs = domains_to_vasculature(
+    start = time.perf_counter()
+    astrocyte_skeleton_pairs, step_metrics = domains_to_vasculature(
         cell_ids,
         strategy(params["connection"]["reachout_strategy"]),
         skeleton_seeds,
         astrocytic_domains,
         params["connection"],
+        seed=seed,
+        n_workers=n_workers,
     )
+    step_metrics["wall_time"] = time.perf_counter() - start
+    metrics["domain_assignment"] = step_metrics
 
     L.info("STEP 3: Mapping from graph points to vasculature surface...")
+    start = time.perf_counter()
+    metrics["surface_intersection"] = step_metrics = {}
     (
         endfeet_positions,
         endfeet_astrocyte_edges,
         endfeet_vasculature_edge_indices,
     ) = surface_intersect(
-        astrocytic_positions, skeleton_seeds, astrocyte_skeleton_pairs, vasculature
+        astrocytic_positions,
+        skeleton_seeds,
+        astrocyte_skeleton_pairs,
+        vasculature,
+        adjacency=EdgeAdjacency.from_vasculature(vasculature),
+        metrics=step_metrics,
     )
+    step_metrics["wall_time"] = time.perf_counter() - start
+
+    for step, values in metrics.items():
+        L.info("%s: %.2f s", step, values["wall_time"])
 
     # translate the vasculature edge indices to section and segment ids
     section_ids, segment_ids = _vasculature_annotation_from_edges(
@@ -111,18 +153,148 @@ def generate_gliovascular(cell_ids, astrocytic_positions, astrocytic_domains, va
     return (endfeet_positions, endfeet_astrocyte_edges, endfeet_to_vasculature)
 
 
-def generate_gliovascular_edge_properties(astrocytes, astrocytic_domains, vasculature, params):
-    """Generate edge population edge population source/target ids and properties."""
+class SectionSegmentLookup:
+    """Dense lookup from (section_id, segment_id) to vasculature node id.
+
+    The segments of each section are stored contiguously, starting at the section's offset,
+    so that a lookup is a single fancy index.
+
+    Args:
+        section_ids: array[int, (N,)]
+            The section id of each vasculature node.
+        segment_ids: array[int, (N,)]
+            The segment id of each vasculature node.
+    """
+
+    def __init__(self, section_ids, segment_ids):
+        section_ids = np.asarray(section_ids, dtype=np.int64)
+        segment_ids = np.asarray(segment_ids, dtype=np.int64)
+
+        n_sections = int(section_ids.max()) + 1 if len(section_ids) > 0 else 0
+
+        # the number of segments of each section, including any gaps in the segment ids
+        n_segments = np.zeros(n_sections, dtype=np.int64)
+        np.maximum.at(n_segments, section_ids, segment_ids + 1)
+
+        self.offsets = offsets_from_counts(n_segments)
+
+        # reversed assignment, so that the first node is kept for duplicate pairs
+        self.node_ids = np.full(self.offsets[-1], fill_value=-1, dtype=np.int64)
+        self.node_ids[(self.offsets[section_ids] + segment_ids)[::-1]] = np.arange(
+            len(section_ids) - 1, -1, -1, dtype=np.int64
+        )
+
+    @classmethod
+    def from_vasculature(cls, vasculature):
+        """Creates the lookup from the vasculature edge properties."""
+        edge_properties = vasculature.edge_properties
+        return cls(
+            edge_properties["section_id"].to_numpy(), edge_properties["segment_id"].to_numpy()
+        )
+
+    def __call__(self, section_ids, segment_ids):
+        """Returns the vasculature node ids of the (section_id, segment_id) pairs.
+
+        Raises:
+            NGVError: If a pair does not exist in the vasculature.
+        """
+        section_ids = np.asarray(section_ids, dtype=np.int64)
+        segment_ids = np.asarray(segment_ids, dtype=np.int64)
+
+        n_sections = len(self.offsets) - 1
+
+        valid = (section_ids >= 0) & (section_ids < n_sections) & (segment_ids >= 0)
+        valid[valid] &= segment_ids[valid] < np.diff(self.offsets)[section_ids[valid]]
+
+        node_ids = np.full(len(section_ids), fill_value=-1, dtype=np.int64)
+        node_ids[valid] = self.node_ids[self.offsets[section_ids[valid]] + segment_ids[valid]]
+
+        if np.any(node_ids == -1):
+            missing = np.flatnonzero(node_ids == -1)
+            raise NGVError(
+                f"{len(missing)} (section_id, segment_id) pairs are not in the vasculature, "
+                f"e.g. {(section_ids[missing[0]], segment_ids[missing[0]])}"
+            )
+
+        return node_ids
+
+
+def shard_range(n_astrocytes, shard_index, n_shards):
+    """Returns the [beg, end) astrocyte id range of the shard_index-th of n_shards contiguous
+    and balanced shards.
+    """
+    if not 0 <= shard_index < n_shards:
+        raise NGVError(f"Shard index {shard_index} is not in [0, {n_shards}).")
+
+    return (shard_index * n_astrocytes) // n_shards, ((shard_index + 1) * n_astrocytes) // n_shards
+
+
+def astrocyte_id_range_of(n_astrocytes, astrocyte_id_range=None, shard=None):
+    """Returns the [beg, end) astrocyte id range to connect, or None for all the astrocytes.
+
+    Args:
+        n_astrocytes: int
+            The total number of astrocytes.
+        astrocyte_id_range: tuple[int, int]
+            An explicit [beg, end) astrocyte id range.
+        shard: tuple[int, int]
+            The (shard_index, n_shards) of the contiguous astrocyte range, see shard_range.
+
+    Raises:
+        NGVError: If both astrocyte_id_range and shard are given or if the range is not in
+            [0, n_astrocytes).
+    """
+    if astrocyte_id_range and shard:
+        raise NGVError("An astrocyte id range and a shard are mutually exclusive.")
+
+    if shard:
+        astrocyte_id_range = shard_range(n_astrocytes, *shard)
+
+    if not astrocyte_id_range:
+        return None
+
+    beg, end = astrocyte_id_range
+    if not 0 <= beg <= end <= n_astrocytes:
+        raise NGVError(f"Astrocyte id range [{beg}, {end}) is not in [0, {n_astrocytes}).")
+
+    return int(beg), int(end)
+
+
+def generate_gliovascular_edge_properties(
+    astrocytes,
+    astrocytic_domains,
+    vasculature,
+    params,
+    seed=0,
+    n_workers=1,
+    metrics=None,
+    astrocyte_ids=None,
+):
+    """Generate edge population edge population source/target ids and properties.
+
+    If a metrics dict is given, it is filled with the metrics of generate_gliovascular.
+
+    If astrocyte_ids are given, only these astrocytes are connected. Because each astrocyte
+    has its own random stream, the edges of each astrocyte do not depend on the rest.
+    """
+    if astrocyte_ids is None:
+        astrocyte_ids = np.arange(len(astrocytes), dtype=np.int64)
+    else:
+        astrocyte_ids = np.asarray(astrocyte_ids, dtype=np.int64)
+
     (
         endfoot_surface_positions,
         endfeet_to_astrocyte_mapping,
         endfeet_to_vasculature_mapping,
     ) = generate_gliovascular(
-        cell_ids=np.arange(len(astrocytes), dtype=np.int64),
-        astrocytic_positions=astrocytes.positions,
+        cell_ids=astrocyte_ids,
+        astrocytic_positions=astrocytes.positions[astrocyte_ids],
         astrocytic_domains=astrocytic_domains,
         vasculature=vasculature,
         params=params,
+        seed=seed,
+        n_workers=n_workers,
+        metrics=metrics,
     )
 
     assert (
@@ -131,13 +303,13 @@ def generate_gliovascular_edge_properties(astrocytes, astrocytic_domains, vascul
         == len(endfoot_surface_positions)
     )
 
-    # get the section/segment ids and use them to get the vasculature node ids
-    vasculature_properties = vasculature.edge_properties.loc[:, ["section_id", "segment_id"]]
-    vasculature_properties["index"] = vasculature_properties.index
-    vasculature_properties = vasculature_properties.set_index(["section_id", "segment_id"])
+    # from the index in astrocyte_ids to the astrocyte id
+    endfeet_to_astrocyte_mapping = astrocyte_ids[endfeet_to_astrocyte_mapping]
 
-    indices = pd.MultiIndex.from_arrays(endfeet_to_vasculature_mapping.T)
-    vasculature_ids = vasculature_properties.loc[indices, "index"].to_numpy()
+    # get the section/segment ids and use them to get the vasculature node ids
+    vasculature_ids = SectionSegmentLookup.from_vasculature(vasculature)(
+        endfeet_to_vasculature_mapping[:, 0], endfeet_to_vasculature_mapping[:, 1]
+    )
 
     properties = {
         "endfoot_id": np.arange(len(endfeet_to_astrocyte_mapping), dtype=np.uint64),
@@ -149,3 +321,121 @@ def generate_gliovascular_edge_properties(astrocytes, astrocytic_domains, vascul
     }
 
     return endfeet_to_astrocyte_mapping, vasculature_ids, properties
+
+
+def merge_gliovascular_shards(filepaths, population_name, n_astrocytes):
+    """Merges the partial edge populations of the gliovascular shards.
+
+    Args:
+        filepaths: list[Path]
+            The shard edge files, in any order.
+        population_name: str
+            The name of the edge population in the shard files.
+        n_astrocytes: int
+            The total number of astrocytes, which the shards should cover.
+
+    Returns:
+        The same as generate_gliovascular_edge_properties for all the astrocytes, with the
+        endfoot ids renumbered.
+
+    Raises:
+        NGVError: If the shard astrocyte ranges overlap or do not cover all the astrocytes.
+    """
+    import h5py
+
+    if len(filepaths) == 0:
+        raise NGVError("No gliovascular shards were given.")
+
+    shards = []
+    for filepath in filepaths:
+        with h5py.File(filepath, "r") as h5f:
+            group = h5f[f"edges/{population_name}"]
+            beg, end = group.attrs[SHARD_RANGE_ATTRIBUTE]
+            shards.append(
+                (
+                    int(beg),
+                    int(end),
+                    group["target_node_id"][:].astype(np.int64),
+                    group["source_node_id"][:].astype(np.int64),
+                    {name: dataset[:] for name, dataset in group["0"].items()},
+                )
+            )
+
+    shards.sort(key=lambda shard: shard[:2])
+
+    expected_beg = 0
+    for beg, end, *_ in shards:
+        if beg != expected_beg:
+            raise NGVError(
+                f"Gliovascular shards are not contiguous: [{beg}, {end}) follows {expected_beg}."
+            )
+        expected_beg = end
+
+    if expected_beg != n_astrocytes:
+        raise NGVError(
+            f"Gliovascular shards cover {expected_beg} out of {n_astrocytes} astrocytes."
+        )
+
+    astrocyte_ids = np.concatenate([shard[2] for shard in shards])
+    vasculature_ids = np.concatenate([shard[3] for shard in shards])
+    properties = {
+        name: np.concatenate([shard[4][name] for shard in shards]) for name in shards[0][4]
+    }
+
+    # the shards are ordered and each one is sorted by astrocyte id
+    assert np.all(np.diff(astrocyte_ids) >= 0)
+
+    properties["endfoot_id"] = np.arange(len(astrocyte_ids), dtype=np.uint64)
+
+    return astrocyte_ids, vasculature_ids, properties
+
+
+def write_gliovascular_edge_population(
+    output_path,
+    population_name,
+    vasculature_nodes,
+    astrocytes,
+    edges,
+    storage=None,
+    astrocyte_id_range=None,
+):
+    """Writes the gliovascular edge population, tagging it with its shard range if any.
+
+    Args:
+        output_path: str
+            The edges HDF5 file to write.
+        population_name: str
+            The name of the edge population.
+        vasculature_nodes: voxcell.CellCollection
+            The vasculature nodes, the source population.
+        astrocytes: voxcell.CellCollection
+            The astrocytes, the target population.
+        edges: tuple
+            The astrocyte ids, vasculature ids and properties, as returned by
+            generate_gliovascular_edge_properties or merge_gliovascular_shards.
+        storage: dict
+            The hdf5 storage options of write_edge_population.
+        astrocyte_id_range: tuple[int, int]
+            The [beg, end) astrocyte id range of a partial edge population, which
+            merge_gliovascular_shards reads back.
+    """
+    import h5py
+
+    from archngv.building.exporters import write_edge_population
+
+    astrocyte_ids, vasculature_ids, properties = edges
+
+    write_edge_population(
+        output_path=output_path,
+        population_name=population_name,
+        source_population=vasculature_nodes,
+        target_population=astrocytes,
+        source_node_ids=vasculature_ids,
+        target_node_ids=astrocyte_ids,
+        properties=properties,
+        storage=storage,
+    )
+
+    if astrocyte_id_range:
+        with h5py.File(output_path, "r+") as h5f:
+            h5f[f"edges/{population_name}"].attrs[SHARD_RANGE_ATTRIBUTE] = astrocyte_id_range
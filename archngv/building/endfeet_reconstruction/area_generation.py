@@ -2,25 +2,36 @@
 
 """ Endfeet areas generation processing """
 import logging
+import tempfile
+from collections import namedtuple
+from pathlib import Path
 
 import numpy as np
 
 from archngv.building.endfeet_reconstruction.area_mapping import transform_to_target_distribution
-from archngv.building.endfeet_reconstruction.area_shrinking import shrink_surface_mesh
 
 # pylint: disable=no-name-in-module
 from archngv.building.endfeet_reconstruction.fast_marching_method import (
     fast_marching_eikonal_solver,
 )
 from archngv.building.endfeet_reconstruction.groups import group_elements, vertex_to_triangle_groups
-from archngv.core.datasets import EndfootMesh
-from archngv.utils.ngons import vectorized_triangle_area
+from archngv.core.datasets import PackedEndfootMeshes
+from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
+from archngv.utils.ngons import segmented_global_to_local_triangles
+from archngv.utils.segmented import offsets_from_counts, segment_ids
 from archngv.utils.statistics import truncated_normal
 
 L = logging.getLogger(__name__)
 
+ENDFEET_CHUNK_SIZE = 65536
 
-def _grow_endfeet_meshes(vasculature_mesh, endfeet_points, threshold_radius):
+# the per endfoot areas from the growth, target areas and thicknesses
+EndfeetProperties = namedtuple("EndfeetProperties", ["areas", "target_areas", "thicknesses"])
+
+
+def _grow_endfeet_meshes(
+    vasculature_mesh, endfeet_points, threshold_radius, block_size=None, n_workers=1
+):
     """
     Args:
         mesh: TriMesh
@@ -30,19 +41,21 @@ def _grow_endfeet_meshes(vasculature_mesh, endfeet_points, threshold_radius):
             of the vasculature.
         max_area: float
             Maximum permitted area for the growht of the endfeet.
+        block_size: float
+            If not None, the size of the spatial blocks the growth is partitioned in.
+        n_workers: int
+            Number of processes for the partitioned growth.
     """
     group_indices, travel_times, _ = fast_marching_eikonal_solver(
-        vasculature_mesh, endfeet_points, threshold_radius
+        vasculature_mesh,
+        endfeet_points,
+        threshold_radius,
+        block_size=block_size,
+        n_workers=n_workers,
     )
     return travel_times, group_indices
 
 
-def _triangle_areas(points, triangles):
-    """Returns the areas of an array of triangles"""
-    p0s, p1s, p2s = points[triangles.T]
-    return vectorized_triangle_area(p0s - p1s, p0s - p2s)
-
-
 def _endfeet_areas(grouped_triangles, triangle_areas, n_endfeet):
     """
     Args:
@@ -61,32 +74,181 @@ def _endfeet_areas(grouped_triangles, triangle_areas, n_endfeet):
         be also present which coressponds to triangles that are not occupied by any
         endfoot.
     """
-    endfeet_areas = np.zeros(n_endfeet, dtype=np.float32)
+    triangle_groups = grouped_triangles.groups[segment_ids(grouped_triangles.offsets)]
+    mask = triangle_groups >= 0
+
+    return np.bincount(
+        triangle_groups[mask],
+        weights=triangle_areas[grouped_triangles.ids[mask]],
+        minlength=n_endfeet,
+    ).astype(np.float32)
+
+
+def _shrink_endfeet_triangles(
+    triangle_ids, offsets, triangle_areas, triangle_travel_times, endfeet_areas, target_areas
+):
+    """Shrinks the groups of triangles that are larger than their target area, by removing
+    their triangles with the largest travel times, as in shrink_surface_mesh.
+
+    Args:
+        triangle_ids: np.ndarray (T,)
+            The triangle ids of all the groups, grouped contiguously
+
+        offsets: np.ndarray (G + 1,)
+            The offsets of each group's triangle ids in triangle_ids
+
+        triangle_areas: np.ndarray (M,)
+            All triangle areas
+
+        triangle_travel_times: np.ndarray (M,)
+            Interpolated travel times from the vertices to their triangles
+
+        endfeet_areas: np.ndarray (G,)
+            The current area of each group
+
+        target_areas: np.ndarray (G,)
+            The target area of each group
+
+    Returns:
+        triangle_ids: np.ndarray (K,)
+            The remaining triangle ids of all the groups. The triangles of the shrunk groups
+            are in descending travel time order, the rest keep their order.
 
-    for group, ids in grouped_triangles.iter_assigned_groups():
-        endfeet_areas[group] = triangle_areas[ids].sum()
+        offsets: np.ndarray (G + 1,)
+            The offsets of each group's remaining triangle ids
+    """
+    group_ids = segment_ids(offsets)
+    positions = np.arange(len(triangle_ids), dtype=np.int64)
 
-    return endfeet_areas
+    areas_to_remove = np.asarray(endfeet_areas, dtype=np.float64) - target_areas
+    is_shrunk = (areas_to_remove > 0.0)[group_ids]
 
+    # descending travel times in each group, with ties in reverse order like the reversed
+    # stable argsort of shrink_surface_mesh
+    order = np.lexsort((-positions, -triangle_travel_times[triangle_ids], group_ids))
+    sorted_areas = triangle_areas[triangle_ids[order]]
 
-def _global_to_local_indices(triangles):
-    local_vertices, inverse = np.unique(triangles, return_inverse=True)
+    # the area removed before reaching each triangle of its group
+    cumulative_areas = np.zeros(len(order) + 1, dtype=np.float64)
+    np.cumsum(sorted_areas, out=cumulative_areas[1:])
+    removed_areas = cumulative_areas[:-1] - cumulative_areas[offsets[:-1]][group_ids]
 
-    # remap triangle indices to the local index space
-    raveled_triangles = np.arange(len(local_vertices))[inverse]
+    keep = ~is_shrunk | (removed_areas >= areas_to_remove[group_ids])
+    selected = np.where(is_shrunk, order, positions)[keep]
 
-    return local_vertices, raveled_triangles.reshape((-1, 3))
+    return triangle_ids[selected], offsets_from_counts(
+        np.bincount(group_ids[keep], minlength=len(offsets) - 1)
+    )
 
 
-def _shrink_endfoot_triangles(
-    triangles, triangle_areas, triangle_travel_times, endfoot_area, target_area
+def _process_endfeet_chunk(
+    points,
+    triangles,
+    triangle_ids,
+    offsets,
+    groups,
+    triangle_areas,
+    triangle_travel_times,
+    endfeet,
 ):
+    """Shrinks the endfeet of a contiguous chunk of groups and converts them to local meshes,
+    with segmented operations over all the groups at once.
+
+    Args:
+        points: np.ndarray (N, 3)
+            All point of the vasculature mesh
+
+        triangles: np.ndarray (M, 3)
+            All triangles of the vasculature mesh
+
+        triangle_ids: np.ndarray (T,)
+            The triangle ids of the groups in the chunk, grouped contiguously
+
+        offsets: np.ndarray (G + 1,)
+            The offsets of each group's triangle ids in triangle_ids
+
+        groups: np.ndarray (G,)
+            The endfoot index of each group
+
+        triangle_areas: np.ndarray (M,)
+            All triangle areas
+
+        triangle_travel_times: np.ndarray (M, )
+            Interpolated travel times from the vertices to their triangles
+
+        endfeet: EndfeetProperties
+            The total areas, target areas and thicknesses of the groups' endfeet
+
+    Returns:
+        PackedEndfootMeshes of the groups, with their vasculature triangle ids.
     """
-    Shrinks the endfoot surface and convertes its triangles to the local index space
+    triangle_ids, offsets = _shrink_endfeet_triangles(
+        triangle_ids,
+        offsets,
+        triangle_areas,
+        triangle_travel_times,
+        endfeet.areas,
+        endfeet.target_areas,
+    )
+
+    # the unique vertices of each group and the triangles referring to that subset
+    vertices, points_offsets, local_triangles = segmented_global_to_local_triangles(
+        triangles[triangle_ids], offsets
+    )
+
+    final_areas = np.bincount(
+        segment_ids(offsets), weights=triangle_areas[triangle_ids], minlength=len(groups)
+    )
+
+    return PackedEndfootMeshes(
+        indices=groups,
+        points=points[vertices],
+        points_offsets=points_offsets,
+        triangles=local_triangles,
+        triangles_offsets=offsets,
+        area=final_areas,
+        unreduced_area=endfeet.areas,
+        thickness=endfeet.thicknesses,
+        vasculature_triangle_ids=triangle_ids,
+    )
+
+
+def _chunk_tasks(grouped_triangles, endfeet, chunk_size):
+    """Splits the assigned groups into contiguous chunks and yields the per chunk arguments
+    of _process_endfeet_chunk, apart from the mesh arrays.
     """
-    # indices of remaining t_ids and the remaining area
-    idx = shrink_surface_mesh(triangle_areas, triangle_travel_times, endfoot_area, target_area)
-    return triangles[idx]
+    groups = grouped_triangles.groups
+    offsets = grouped_triangles.offsets
+
+    # the unassigned -1 group sorts first, if present
+    first = int(np.searchsorted(groups, 0))
+
+    for beg in range(first, len(groups), chunk_size):
+        end = min(beg + chunk_size, len(groups))
+        chunk_groups = groups[beg:end]
+        yield (
+            grouped_triangles.ids[offsets[beg] : offsets[end]],
+            offsets[beg : end + 1] - offsets[beg],
+            chunk_groups,
+            EndfeetProperties(*(values[chunk_groups] for values in endfeet)),
+        )
+
+
+def _shared_arrays(directory, arrays):
+    """Dumps the arrays in the directory and returns read-only memory maps to them, so that
+    the worker processes share the same pages instead of receiving copies.
+    """
+    shared = []
+    for i, array in enumerate(arrays):
+        # e.g. a memory mapped vasculature mesh cache
+        if isinstance(array, np.memmap):
+            shared.append(array)
+            continue
+
+        filepath = Path(directory, f"{i}.npy")
+        np.save(filepath, array)
+        shared.append(np.load(filepath, mmap_mode="r"))
+    return shared
 
 
 def _process_endfeet(
@@ -95,9 +257,9 @@ def _process_endfeet(
     grouped_triangles,
     triangle_areas,
     triangle_travel_times,
-    endfeet_areas,
-    target_areas,
-    endfeet_thicknesses,
+    endfeet,
+    n_workers=1,
+    chunk_size=ENDFEET_CHUNK_SIZE,
 ):
     """
     Iterates over the grown endfeet surfaces and shrinks them so that
@@ -119,14 +281,15 @@ def _process_endfeet(
         triangle_travel_times: np.ndarray (M, )
             Interpolated travel times from the vertices to their triangles
 
-        endfeet_areas: np.ndarray (K,)
-            The total areas of the endfeet
+        endfeet: EndfeetProperties
+            The total areas (K,), the target areas (K,) that we desire and the
+            thicknesses (K,) of the endfeet
 
-        target_areas: np.ndarray (K, )
-            The target areas of the endfeet that we desire
+        n_workers: int
+            Number of processes (joblib convention, -1 for all the cores).
 
-        endfeet_thicknesses: np.ndarray (K,)
-            The thickness of the endfoot surface mesh
+        chunk_size: int
+            Number of contiguous groups processed per task.
 
     Yields:
         EndfootMesh data object.
@@ -137,74 +300,131 @@ def _process_endfeet(
         that are not occupid by endfeet.
 
         Only the groups that have grown are yielded. Therefore, gaps are possible
-        but the results are yielded in a sorted incremental manner.
+        but the results are yielded in a sorted incremental manner, independently of
+        the number of workers.
     """
-    for group, triangle_ids in grouped_triangles.iter_assigned_groups():
-        current_area, target_area = endfeet_areas[group], target_areas[group]
-
-        # triangles for endfoot but the indices are from the entire mesh
-        triangles_global = triangles[triangle_ids]
-
-        if current_area > target_area:
-            triangles_global = _shrink_endfoot_triangles(
-                triangles_global,
-                triangle_areas[triangle_ids],
-                triangle_travel_times[triangle_ids],
-                current_area,
-                target_area,
+    tasks = _chunk_tasks(grouped_triangles, endfeet, chunk_size)
+
+    if n_workers == 1:
+        for ids, offsets, groups, chunk_endfeet in tasks:
+            yield from _process_endfeet_chunk(
+                points,
+                triangles,
+                ids,
+                offsets,
+                groups,
+                triangle_areas,
+                triangle_travel_times,
+                chunk_endfeet,
             )
+        return
 
-        # the unique vertices belonging to group and the triangles referring to that subset
-        vertices_global, triangles_local = _global_to_local_indices(triangles_global)
+    import joblib
 
-        points_local = points[vertices_global]
-        final_area = _triangle_areas(points_local, triangles_local).sum()
+    with tempfile.TemporaryDirectory() as directory:
+        points, triangles, triangle_areas, triangle_travel_times = _shared_arrays(
+            directory, (points, triangles, triangle_areas, triangle_travel_times)
+        )
 
-        yield EndfootMesh(
-            index=group,
-            points=points_local,
-            triangles=triangles_local,
-            area=final_area,
-            unreduced_area=current_area,
-            thickness=endfeet_thicknesses[group],
+        # the chunks are returned in submission order as soon as they are ready
+        results = joblib.Parallel(n_jobs=n_workers, return_as="generator")(
+            joblib.delayed(_process_endfeet_chunk)(
+                points,
+                triangles,
+                ids,
+                offsets,
+                groups,
+                triangle_areas,
+                triangle_travel_times,
+                chunk_endfeet,
+            )
+            for ids, offsets, groups, chunk_endfeet in tasks
         )
 
+        for chunk_meshes in results:
+            yield from chunk_meshes
+
+
+def _triangle_travel_times(travel_times, triangles, dtype=np.float64):
+    """Interpolates the travel times of the vertices at the center of the triangles, column by
+    column to avoid a (M, 3) temporary.
+    """
+    travel_times = np.asarray(travel_times, dtype=dtype)
 
-def endfeet_area_generation(vasculature_mesh, parameters, endfeet_points):
+    result = travel_times[triangles[:, 0]]
+    result += travel_times[triangles[:, 1]]
+    result += travel_times[triangles[:, 2]]
+    result /= 3.0
+    return result
+
+
+def endfeet_area_generation(
+    vasculature_mesh, parameters, endfeet_points, n_workers=1, compact=False
+):
     """Generate endfeet areas on the surface of the vasculature mesh,
     starting fotm the endfeet_points coordinates
 
     Args:
-        vasculature_mesh: Trimesh
+        vasculature_mesh: openmesh Trimesh or VasculatureSurfaceMesh
             The mesh of the vasculature
 
         parameters: dict
             The parameters for the algorithms with the following keys:
+                - fmm_cutoff_radius
                 - area_distribution [mean, sdev, min, max]
                 - thickness_distribution [mean, sdev, min, max]
+                - fmm_block_size (optional): partitions the growth in spatial blocks
+                  of this size, which bounds the memory of each fast marching solve. The
+                  entire mesh is still loaded to build the blocks.
 
         endfeet_points: ndarray (N, 3)
             Endfeet target coordinates
+
+        n_workers: int
+            Number of processes for the partitioned growth and the post-processing of
+            the grown endfeet (joblib convention, -1 for all the cores).
+
+        compact: bool
+            If True, the mesh, the travel times and the triangle ids and groups are processed
+            as int32 and float32 instead of int64 and float64, which reduces the peak memory.
+            The per-vertex structures of the fast marching method are not affected, use
+            fmm_block_size to bound them too. Because of the float32 travel times, triangles
+            with close travel times may be removed in a different order when the endfeet are
+            shrunk.
     """
     n_endfeet = len(endfeet_points)
 
+    if not isinstance(vasculature_mesh, VasculatureSurfaceMesh):
+        vasculature_mesh = VasculatureSurfaceMesh.from_openmesh(vasculature_mesh)
+
+    if compact:
+        vasculature_mesh = vasculature_mesh.compact()
+
+    id_dtype, float_dtype = (np.int32, np.float32) if compact else (np.int64, np.float64)
+
     travel_times, vertex_groups = _grow_endfeet_meshes(
-        vasculature_mesh, endfeet_points, parameters["fmm_cutoff_radius"]
+        vasculature_mesh,
+        endfeet_points,
+        parameters["fmm_cutoff_radius"],
+        block_size=parameters.get("fmm_block_size"),
+        n_workers=n_workers,
     )
 
-    points = vasculature_mesh.points()
-    triangles = vasculature_mesh.face_vertex_indices().astype(np.uintp)
-
-    triangle_areas = _triangle_areas(points, triangles)
+    points = vasculature_mesh.points
+    triangles = vasculature_mesh.triangles
+    triangle_areas = vasculature_mesh.triangle_areas
 
     # interpolate travel times at the center of triangles
-    triangle_travel_times = np.mean(travel_times[triangles], axis=1)
+    triangle_travel_times = _triangle_travel_times(travel_times, triangles, dtype=float_dtype)
+    del travel_times
 
     # for each triangle deduce its group id by examining its vertices
-    triangle_groups = vertex_to_triangle_groups(vertex_groups, triangles)
+    triangle_groups = vertex_to_triangle_groups(vertex_groups, triangles, dtype=id_dtype)
+    del vertex_groups
 
     # make chunks of triangles that belong to the same group
-    grouped_triangles = group_elements(triangle_groups)
+    grouped_triangles = group_elements(triangle_groups, dtype=id_dtype)
+    del triangle_groups
 
     # endfeet areas from the fast marching simulation
     endfeet_areas = _endfeet_areas(grouped_triangles, triangle_areas, n_endfeet)
@@ -227,7 +447,6 @@ def endfeet_area_generation(vasculature_mesh, parameters, endfeet_points):
         grouped_triangles,
         triangle_areas,
         triangle_travel_times,
-        endfeet_areas,
-        target_areas,
-        endfeet_thicknesses,
+        EndfeetProperties(endfeet_areas, target_areas, endfeet_thicknesses),
+        n_workers=n_workers,
     )
@@ -2,43 +2,108 @@
 
 """fast marching method growing"""
 import logging
-from collections import deque
 
 import numpy as np
 from ngv_ctools.fast_marching_method import grow_waves_on_triangulated_surface
 from scipy.spatial import cKDTree
 
 from archngv.building.endfeet_reconstruction.groups import GroupedElements, group_elements
+from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
 from archngv.exceptions import NGVError
+from archngv.utils.segmented import expand_ranges, offsets_from_counts, segment_ids
 
 L = logging.getLogger(__name__)
 
 
-def _get_neighbors(vertex_neighbors, node):
-    return vertex_neighbors.get_group_ids(node)
+# maximum ring level around a node that overlapping seeds are moved to
+MAX_SEED_RING_LEVEL = 5
 
+_NO_RANK = np.iinfo(np.int64).max
 
-def _expanding_ring_neighborhoods(start_node, vertex_neighbors, max_level):
+
+def _closed_neighborhoods(vertices, neighbors, nn_offsets):
+    """Returns the closed neighborhood, i.e. the neighbors and the vertex itself, of each vertex.
+
+    Returns:
+        owners: array[int64, (K,)]
+            The index into vertices of each neighborhood vertex
+        neighborhood: array[int64, (K,)]
+            The vertices of the neighborhoods
     """
-    Generates expanding neighborhoods until it reaches max_level
-    1-ring : neighbors of node
-    2-ring : neighbors of neighbors of node without the previous neighbors
-    .
-    .
+    counts = nn_offsets[vertices + 1] - nn_offsets[vertices]
+    indices = np.arange(len(vertices), dtype=np.int64)
+
+    owners = np.concatenate((np.repeat(indices, counts), indices))
+    neighborhood = np.concatenate(
+        (neighbors[expand_ranges(nn_offsets[vertices], counts)], vertices)
+    )
+    return owners, neighborhood
+
+
+def _next_rings(ring_groups, ring_vertices, visited, n_vertices, neighbors, nn_offsets):
+    """Expands the rings of all the groups by one level.
+
+    Args:
+        ring_groups: The group of each (group, vertex) pair of the current rings
+        ring_vertices: The vertex of each (group, vertex) pair of the current rings
+        visited: Sorted (group, vertex) keys of the visited pairs
+        n_vertices: The number of mesh vertices
+        neighbors: CSR neighbors of the mesh vertices
+        nn_offsets: CSR offsets of the neighbors
+
+    Returns:
+        The groups, vertices, sorted by (group, vertex), and the updated visited keys.
     """
-    ring = {start_node}
-    visited = {start_node}
-
-    for _ in range(max_level):
-        ring = set(
-            neighbor
-            for vertex in ring
-            for neighbor in _get_neighbors(vertex_neighbors, vertex)
-            if neighbor not in visited
-        )
-        visited |= ring
+    owners, neighborhood = _closed_neighborhoods(ring_vertices, neighbors, nn_offsets)
+
+    keys = np.unique(ring_groups[owners] * n_vertices + neighborhood)
+    keys = keys[~np.isin(keys, visited, assume_unique=True)]
+
+    groups, vertices = np.divmod(keys, n_vertices)
+    return groups, vertices, np.union1d(visited, keys)
+
+
+def _positions_in_sorted_groups(groups):
+    """Returns the position of each element in its group, for sorted groups."""
+    positions = np.arange(len(groups), dtype=np.int64)
+    is_start = np.ones(len(groups), dtype=bool)
+    is_start[1:] = groups[1:] != groups[:-1]
+    return positions - np.maximum.accumulate(np.where(is_start, positions, 0))
+
+
+def _is_free(vertices, occupied, neighbors, nn_offsets):
+    """Returns True for the vertices with no occupied vertex in their closed neighborhood."""
+    owners, neighborhood = _closed_neighborhoods(vertices, neighbors, nn_offsets)
+    return np.bincount(owners[occupied[neighborhood]], minlength=len(vertices)) == 0
+
+
+def _local_minima(vertices, ranks, best_ranks, neighbors, nn_offsets):
+    """Returns True for the candidates that have the smallest rank among the candidates within
+    two rings of their vertex, i.e. among the ones they would block if they were placed.
+
+    Args:
+        vertices: The vertex of each candidate
+        ranks: The unique priority rank of each candidate
+        best_ranks: Array with _NO_RANK for each mesh vertex, reset on return
+        neighbors: CSR neighbors of the mesh vertices
+        nn_offsets: CSR offsets of the neighbors
+    """
+    np.minimum.at(best_ranks, vertices, ranks)
+
+    owners, ring1 = _closed_neighborhoods(vertices, neighbors, nn_offsets)
+    ring1, inverse = np.unique(ring1, return_inverse=True)
+
+    # the best rank in the closed neighborhood of each 1-ring vertex
+    owners2, ring2 = _closed_neighborhoods(ring1, neighbors, nn_offsets)
+    ring1_best = np.full(len(ring1), fill_value=_NO_RANK, dtype=np.int64)
+    np.minimum.at(ring1_best, owners2, best_ranks[ring2])
+
+    best = np.full(len(vertices), fill_value=_NO_RANK, dtype=np.int64)
+    np.minimum.at(best, owners, ring1_best[inverse])
 
-        yield ring
+    best_ranks[vertices] = _NO_RANK
+
+    return best == ranks
 
 
 def _find_non_overlapping_mesh_nodes(
@@ -65,53 +130,95 @@ def _find_non_overlapping_mesh_nodes(
     Returns:
         closest_mesh_nodes: array
             The non overlapping closest mesh nodes to the endfeet array
+
+    Notes:
+        The endfoot closest to each overlapping node stays there and its 1-ring is reserved.
+        The rest are moved to the expanding rings around the node, all the overlapping nodes
+        advancing one ring level at a time. A ring vertex is free if its closed 1-ring does not
+        contain a seed or the 1-ring of a moved seed. At each level, the free vertices are
+        selected in rounds, taking the ones that have the smallest (node, vertex) rank among
+        the candidates they would block, so that the result does not depend on the order of
+        the endfeet. The moved endfeet of each node are assigned by increasing distance.
     """
-    occupied = set(closest_mesh_nodes)
+    neighbors = vertex_neighbors.ids
+    nn_offsets = vertex_neighbors.offsets
+    n_vertices = len(nn_offsets) - 1
 
-    for mesh_node, endfeet_ids in overlapping_groups.items():
-        if endfeet_ids.size <= 1:
-            continue
+    counts = np.diff(overlapping_groups.offsets)
+    is_overlapping = counts > 1
 
-        # expanding ring neighborhoods 1-ring, 2-ring etc.
-        ring_neighborhood_generator = _expanding_ring_neighborhoods(mesh_node, vertex_neighbors, 5)
+    if not is_overlapping.any():
+        return closest_mesh_nodes
 
-        ring = next(ring_neighborhood_generator)
-        occupied |= ring
+    group_vertices = overlapping_groups.groups[is_overlapping]
 
-        endfeet_dst = distances[endfeet_ids]
+    # the endfeet to move of each group, by increasing distance without the closest one
+    endfeet_ids = overlapping_groups.ids
+    group_ids = segment_ids(overlapping_groups.offsets)
+    order = np.lexsort((endfeet_ids, distances[endfeet_ids], group_ids))
+    first = np.zeros(len(order), dtype=bool)
+    first[overlapping_groups.offsets[:-1][counts > 0]] = True
 
-        # leave the closest endfoot to be assigned to mesh_node
-        # we will change the rest
-        endfeet_list = deque(endfeet_ids[np.argsort(endfeet_dst, kind="stable")[::-1]][:-1])
+    to_move = endfeet_ids[order][~first & is_overlapping[group_ids]]
+    n_to_move = counts[is_overlapping] - 1
+    to_move_offsets = offsets_from_counts(n_to_move)
+    n_placed = np.zeros(len(group_vertices), dtype=np.int64)
 
-        for ring in ring_neighborhood_generator:
-            no_endfeet_left = False
+    occupied = np.zeros(n_vertices, dtype=bool)
+    occupied[closest_mesh_nodes] = True
 
-            for vertex in ring:
-                v_neighbors = _get_neighbors(vertex_neighbors, vertex)
+    # the 1-ring of the overlapping nodes is reserved for the endfoot that stays
+    ring_groups = np.arange(len(group_vertices), dtype=np.int64)
+    ring_vertices = group_vertices.astype(np.int64)
+    visited = np.sort(ring_groups * n_vertices + ring_vertices)
 
-                # we want to find a node where its 1-ring neighborhood
-                # is not overlapping with the 1-ring neighborhood of the
-                # other occupied points
-                if not any(neighbor in occupied for neighbor in v_neighbors):
-                    endfoot_id = endfeet_list.pop()
-                    closest_mesh_nodes[endfoot_id] = vertex
+    ring_groups, ring_vertices, visited = _next_rings(
+        ring_groups, ring_vertices, visited, n_vertices, neighbors, nn_offsets
+    )
+    occupied[ring_vertices] = True
 
-                    # when found we add its 1-ring neighborhood and itself
-                    # to the occupied vertices
-                    occupied.add(vertex)
-                    occupied |= set(v_neighbors)
+    best_ranks = np.full(n_vertices, fill_value=_NO_RANK, dtype=np.int64)
 
-                    if not endfeet_list:
-                        no_endfeet_left = True
-                        break
+    for _ in range(1, MAX_SEED_RING_LEVEL):
+        ring_groups, ring_vertices, visited = _next_rings(
+            ring_groups, ring_vertices, visited, n_vertices, neighbors, nn_offsets
+        )
 
-            if no_endfeet_left:
-                break
-        else:
-            raise NGVError("Could not find neighboring available vertices to assign seeds")
+        # the pairs are sorted by (group, vertex), which is their priority
+        candidates = np.flatnonzero(n_placed[ring_groups] < n_to_move[ring_groups])
 
-        return closest_mesh_nodes
+        while len(candidates) > 0:
+            candidates = candidates[
+                _is_free(ring_vertices[candidates], occupied, neighbors, nn_offsets)
+            ]
+            selected = candidates[
+                _local_minima(
+                    ring_vertices[candidates], candidates, best_ranks, neighbors, nn_offsets
+                )
+            ]
+
+            # a group takes only as many vertices as it has endfeet left to move
+            groups = ring_groups[selected]
+            positions = _positions_in_sorted_groups(groups)
+            mask = positions < n_to_move[groups] - n_placed[groups]
+            selected, groups, positions = selected[mask], groups[mask], positions[mask]
+
+            vertices = ring_vertices[selected]
+            endfeet = to_move[to_move_offsets[groups] + n_placed[groups] + positions]
+            closest_mesh_nodes[endfeet] = vertices
+
+            n_placed += np.bincount(groups, minlength=len(group_vertices))
+            occupied[_closed_neighborhoods(vertices, neighbors, nn_offsets)[1]] = True
+
+            candidates = np.setdiff1d(candidates, selected, assume_unique=True)
+            candidates = candidates[
+                n_placed[ring_groups[candidates]] < n_to_move[ring_groups[candidates]]
+            ]
+
+        if np.array_equal(n_placed, n_to_move):
+            return closest_mesh_nodes
+
+    raise NGVError("Could not find neighboring available vertices to assign seeds")
 
 
 def _find_closest_mesh_nodes(endfeet_points, mesh_points, neighbors, nn_offsets):
@@ -150,7 +257,7 @@ def _mesh_to_flat_arrays(mesh):
     vertex, the offsets to access these neighbors and the coordinates of the vertices
 
     Args:
-        mesh: openmesh Trimesh
+        mesh: openmesh Trimesh or VasculatureSurfaceMesh
 
     Returns:
 
@@ -164,18 +271,211 @@ def _mesh_to_flat_arrays(mesh):
         vertex_coordiantes:
             The xyz coordinates of the vertices
     """
-    neighbors = mesh.vv_indices()
-    mask = neighbors >= 0
+    if not isinstance(mesh, VasculatureSurfaceMesh):
+        mesh = VasculatureSurfaceMesh.from_openmesh(mesh)
+
+    return mesh.neighbors, mesh.neighbors_offsets, np.asarray(mesh.points, dtype=np.float32)
+
+
+def _block_vertices(vertex_coordinates, block_size):
+    """Groups the vertices by the cubic block of the bounding box they belong to.
+
+    Returns:
+        origin: array[float, (3,)]
+            The lower corner of the block grid
+        blocks: array[int64, (B, 3)]
+            The grid indices of the non-empty blocks, in lexicographic order
+        grouped_vertices: GroupedElements
+            The vertices of each block, with the flat block keys as groups
+        shape: array[int64, (3,)]
+            The number of blocks along each axis
+    """
+    origin = vertex_coordinates.min(axis=0).astype(np.float64)
+    ijk = np.floor((vertex_coordinates - origin) / block_size).astype(np.int64)
+    shape = ijk.max(axis=0) + 1
+
+    grouped_vertices = group_elements(np.ravel_multi_index(ijk.T, shape))
+    blocks = np.column_stack(np.unravel_index(grouped_vertices.groups, shape))
+
+    return origin, blocks, grouped_vertices, shape
+
+
+def _overlapping_block_vertices(
+    vertex_coordinates, origin, block, grouped_vertices, shape, block_size, overlap
+):
+    """Returns the sorted vertices in the box of the block expanded by the overlap."""
+    n_cells = int(np.ceil(overlap / block_size))
+
+    ranges = [
+        np.arange(max(index - n_cells, 0), min(index + n_cells + 1, size))
+        for index, size in zip(block, shape)
+    ]
+    keys = np.ravel_multi_index(
+        [axis.ravel() for axis in np.meshgrid(*ranges, indexing="ij")], shape
+    )
+
+    # the non-empty neighboring blocks
+    positions = np.searchsorted(grouped_vertices.groups, keys)
+    mask = positions < len(grouped_vertices.groups)
+    positions = positions[mask][grouped_vertices.groups[positions[mask]] == keys[mask]]
+
+    offsets = grouped_vertices.offsets
+    vertices = grouped_vertices.ids[
+        expand_ranges(offsets[positions], offsets[positions + 1] - offsets[positions])
+    ]
 
-    nn_offsets = np.count_nonzero(mask.reshape(neighbors.shape), axis=1)
+    lower = origin + block * block_size - overlap
+    upper = lower + block_size + 2.0 * overlap
+    coordinates = vertex_coordinates[vertices]
+    is_inside = np.all((coordinates >= lower) & (coordinates < upper), axis=1)
 
-    nn_offsets = np.hstack(((0,), np.cumsum(nn_offsets))).astype(np.int64)
-    neighbors = neighbors[mask].astype(np.int64)
+    return np.sort(vertices[is_inside])
 
-    return neighbors, nn_offsets, mesh.points().astype(np.float32)
 
+def _block_submesh(vertices, neighbors, nn_offsets):
+    """Extracts the submesh of the vertices and their 1-ring.
 
-def fast_marching_eikonal_solver(mesh, seed_coordinates, cutoff_distance):
+    The vertices keep their complete 1-ring so that the triangles around them are intact,
+    whereas the vertices of the 1-ring that are not in vertices have no neighbors.
+
+    Returns:
+        submesh_vertices: array[int64, (M,)]
+            The sorted global ids of the submesh vertices
+        local_neighbors: array[int64, (K,)]
+            The local neighbors of the submesh vertices
+        local_offsets: array[int64, (M + 1,)]
+            The offsets of the local neighbors
+    """
+    counts = nn_offsets[vertices + 1] - nn_offsets[vertices]
+    ring_neighbors = neighbors[expand_ranges(nn_offsets[vertices], counts)]
+
+    submesh_vertices = np.union1d(vertices, ring_neighbors)
+
+    local_counts = np.zeros(len(submesh_vertices), dtype=np.int64)
+    local_counts[np.searchsorted(submesh_vertices, vertices)] = counts
+
+    return (
+        submesh_vertices,
+        np.searchsorted(submesh_vertices, ring_neighbors),
+        offsets_from_counts(local_counts),
+    )
+
+
+def _solve_block(
+    core_vertices, block_vertices, neighbors, nn_offsets, vertex_coordinates, seed_vertices, cutoff
+):
+    """Solves the fast marching method on the submesh of a block and returns the groups, as
+    indices to seed_vertices, the travel times and the statuses of its core vertices.
+
+    Only the seeds that lie in the block vertices are propagated.
+    """
+    submesh_vertices, local_neighbors, local_offsets = _block_submesh(
+        block_vertices, neighbors, nn_offsets
+    )
+
+    seed_ids = np.flatnonzero(np.isin(seed_vertices, block_vertices))
+
+    v_group_indices, v_travel_times, v_status = grow_waves_on_triangulated_surface(
+        local_neighbors,
+        local_offsets,
+        vertex_coordinates[submesh_vertices],
+        np.searchsorted(submesh_vertices, seed_vertices[seed_ids]),
+        cutoff**2,
+    )
+
+    local_ids = np.searchsorted(submesh_vertices, core_vertices)
+
+    groups = v_group_indices[local_ids].astype(np.int64)
+    groups[groups > -1] = seed_ids[groups[groups > -1]]
+
+    return groups, v_travel_times[local_ids], v_status[local_ids]
+
+
+def _partitioned_eikonal_solver(
+    neighbors,
+    nn_offsets,
+    vertex_coordinates,
+    seed_vertices,
+    cutoff_distance,
+    block_size,
+    overlap,
+    n_workers=1,
+):
+    """Solves the fast marching method independently on overlapping spatial blocks.
+
+    Each block is solved on the vertices in its box expanded by the overlap, with the seeds
+    that lie in them, and the solution of the vertices in its box is kept.
+
+    Returns:
+        v_group_indices, v_travel_times, v_status as in fast_marching_eikonal_solver.
+
+    Notes:
+        A vertex is claimed by the first wavefront that reaches it and its travel time is
+        frozen when it is accepted, which both depend on the propagation order. Therefore, the
+        overlapping blocks are not merged by the smallest travel time, which would differ from
+        the global solution, but each vertex takes the solution of the block that contains it.
+        The overlap is at least the cutoff distance, so that the seeds that can reach the
+        vertices of a block and their competing wavefronts are included. The travel times
+        also propagate across the fronts of neighboring wavefronts, thus a small fraction of
+        the vertices at the fronts may differ from the global solution.
+
+        The block submeshes are extracted from the flat arrays of the entire mesh, which must
+        be in memory. The partitioning bounds the per-vertex structures of each solve, not the
+        memory of the mesh itself.
+    """
+    if overlap < cutoff_distance:
+        raise NGVError(
+            f"The block overlap ({overlap}) must be at least the cutoff distance "
+            f"({cutoff_distance})."
+        )
+
+    n_vertices = len(nn_offsets) - 1
+    seed_vertices = np.asarray(seed_vertices, dtype=np.int64)
+
+    origin, blocks, grouped_vertices, shape = _block_vertices(vertex_coordinates, block_size)
+
+    L.info("Fast marching method on %d blocks of size %.2f", len(blocks), block_size)
+
+    tasks = (
+        (
+            grouped_vertices.ids[beg:end],
+            _overlapping_block_vertices(
+                vertex_coordinates, origin, block, grouped_vertices, shape, block_size, overlap
+            ),
+        )
+        for block, beg, end in zip(
+            blocks, grouped_vertices.offsets[:-1], grouped_vertices.offsets[1:]
+        )
+    )
+
+    args = (neighbors, nn_offsets, vertex_coordinates, seed_vertices, cutoff_distance)
+
+    if n_workers == 1:
+        results = (_solve_block(core, vertices, *args) for core, vertices in tasks)
+    else:
+        import joblib
+
+        results = joblib.Parallel(n_jobs=n_workers, return_as="generator")(
+            joblib.delayed(_solve_block)(core, vertices, *args) for core, vertices in tasks
+        )
+
+    v_group_indices = np.empty(n_vertices, dtype=np.int32)
+    v_travel_times = np.empty(n_vertices, dtype=np.float64)
+    v_status = np.empty(n_vertices, dtype=np.int8)
+
+    offsets = grouped_vertices.offsets
+    for beg, end, (groups, travel_times, status) in zip(offsets[:-1], offsets[1:], results):
+        core = grouped_vertices.ids[beg:end]
+        v_group_indices[core] = groups
+        v_travel_times[core] = travel_times
+        v_status[core] = status
+
+    return v_group_indices, v_travel_times, v_status
+
+
+def fast_marching_eikonal_solver(
+    mesh, seed_coordinates, cutoff_distance, block_size=None, overlap=None, n_workers=1
+):
     """Fast Marching Eikonal Solver for unstructured grids.
 
     Propagates wavefronts from each source vertex. The wavefronts color
@@ -183,7 +483,7 @@ def fast_marching_eikonal_solver(mesh, seed_coordinates, cutoff_distance):
     already been colored by a neighboring vertex.
 
     Args:
-        mesh: openmesh Trimesh
+        mesh: openmesh Trimesh or VasculatureSurfaceMesh
 
         seed_coordinates:
             The xyz coordinates of the initial seeds from which waves will be propagated
@@ -192,6 +492,19 @@ def fast_marching_eikonal_solver(mesh, seed_coordinates, cutoff_distance):
         cutoff_distance:
             The maximum distance a wavefront can spread from its initial seed point
 
+        block_size:
+            If not None, the mesh is partitioned in cubic blocks of this size, which are
+            solved independently on their vertices expanded by the overlap. This bounds the
+            memory of each solve, but the entire mesh is still loaded to build the blocks.
+
+        overlap:
+            The overlap of the blocks, at least the cutoff distance. Defaults to twice the
+            cutoff distance.
+
+        n_workers:
+            Number of processes for solving the blocks (joblib convention, -1 for all the
+            cores).
+
     Returns:
         v_group_indices:
             The group each vertex belongs to. The groups are corresponding to the positional
@@ -210,6 +523,18 @@ def fast_marching_eikonal_solver(mesh, seed_coordinates, cutoff_distance):
         seed_coordinates, vertex_coordinates, neighbors, nn_offsets
     )
 
+    if block_size is not None:
+        return _partitioned_eikonal_solver(
+            neighbors,
+            nn_offsets,
+            vertex_coordinates,
+            seed_vertices,
+            cutoff_distance,
+            block_size,
+            2.0 * cutoff_distance if overlap is None else overlap,
+            n_workers=n_workers,
+        )
+
     v_group_indices, v_travel_times, v_status = grow_waves_on_triangulated_surface(
         neighbors, nn_offsets, vertex_coordinates, seed_vertices, cutoff_distance**2
     )
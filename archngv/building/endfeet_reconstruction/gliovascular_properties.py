@@ -2,40 +2,39 @@
 
 """Endfeet properties to be added to the gliovascular edge population file"""
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Callable, Iterator, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Tuple
 
 import numpy as np
-import pandas as pd
 
+from archngv.app.utils import TASK_CHUNK_SIZE, apply_parallel_function, chunk_ranges
 from archngv.exceptions import NGVError
+from archngv.utils.segmented import offsets_from_counts
 
 if TYPE_CHECKING:
     from vascpy import PointVasculature
 
-    from archngv.core.datastructure import CellData, EndfeetMeshes, GliovascularConnectivity
+    from archngv.core.datastructure import CellData, GliovascularConnectivity
+
+# the datasets opened once by each worker process, see _init_worker
+_WORKER_STATE: Dict[str, Any] = {}
 
 
 def endfeet_mesh_properties(
     seed: int,
-    astrocytes: "CellData",
-    gliovascular_connectivity: "GliovascularConnectivity",
-    vasculature: "PointVasculature",
-    endfeet_meshes: "EndfeetMeshes",
-    morph_dir: Path,
-    map_function: Callable[[Any, Any], Any],
-) -> pd.DataFrame:
+    paths: Dict[str, Path],
+    n_workers: int = 1,
+    chunk_size: int = TASK_CHUNK_SIZE,
+) -> Dict[str, np.ndarray]:
     """Generates the endfeet properties that required for the astrocyte morphologies and
     endfeet meshes. These properties will then be added to the GliovascularConnectivity edges
     as properties along with the previous ones, calculated at the first stages of the framework
 
     Args:
         seed: The seed for the random generator
-        astrocytes: astrocytes population
-        gv_connectivity: edges population
-        vasculature: sonata vasculature
-        endfeet_meshes: Meshes for endfeet
-        morph_dir: Morphology directory
-        map_func: map function to run the processing
+        paths: dictionary with the paths of the 'astrocytes', 'gliovascular_connectivity',
+            'vasculature' and 'endfeet_meshes' datasets and of the 'morph_dir'
+        n_workers: Number of processes, -1 for all the cores
+        chunk_size: Number of astrocytes processed by each task
 
     Returns:
         dict: A dictionary with additional endfeet properties:
@@ -45,8 +44,17 @@ def endfeet_mesh_properties(
             endfoot_compartment_length (np.ndarray): (N,) float array of compartment lengths
             endfoot_compartment_diameter (np.ndarray): (N,) float array of compartment diameters
             endfoot_compartmen_perimeter (np.ndarray): (N,) float array of compartment perimeters
+
+    Notes:
+        The tasks carry only ranges of astrocyte ids. The workers open the datasets once and
+        return the properties of each chunk as arrays. Each astrocyte is seeded on its own,
+        therefore the result is the same for any number of workers and chunk size.
     """
-    endfeet_ids = gliovascular_connectivity.get_property("endfoot_id")
+    from archngv.core.datasets import CellData, GliovascularConnectivity
+
+    endfeet_ids = GliovascularConnectivity(paths["gliovascular_connectivity"]).get_property(
+        "endfoot_id"
+    )
     n_endfeet = len(endfeet_ids)
 
     if not np.array_equal(endfeet_ids, np.arange(n_endfeet)):
@@ -59,15 +67,13 @@ def endfeet_mesh_properties(
         "endfoot_compartment_perimeter": np.empty(n_endfeet, dtype=np.float32),
     }
 
-    it_results = map_function(
-        GliovascularWorker(seed),
-        _dispatch_endfeet_data(
-            astrocytes,
-            gliovascular_connectivity,
-            vasculature,
-            endfeet_meshes,
-            morph_dir,
-        ),
+    it_results = apply_parallel_function(
+        _endfeet_properties_from_chunk,
+        chunk_ranges(len(CellData(paths["astrocytes"])), chunk_size),
+        initializer=_init_worker,
+        initargs=(seed, paths),
+        finalizer=_WORKER_STATE.clear,
+        n_workers=n_workers,
     )
 
     for ids, section_ids, lengths, diameters, perimeters in it_results:
@@ -79,35 +85,126 @@ def endfeet_mesh_properties(
     return properties
 
 
-class GliovascularWorker:
-    """Endfeet properties parallel helper"""
+def _init_worker(seed: int, paths: Dict[str, Path]) -> None:
+    """Opens the datasets and prefetches the endfeet data once per worker process."""
+    from vascpy import PointVasculature
+
+    from archngv.core.datasets import CellData, EndfootSurfaceMeshes, GliovascularConnectivity
+
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(
+        {
+            "seed": seed,
+            "endfeet_data": _prefetch_endfeet_data(
+                CellData(paths["astrocytes"]),
+                GliovascularConnectivity(paths["gliovascular_connectivity"]),
+                PointVasculature.load_sonata(paths["vasculature"]),
+                paths["morph_dir"],
+            ),
+            "endfeet_meshes": EndfootSurfaceMeshes(paths["endfeet_meshes"]),
+        }
+    )
+
+
+def _endfeet_properties_from_chunk(chunk: Tuple[int, int]) -> Tuple[np.ndarray, ...]:
+    """Calculates the endfeet properties of the astrocytes in the [beg, end) chunk.
+
+    The compartment data do not depend on the morphologies and are calculated for all the
+    endfeet of the chunk at once, from their packed meshes. Only the astrocyte section ids
+    are calculated per astrocyte.
+
+    Returns:
+        The endfeet ids, astrocyte section ids, compartment lengths, diameters and perimeters
+        of the astrocytes in the chunk.
+    """
+    from archngv.building.morphology_synthesis.endfoot_compartment import (
+        create_packed_endfeet_compartment_data,
+    )
 
-    def __init__(self, seed):
-        self._seed = seed
+    beg, end = chunk
+    seed = _WORKER_STATE["seed"]
+    endfeet_data = _WORKER_STATE["endfeet_data"]
+
+    offsets = endfeet_data["offsets"]
+    e_beg, e_end = offsets[beg], offsets[end]
+    endfeet_ids = endfeet_data["endfeet_ids"][e_beg:e_end]
+
+    if e_beg == e_end:
+        return (
+            endfeet_ids,
+            np.empty(0, dtype=np.uint32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+        )
+
+    lengths, diameters, perimeters = create_packed_endfeet_compartment_data(
+        endfeet_data["vasculature_segments"][e_beg:e_end],
+        endfeet_data["endfeet_surface_targets"][e_beg:e_end],
+        _WORKER_STATE["endfeet_meshes"].packed_meshes(endfeet_ids),
+    )
 
-    def __call__(self, data):
-        """
-        Args:
-            data (dict)
-        """
-        np.random.seed(hash((self._seed, data["index"])) % (2**32))
-        return _endfeet_properties_from_astrocyte(data)
+    section_ids = np.empty(e_end - e_beg, dtype=np.uint32)
+    for data in _dispatch_endfeet_data(endfeet_data, beg, end):
+        astro_id = data["index"]
+        np.random.seed(hash((seed, astro_id)) % (2**32))
+        section_ids[
+            offsets[astro_id] - e_beg : offsets[astro_id + 1] - e_beg
+        ] = _astrocyte_section_ids(data)
 
+    return endfeet_ids, section_ids, lengths, diameters, perimeters
 
-def _dispatch_endfeet_data(
+
+def _prefetch_endfeet_data(
     astrocytes: "CellData",
     gv_connectivity: "GliovascularConnectivity",
     vasculature: "PointVasculature",
-    endfeet_meshes: "EndfeetMeshes",
     morph_dir: Path,
-) -> Iterator[dict]:
-    """Dispatches data for parallel worker
+) -> Dict[str, Any]:
+    """Reads the properties of all the endfeet and astrocytes at once.
+
+    The endfeet are grouped by astrocyte with a stable sort, so that the data of each
+    astrocyte is sliced instead of read.
+
+    Returns:
+        dict with the following keys:
+            offsets (np.ndarray): (n_astrocytes + 1,) The endfeet of the i-th astrocyte are
+                the grouped ones in [offsets[i], offsets[i + 1])
+            endfeet_ids (np.ndarray): (N,) The endfeet ids grouped by astrocyte
+            endfeet_surface_targets (np.ndarray): (N, 3) The grouped surface targets
+            vasculature_segments (np.ndarray): (N, 2, 3) The grouped vasculature segments
+            morphology_names (np.ndarray): (n_astrocytes,) The morphology names
+            morphology_positions (np.ndarray): (n_astrocytes, 3) The astrocyte positions
+            morph_dir (Path): The morphology directory
+    """
+    n_astrocytes = len(astrocytes)
+
+    # the endfeet of each astrocyte in ascending order, as returned by afferent_edges
+    endfeet_astrocytes = gv_connectivity.get_target_nodes()
+    grouped_endfeet_ids = np.argsort(endfeet_astrocytes, kind="stable")
+
+    return {
+        "offsets": offsets_from_counts(np.bincount(endfeet_astrocytes, minlength=n_astrocytes)),
+        "endfeet_ids": grouped_endfeet_ids,
+        "endfeet_surface_targets": gv_connectivity.vasculature_surface_targets()[
+            grouped_endfeet_ids
+        ],
+        "vasculature_segments": vasculature.points[
+            vasculature.edges[gv_connectivity.get_source_nodes()[grouped_endfeet_ids]]
+        ],
+        "morphology_names": astrocytes.get_property("morphology"),
+        "morphology_positions": astrocytes.positions(),
+        "morph_dir": morph_dir,
+    }
+
+
+def _dispatch_endfeet_data(endfeet_data: Dict[str, Any], beg: int, end: int) -> Iterator[dict]:
+    """Dispatches the data of the astrocytes in [beg, end) that have endfeet
+
     Args:
-        astrocytes: Astrocyte population
-        gv_connectivity: Edges population
-        vasculature: Sonata vasculature
-        endfeet_meshes: The data for the endfeet meshes
-        morph_dir: Path to morphology directory
+        endfeet_data: The prefetched data, see _prefetch_endfeet_data
+        beg: The first astrocyte id
+        end: The astrocyte id after the last one
 
     Yields:
         data: The following pairs:
@@ -115,72 +212,41 @@ def _dispatch_endfeet_data(
             endfeet_ids (np.ndarray): (N,) Endfeet ids for astrocyte index
             endfeet_surface_targets (np.ndarray): (N, 3) Surface starting points
                 of endfeet
-            endfeet_meshes (List(namedtuple)): (N,) Meshes of endfeet surfaces with:
-                index (int): endfoot index
-                points (np.ndarray): mesh points
-                triangles (np.ndarray): mesh triangles
-                area (float): mesh surface area
-                thickness (float): mesh thickness
             morphology_path (str): Path to astrocyte morphology
             morphology_position (np.ndarray): (3,) Position of astrocyte
-            vasculature_segments (np.ndarray): (N, 2, 3) Vasculature segments per
-                endfoot
     """
-    vasculature_points = vasculature.points
-    vasculature_edges = vasculature.edges
+    offsets = endfeet_data["offsets"]
 
-    for astro_id in range(len(astrocytes)):
-        endfeet_ids = gv_connectivity.astrocyte_endfeet(astro_id)
+    for astro_id in range(beg, end):
+        e_beg, e_end = offsets[astro_id], offsets[astro_id + 1]
 
         # no endfeet, no processing to do
-        if endfeet_ids.size == 0:
+        if e_beg == e_end:
             continue
 
-        morphology_name = astrocytes.get_property("morphology", ids=astro_id)[0]
-        morphology_path = str(Path(morph_dir, morphology_name + ".h5"))
-        morphology_pos = astrocytes.positions(index=astro_id)[0]
-
-        vasc_segment_ids = gv_connectivity.vasculature_sections_segments(endfeet_ids)[:, 0]
-        vasc_segments = vasculature_points[vasculature_edges[vasc_segment_ids]]
-
-        endfeet_surface_targets = gv_connectivity.vasculature_surface_targets(endfeet_ids)
-
         yield {
             "index": astro_id,
-            "endfeet_ids": endfeet_ids,
-            "endfeet_surface_targets": endfeet_surface_targets,
-            "endfeet_meshes": endfeet_meshes[endfeet_ids],
-            "morphology_path": morphology_path,
-            "morphology_position": morphology_pos,
-            "vasculature_segments": vasc_segments,
+            "endfeet_ids": endfeet_data["endfeet_ids"][e_beg:e_end],
+            "endfeet_surface_targets": endfeet_data["endfeet_surface_targets"][e_beg:e_end],
+            "morphology_path": str(
+                Path(endfeet_data["morph_dir"], endfeet_data["morphology_names"][astro_id] + ".h5")
+            ),
+            "morphology_position": endfeet_data["morphology_positions"][astro_id],
         }
 
 
-def _endfeet_properties_from_astrocyte(data: dict) -> Tuple[np.ndarray, ...]:
-    """Calculates data for one astrocyte
+def _astrocyte_section_ids(data: dict) -> np.ndarray:
+    """Calculates the astrocyte section ids of the endfeet of one astrocyte
+
     Args:
-        data: Input data dict. See _dispatch_data for the dict key, values
+        data: Input data dict. See _dispatch_endfeet_data for the dict key, values
+
     Returns:
-        tuple:
-            endfeet_ids: (N,) int array of endfeet ids
-            astrocyte_section_ids: (N,) int array of astrocyte section ids
-            lengths: (N,) float array of endfeet compartment lengths
-            diameters: (N,) float array of endfeet compartment diameters
-            perimeters: (N,) float array of endfeet compartment perimeters
+        astrocyte_section_ids: (N,) int array of the morphology section ids that connect to
+            the surface targets of the endfeet
     """
     from archngv.app.utils import readonly_morphology
     from archngv.building.morphology_synthesis.annotation import annotate_endfoot_location
-    from archngv.building.morphology_synthesis.endfoot_compartment import (
-        create_endfeet_compartment_data,
-    )
 
     morphology = readonly_morphology(data["morphology_path"], data["morphology_position"])
-    astrocyte_section_ids = annotate_endfoot_location(morphology, data["endfeet_surface_targets"])
-
-    lengths, diameters, perimeters = create_endfeet_compartment_data(
-        data["vasculature_segments"],
-        data["endfeet_surface_targets"],
-        data["endfeet_meshes"],
-    )
-
-    return data["endfeet_ids"], astrocyte_section_ids, lengths, diameters, perimeters
+    return annotate_endfoot_location(morphology, data["endfeet_surface_targets"])
@@ -14,6 +14,11 @@ class GroupedElements:
         self._offsets = offsets
         self.groups = groups
 
+    @property
+    def offsets(self):
+        """Returns the offsets of the groups' ids"""
+        return self._offsets
+
     def items(self):
         """
         Yields:
@@ -37,7 +42,7 @@ class GroupedElements:
         return self.ids[self._offsets[group_index] : self._offsets[group_index + 1]]
 
 
-def group_elements(v_group_index):
+def group_elements(v_group_index, dtype=np.int64):
     """transform v_group_index (storing vertex -> group information) into inverse
 
                    0 1 2 3 4 5 6  7  8  # (implicit vertex index)
@@ -47,11 +52,13 @@ def group_elements(v_group_index):
        idx = [6, 5, 3, 4, 0, 1, 2, ]
                   0  1  2  3      # implicit group index
        offsets = [0, 1, 2, 4, 7]  # offsets into above
+
+    The ids are converted to dtype.
     """
     # group vertices with same seed, note: casting to uint to have -1 sort at the end
     values = v_group_index
 
-    idx = np.argsort(values, kind="stable")
+    idx = np.argsort(values, kind="stable").astype(dtype, copy=False)
 
     # find unique groups in values and their respective offsets
     groups, offsets = np.unique(values, return_counts=True)
@@ -64,7 +71,7 @@ def group_elements(v_group_index):
     return GroupedElements(idx, cumulative_offsets, groups)
 
 
-def vertex_to_triangle_groups(vertex_groups, triangles):
+def vertex_to_triangle_groups(vertex_groups, triangles, dtype=np.int64):
     """
         Maps from the vertex groups to triangle groups.
 
@@ -73,6 +80,8 @@ def vertex_to_triangle_groups(vertex_groups, triangles):
             Group for each vertex. Can also be unassigned -1
         triangles:
             Mesh triangles
+        dtype:
+            The dtype of the triangle groups
 
     Returns:
         The groups of triangles. They can also be unassigned -1.
@@ -81,17 +90,18 @@ def vertex_to_triangle_groups(vertex_groups, triangles):
         A triangle will acquire a group if all three vertices have the same group. Otherwise it
         becomes unassigned -1.
     """
-    # triangles with vertex groups instead of vertex indices
-    group_tris = vertex_groups[triangles]
+    # the vertex groups of each triangle column, indexing column by column to avoid
+    # (M, 3) temporaries
+    groups0, groups1, groups2 = (vertex_groups[triangles[:, i]] for i in range(3))
 
-    triangle_groups = np.full(len(triangles), fill_value=-1, dtype=np.int64)
+    triangle_groups = np.full(len(triangles), fill_value=-1, dtype=dtype)
 
     # first second cols equal or first third cols equal
-    mask = (group_tris[:, 0] == group_tris[:, 1]) | (group_tris[:, 0] == group_tris[:, 2])
-    triangle_groups[mask] = group_tris[mask, 0]
+    mask = (groups0 == groups1) | (groups0 == groups2)
+    triangle_groups[mask] = groups0[mask]
 
     # second third cols equal
-    mask = group_tris[:, 1] == group_tris[:, 2]
-    triangle_groups[mask] = group_tris[mask, 1]
+    mask = groups1 == groups2
+    triangle_groups[mask] = groups1[mask]
 
     return triangle_groups
@@ -3,7 +3,7 @@
 """SONATA node and edge population exporters"""
 import logging
 from pathlib import Path
-from typing import Any, Dict, Iterable, Iterator
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import h5py
 import libsonata
@@ -11,13 +11,124 @@ import numpy as np
 import voxcell
 
 from archngv.core.datasets import EndfootMesh, Microdomain
+from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
 from archngv.exceptions import NGVError
 
 L = logging.getLogger(__name__)
 
+HDF5_COMPRESSION_FILTERS = ("gzip", "lzf")
+
+# default size of a dataset chunk when the chunk size is not specified
+DEFAULT_CHUNK_BYTES = 64 * 1024
+
+
+def dataset_storage_options(
+    values: np.ndarray,
+    storage: Optional[Dict[str, Any]] = None,
+    group_offsets: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """Returns the h5py create_dataset keyword arguments for the chunking and compression of
+    a dataset.
+
+    Args:
+        values: The dataset values.
+        storage: A dictionary with the optional keys:
+            - chunk_size: The number of rows in each chunk.
+            - compression: The compression filter, one of HDF5_COMPRESSION_FILTERS.
+            - compression_level: The gzip compression level [0-9]. Default is 4.
+            If None or no chunk size and compression are given, the dataset is contiguous.
+            Empty datasets are always contiguous.
+        group_offsets: The offsets of the groups in the values, if any. The default chunk size
+            is a multiple of the typical group length, so that groups are rarely split across
+            chunks.
+
+    Returns:
+        The keyword arguments to pass to h5py create_dataset.
+
+    Notes:
+        Compressed datasets are always byte-shuffled, which improves the compression ratio of
+        numeric data.
+    """
+    if not storage:
+        return {}
+
+    chunk_size = storage.get("chunk_size", None)
+    options = _filter_options(storage)
+
+    values = np.asarray(values)
+
+    # h5py cannot chunk empty datasets
+    if (
+        (chunk_size is None and not options)
+        or values.ndim == 0
+        or len(values) == 0
+        or values.dtype.hasobject
+    ):
+        return {}
+
+    if chunk_size is None:
+        chunk_size = _default_chunk_size(values, group_offsets)
+
+    options["chunks"] = (int(max(1, min(chunk_size, len(values)))),) + values.shape[1:]
+
+    return options
+
+
+def _filter_options(storage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Returns the h5py create_dataset keyword arguments for the compression of a chunked
+    dataset, which are empty if no compression is given.
+    """
+    storage = storage or {}
+    compression = storage.get("compression", None)
+
+    if compression is None:
+        return {}
+
+    if compression not in HDF5_COMPRESSION_FILTERS:
+        raise NGVError(
+            f"Unknown compression '{compression}'. Available: {HDF5_COMPRESSION_FILTERS}"
+        )
+
+    options: Dict[str, Any] = {"compression": compression, "shuffle": True}
+
+    if compression == "gzip":
+        options["compression_opts"] = storage.get("compression_level", 4)
+
+    return options
+
+
+def _default_chunk_size(values: np.ndarray, group_offsets: Optional[np.ndarray]) -> int:
+    """Returns the number of rows that fit in DEFAULT_CHUNK_BYTES, rounded to a multiple of
+    the median group length if there are groups.
+    """
+    row_nbytes = values.dtype.itemsize * int(np.prod(values.shape[1:], dtype=np.int64))
+    n_rows = max(1, DEFAULT_CHUNK_BYTES // max(1, row_nbytes))
+
+    if group_offsets is not None:
+        group_lengths = np.diff(group_offsets)
+        group_lengths = group_lengths[group_lengths > 0]
+
+        if group_lengths.size > 0:
+            typical_length = int(np.median(group_lengths))
+            n_rows = typical_length * max(1, round(n_rows / typical_length))
+
+    return n_rows
+
+
+def _check_edge_population_storage(storage: Optional[Dict[str, Any]]) -> None:
+    """Edge populations are read with libsonata, which supports only the gzip filter."""
+    if storage and storage.get("compression", None) not in (None, "gzip"):
+        raise NGVError(
+            f"Compression '{storage['compression']}' is not supported by libsonata. "
+            "Edge populations can only be compressed with gzip."
+        )
+
 
 def add_properties_to_edge_population(
-    filepath: Path, population_name: str, properties: Dict[str, np.ndarray]
+    filepath: Path,
+    population_name: str,
+    properties: Dict[str, np.ndarray],
+    storage: Optional[Dict[str, Any]] = None,
 ) -> None:
     """Add properties that are not already existing to an edge population.
 
@@ -25,11 +136,15 @@ def add_properties_to_edge_population(
         filepath: SONATA EdgePopulation h5 file path
         population_name: The name of the EdgePopulation
         properties: A dict with property names as keys and 1D numpy arrays as values.
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
 
     Raises:
         AssertionError: If property name exists or if property values length is not
             compatible with the edge population
+        NGVError: If the compression is not supported by libsonata.
     """
+    _check_edge_population_storage(storage)
+
     with h5py.File(filepath, "r+") as h5f:
         group = h5f[f"/edges/{population_name}/0"]
         length = h5f[f"/edges/{population_name}/source_node_id"].shape[0]
@@ -41,7 +156,7 @@ def add_properties_to_edge_population(
             if values.size != length:
                 raise NGVError(f"Incompatible length. Expected: {length}. Given: {values.size}")
 
-            group.create_dataset(name, data=values)
+            group.create_dataset(name, data=values, **dataset_storage_options(values, storage))
             L.info("Added edge Property: %s", name)
 
 
@@ -53,6 +168,7 @@ def write_edge_population(
     source_node_ids: np.ndarray,
     target_node_ids: np.ndarray,
     properties: Dict[str, np.ndarray],
+    storage: Optional[Dict[str, Any]] = None,
 ) -> None:
     """Write a SONATA node population.
 
@@ -64,27 +180,36 @@ def write_edge_population(
         source_node_ids: The ids of the source node population.
         target_node_ids: The ids of the target node population.
         properties: The dictionary of properties to write to the population.
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
     """
     # pylint: disable=too-many-arguments
 
     assert len(source_node_ids) == len(target_node_ids)
+    _check_edge_population_storage(storage)
 
     with h5py.File(output_path, "w") as h5f:
         h5root = h5f.create_group(f"/edges/{population_name}")
 
         # 'edge_type_id' is a required attribute storing index into CSV which we don't use
+        edge_type_ids = np.full(len(source_node_ids), -1, dtype=np.int32)
         h5root.create_dataset(
-            "edge_type_id", data=np.full(len(source_node_ids), -1, dtype=np.int32)
+            "edge_type_id",
+            data=edge_type_ids,
+            **dataset_storage_options(edge_type_ids, storage),
         )
 
-        h5root.create_dataset("source_node_id", data=source_node_ids, dtype=np.uint64)
-        h5root.create_dataset("target_node_id", data=target_node_ids, dtype=np.uint64)
+        for name, node_ids in (
+            ("source_node_id", source_node_ids),
+            ("target_node_id", target_node_ids),
+        ):
+            node_ids = np.asarray(node_ids, dtype=np.uint64)
+            h5root.create_dataset(name, data=node_ids, **dataset_storage_options(node_ids, storage))
 
         h5group = h5root.create_group("0")
 
         # add edge properties
         for name, values in properties.items():
-            h5group.create_dataset(name, data=values)
+            h5group.create_dataset(name, data=values, **dataset_storage_options(values, storage))
             L.info("Added edge Property: %s", name)
 
         h5root["source_node_id"].attrs["node_population"] = source_population.population_name
@@ -103,7 +228,11 @@ def write_edge_population(
         L.warning("Indexing will not be done. No edges in: %s", population_name)
 
 
-def export_grouped_properties(filepath: Path, properties: Dict[str, Dict[str, np.ndarray]]) -> None:
+def export_grouped_properties(
+    filepath: Path,
+    properties: Dict[str, Dict[str, np.ndarray]],
+    storage: Optional[Dict[str, Any]] = None,
+) -> None:
     """Writes grouped properties into an hdf5 file.
 
     Args:
@@ -115,6 +244,7 @@ def export_grouped_properties(filepath: Path, properties: Dict[str, Dict[str, np
                 - offsets: A numpy array of integers representing the offsets corresponding to the
                     groups in the values, or None if the dataset is linear without groups. If None,
                     the `values` will be added in `data` without a respective `offsets` dataset.
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
 
     Notes:
         The property values of the i-th group correspond to values[offsets[i]: offsets[i + 1]]
@@ -124,14 +254,213 @@ def export_grouped_properties(filepath: Path, properties: Dict[str, Dict[str, np
         g_offsets = f.create_group("offsets", track_order=True)
 
         for name, dct in properties.items():
-            g_data.create_dataset(name, data=dct["values"])
+            g_data.create_dataset(
+                name,
+                data=dct["values"],
+                **dataset_storage_options(dct["values"], storage, group_offsets=dct["offsets"]),
+            )
 
             if dct["offsets"] is not None:
-                g_offsets.create_dataset(name, data=dct["offsets"].astype(np.int64))
+                offsets = dct["offsets"].astype(np.int64)
+                g_offsets.create_dataset(
+                    name, data=offsets, **dataset_storage_options(offsets, storage)
+                )
+
+
+def _resizable_storage_options(
+    dtype: np.dtype, row_shape: Tuple[int, ...], storage: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Returns the create_dataset keyword arguments of a dataset that grows along its first
+    axis. Resizable datasets are always chunked.
+    """
+    values = np.empty((0,) + row_shape, dtype=dtype)
+
+    options = _filter_options(storage)
+    chunk_size = (storage or {}).get("chunk_size", None) or _default_chunk_size(values, None)
+
+    options["chunks"] = (int(chunk_size),) + row_shape
+    options["maxshape"] = (None,) + row_shape
+    return options
+
+
+class GroupedPropertiesWriter:
+    """Writes grouped properties incrementally, from an ordered stream of groups.
+
+    The layout is the same as the one of export_grouped_properties. The values of the grouped
+    properties are appended to resizable datasets and their offsets are accumulated
+    incrementally, therefore only a bounded buffer of groups is kept in memory.
+
+    Args:
+        filepath: Path to output file.
+        n_groups: The total number of groups.
+        grouped_properties: Property name to (dtype, row_shape) of the properties with a variable
+            number of values per group, e.g. {"points": (np.float32, (3,))}.
+        linear_properties: Property name to dtype of the properties with one value per group.
+            The groups that are not written have zero values.
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
+        buffer_bytes: The size of the buffered grouped values that triggers a write.
+
+    Example:
+        with GroupedPropertiesWriter(path, 10, {"points": (np.float32, (3,))}, {}) as writer:
+            writer.append(2, points=points)
+
+    Notes:
+        The groups must be appended in increasing index order, with gaps allowed. The groups
+        that are not appended have no grouped values.
+    """
+
+    def __init__(
+        self,
+        filepath: Path,
+        n_groups: int,
+        grouped_properties: Dict[str, Tuple[Any, Tuple[int, ...]]],
+        linear_properties: Dict[str, Any],
+        storage: Optional[Dict[str, Any]] = None,
+        buffer_bytes: int = 16 * 1024 * 1024,
+    ):
+        self._n_groups = n_groups
+        self._grouped = {
+            name: (np.dtype(dtype), tuple(row_shape))
+            for name, (dtype, row_shape) in grouped_properties.items()
+        }
+        self._linear = {name: np.dtype(dtype) for name, dtype in linear_properties.items()}
+        self._buffer_bytes = buffer_bytes
+
+        self._fd = h5py.File(filepath, mode="w")
+        g_data = self._fd.create_group("data", track_order=True)
+        g_offsets = self._fd.create_group("offsets", track_order=True)
+
+        for name, (dtype, row_shape) in self._grouped.items():
+            g_data.create_dataset(
+                name,
+                shape=(0,) + row_shape,
+                dtype=dtype,
+                **_resizable_storage_options(dtype, row_shape, storage),
+            )
+            g_offsets.create_dataset(
+                name,
+                shape=(n_groups + 1,),
+                dtype=np.int64,
+                fillvalue=0,
+                **dataset_storage_options(np.empty(n_groups + 1, dtype=np.int64), storage),
+            )
+
+        for name, dtype in self._linear.items():
+            g_data.create_dataset(
+                name,
+                shape=(n_groups,),
+                dtype=dtype,
+                fillvalue=0,
+                **dataset_storage_options(np.empty(n_groups, dtype=dtype), storage),
+            )
+
+        # the next group to be written and the total number of values of each property
+        self._next_group = 0
+        self._n_values = dict.fromkeys(self._grouped, 0)
+        self._n_written = dict.fromkeys(self._grouped, 0)
+
+        self._first_buffered_group = 0
+        self._buffered_nbytes = 0
+        self._buffered_values: Dict[str, List[np.ndarray]] = {name: [] for name in self._grouped}
+        self._buffered_offsets: Dict[str, List[int]] = {name: [] for name in self._grouped}
+        self._buffered_linear: Dict[str, Tuple[List[int], List[Any]]] = {
+            name: ([], []) for name in self._linear
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _advance_to(self, group_index: int) -> None:
+        """Sets the start offsets of the groups up to group_index to the current sizes."""
+        n_skipped = group_index - self._next_group
+        for name, offsets in self._buffered_offsets.items():
+            offsets.extend([self._n_values[name]] * n_skipped)
+        self._next_group = group_index
+
+    def append(self, group_index: int, **values: Any) -> None:
+        """Appends the values of the group with group_index.
+
+        Args:
+            group_index: The index of the group, larger than the one of the previous group.
+            values: The values of each grouped and linear property of the group.
+        """
+        if not self._next_group <= group_index < self._n_groups:
+            raise NGVError(
+                f"Group {group_index} is not in the range [{self._next_group}, {self._n_groups}). "
+                "The groups must be appended in increasing order."
+            )
+
+        self._advance_to(group_index)
+
+        for name, (dtype, row_shape) in self._grouped.items():
+            group_values = np.asarray(values[name], dtype=dtype).reshape((-1,) + row_shape)
+            self._buffered_offsets[name].append(self._n_values[name])
+            self._buffered_values[name].append(group_values)
+            self._n_values[name] += len(group_values)
+            self._buffered_nbytes += group_values.nbytes
+
+        for name, (indices, linear_values) in self._buffered_linear.items():
+            indices.append(group_index)
+            linear_values.append(values[name])
+
+        self._next_group = group_index + 1
+
+        if self._buffered_nbytes >= self._buffer_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered groups to the file."""
+        g_data = self._fd["data"]
+        g_offsets = self._fd["offsets"]
+
+        for name, (_, row_shape) in self._grouped.items():
+            beg, end = self._n_written[name], self._n_values[name]
+            if end > beg:
+                dataset = g_data[name]
+                dataset.resize((end,) + row_shape)
+                dataset[beg:end] = np.concatenate(self._buffered_values[name])
+                self._n_written[name] = end
+
+            offsets = self._buffered_offsets[name]
+            if offsets:
+                g_offsets[name][
+                    self._first_buffered_group : self._first_buffered_group + len(offsets)
+                ] = offsets
+
+            self._buffered_values[name] = []
+            self._buffered_offsets[name] = []
+
+        for name, (indices, linear_values) in self._buffered_linear.items():
+            if indices:
+                beg, end = indices[0], indices[-1] + 1
+                block = np.zeros(end - beg, dtype=self._linear[name])
+                block[np.asarray(indices) - beg] = linear_values
+                g_data[name][beg:end] = block
+            self._buffered_linear[name] = ([], [])
+
+        self._first_buffered_group = self._next_group
+        self._buffered_nbytes = 0
+
+    def close(self) -> None:
+        """Writes the offsets of the remaining groups and the buffered values, and closes the
+        file."""
+        if not self._fd:
+            return
+
+        # the end offset of the last group and the start ones of the groups that were not written
+        self._advance_to(self._n_groups + 1)
+        self.flush()
+        self._fd.close()
 
 
 def export_microdomains(
-    filename: Path, domains: Iterable[Microdomain], scaling_factors: np.ndarray
+    filename: Path,
+    domains: Iterable[Microdomain],
+    scaling_factors: np.ndarray,
+    storage: Optional[Dict[str, Any]] = None,
 ) -> None:
     """Export microdomain tessellation structure
 
@@ -140,6 +469,7 @@ def export_microdomains(
         domains: Microdomain iterable
         scaling_factors: The scaling factors that were used to scale the domains and make them
             overlapping.
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
 
     Notes:
         HDF5 Layout Hierarchy:
@@ -200,70 +530,134 @@ def export_microdomains(
 
     properties["scaling_factors"] = {"values": scaling_factors.astype(np.float64), "offsets": None}
 
-    export_grouped_properties(filename, properties)
+    export_grouped_properties(filename, properties, storage)
 
 
-def export_endfeet_meshes(filename: Path, endfeet: Iterator[EndfootMesh], n_endfeet: int) -> None:
+def export_endfeet_meshes(
+    filename: Path,
+    endfeet: Iterator[EndfootMesh],
+    n_endfeet: int,
+    storage: Optional[Dict[str, Any]] = None,
+) -> None:
     """Export endfeet meshes as grouped properties
 
     Args:
         filename: Output file path.
-        endfeet: Iterable of EndfootMesh instances.
+        endfeet: Iterable of EndfootMesh instances, in increasing index order.
         n_endfeet: The size of the endfeet iterable.
-    """
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
 
-    property_dtypes = {
-        "points": np.float32,
-        "triangles": np.int64,
-        "surface_area": np.float32,
-        "unreduced_surface_area": np.float32,
-        "surface_thickness": np.float32,
-    }
+    Notes:
+        The endfeet are streamed to the file, therefore they are not kept in memory.
+    """
 
-    properties: Dict[str, Dict[str, Any]] = {
-        "points": {
-            "values": [[] for _ in range(n_endfeet)],
-            "offsets": np.zeros(n_endfeet + 1, dtype=np.int64),
-        },
-        "triangles": {
-            "values": [[] for _ in range(n_endfeet)],
-            "offsets": np.zeros(n_endfeet + 1, dtype=np.int64),
-        },
-        "surface_area": {
-            "values": np.zeros(n_endfeet, dtype=property_dtypes["surface_area"]),
-            "offsets": None,
+    with GroupedPropertiesWriter(
+        filename,
+        n_endfeet,
+        grouped_properties={"points": (np.float32, (3,)), "triangles": (np.int64, (3,))},
+        linear_properties={
+            "surface_area": np.float32,
+            "unreduced_surface_area": np.float32,
+            "surface_thickness": np.float32,
         },
-        "unreduced_surface_area": {
-            "values": np.zeros(n_endfeet, dtype=property_dtypes["unreduced_surface_area"]),
-            "offsets": None,
-        },
-        "surface_thickness": {
-            "values": np.zeros(n_endfeet, dtype=property_dtypes["surface_thickness"]),
-            "offsets": None,
+        storage=storage,
+    ) as writer:
+        for endfoot in endfeet:
+            writer.append(
+                endfoot.index,
+                points=endfoot.points,
+                triangles=endfoot.triangles,
+                surface_area=endfoot.area,
+                unreduced_surface_area=endfoot.unreduced_area,
+                surface_thickness=endfoot.thickness,
+            )
+
+
+def export_endfeet_mesh_references(
+    filename: Path,
+    endfeet: Iterator[EndfootMesh],
+    n_endfeet: int,
+    vasculature_mesh_path: Path,
+    storage: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Export endfeet meshes as references into the vasculature surface mesh.
+
+    Instead of copying the points and triangles of each endfoot, only the ids of the
+    vasculature mesh triangles that each endfoot occupies are stored. The local endfeet meshes
+    are reconstructed from the vasculature mesh when accessed via EndfootSurfaceMeshes.
+
+    Args:
+        filename: Output file path.
+        endfeet: Iterable of EndfootMesh instances, with vasculature_triangle_ids, in
+            increasing index order.
+        n_endfeet: The size of the endfeet iterable.
+        vasculature_mesh_path: Path to the vasculature mesh the triangle ids refer to.
+        storage: Chunking and compression of the datasets. See dataset_storage_options.
+
+    Notes:
+        HDF5 Layout Hierarchy:
+            attrs:
+                vasculature_mesh_path: Absolute path to the vasculature mesh.
+                vasculature_mesh_checksum: sha256 digest of the vasculature mesh file.
+            data:
+                vasculature_triangle_ids: array[int64, (N,)]
+                surface_area: array[float32, (G,)]
+                unreduced_surface_area: array[float32, (G,)]
+                surface_thickness: array[float32, (G,)]
+            offsets:
+                vasculature_triangle_ids: array[int64, (G + 1,)]
+    """
+    from archngv.utils.generics import file_checksum
+
+    with GroupedPropertiesWriter(
+        filename,
+        n_endfeet,
+        grouped_properties={"vasculature_triangle_ids": (np.int64, ())},
+        linear_properties={
+            "surface_area": np.float32,
+            "unreduced_surface_area": np.float32,
+            "surface_thickness": np.float32,
         },
-    }
+        storage=storage,
+    ) as writer:
+        for endfoot in endfeet:
+            if endfoot.vasculature_triangle_ids is None:
+                raise NGVError(f"Endfoot {endfoot.index} has no vasculature triangle ids.")
 
-    # it is not guaranteed that endfoot index in consecutive
-    for endfoot in endfeet:
-        endfoot_index = endfoot.index
+            writer.append(
+                endfoot.index,
+                vasculature_triangle_ids=endfoot.vasculature_triangle_ids,
+                surface_area=endfoot.area,
+                unreduced_surface_area=endfoot.unreduced_area,
+                surface_thickness=endfoot.thickness,
+            )
 
-        properties["points"]["values"][endfoot_index] = endfoot.points
-        properties["triangles"]["values"][endfoot_index] = endfoot.triangles
+    with h5py.File(filename, mode="r+") as f:
+        f.attrs["vasculature_mesh_path"] = str(Path(vasculature_mesh_path).resolve())
+        f.attrs["vasculature_mesh_checksum"] = file_checksum(vasculature_mesh_path)
 
-        properties["unreduced_surface_area"]["values"][endfoot_index] = endfoot.unreduced_area
-        properties["surface_area"]["values"][endfoot_index] = endfoot.area
-        properties["surface_thickness"]["values"][endfoot_index] = endfoot.thickness
 
-    for name in ("points", "triangles"):
-        properties[name]["offsets"][1:] = np.cumsum(
-            [len(points) for points in properties[name]["values"]]
-        )
+def export_vasculature_surface_mesh(filename: Path, mesh: VasculatureSurfaceMesh) -> None:
+    """Export the vasculature surface mesh with its precomputed adjacency and triangle areas.
+
+    The datasets are contiguous and uncompressed so that VasculatureSurfaceMesh.load can memory
+    map them.
 
-        properties[name]["values"] = np.vstack(
-            [points for points in properties[name]["values"] if len(points) > 0]
-        ).astype(property_dtypes[name])
+    Args:
+        filename: Output file path.
+        mesh: The vasculature surface mesh.
 
-    export_grouped_properties(filename, properties)
+    Notes:
+        HDF5 Layout Hierarchy:
+            points: array[float64, (N, 3)]
+            triangles: array[int64, (M, 3)]
+            neighbors: array[int64, (K,)]
+            neighbors_offsets: array[int64, (N + 1,)]
+            triangle_areas: array[float64, (M,)]
+    """
+    with h5py.File(filename, mode="w") as f:
+        for name in ("points", "triangles", "neighbors", "neighbors_offsets", "triangle_areas"):
+            f.create_dataset(name, data=getattr(mesh, name))
 
 
 def export_endfoot_mesh(endfoot_coordinates, endfoot_triangles, filepath):
@@ -7,7 +7,9 @@ import logging
 
 import numpy as np
 
+from archngv.core.datasets import PackedEndfootMeshes
 from archngv.utils.projections import vectorized_scalar_projection
+from archngv.utils.segmented import offsets_from_counts, reduce_segments
 
 L = logging.getLogger(__name__)
 
@@ -94,23 +96,90 @@ def create_endfeet_compartment_data(vasculature_segments, targets, area_meshes):
         f"Area meshes         : {area_meshes}"
     )
 
-    lengths = np.zeros(len(targets), dtype=np.float32)
-    diameters = np.zeros(len(targets), dtype=np.float32)
-    perimeters = np.zeros(len(targets), dtype=np.float32)
+    if len(area_meshes) == 0:
+        points = np.empty((0, 3), dtype=np.float32)
+    else:
+        points = np.concatenate([np.reshape(mesh.points, (-1, 3)) for mesh in area_meshes])
+
+    return create_packed_endfeet_compartment_data(
+        vasculature_segments,
+        targets,
+        PackedEndfootMeshes(
+            indices=np.array([mesh.index for mesh in area_meshes], dtype=np.int64),
+            points=points,
+            points_offsets=offsets_from_counts([len(mesh.points) for mesh in area_meshes]),
+            triangles=np.empty((0, 3), dtype=np.int64),
+            triangles_offsets=offsets_from_counts([len(mesh.triangles) for mesh in area_meshes]),
+            area=np.array([mesh.area for mesh in area_meshes]),
+            unreduced_area=np.array([mesh.unreduced_area for mesh in area_meshes]),
+            thickness=np.array([mesh.thickness for mesh in area_meshes]),
+        ),
+    )
+
 
-    for i, (segment, target, mesh) in enumerate(zip(vasculature_segments, targets, area_meshes)):
-        if len(mesh.triangles) == 0:
-            L.info("Endfoot %d has no triangles. Mesh has not been grown.", mesh.index)
-            continue
+def create_packed_endfeet_compartment_data(vasculature_segments, targets, packed_meshes):
+    """Creates the endfeet compartment data of create_endfeet_compartment_data for the
+    meshes packed in contiguous arrays, in one pass over all the endfeet.
 
-        lengths[i] = _extent_across_vasculature_segment_medial_axis(mesh.points, target, segment)
+    The extents across the medial axes are segmented reductions of the projections of all the
+    mesh points, therefore neither the morphologies nor the per endfoot meshes are needed.
 
-        if np.isclose(lengths[i], 0.0):
-            L.info("Endfoot %d length is zero.", mesh.index)
-            continue
+    Args:
+        vasculature_segments (np.ndarray): (N, 2, 3) Vasculature segments corresponding to
+            each endfoot
+        targets (np.ndarray): (N, 3) Reference points on the surface of the vasculature
+            corresponding to the starting points of the endfeet
+        packed_meshes (PackedEndfootMeshes): The meshes of the N endfeet. Only the points,
+            the offsets, the areas and the thicknesses are used.
 
-        diameters[i], perimeters[i] = _endfoot_compartment_features(
-            lengths[i], mesh.area, mesh.thickness
+    Returns:
+        tuple:
+            lengths (np.ndarray): (N,) Compartment lengths
+            diameters (np.ndarray): (N,) Compartment diameters
+            perimeters (np.ndarray): (N,) Compartment perimeters
+    """
+    n_endfeet = len(packed_meshes)
+    assert len(vasculature_segments) == len(targets) == n_endfeet, (
+        f"Vasculature Segments: {len(vasculature_segments)}, "
+        f"Endfeet targets: {len(targets)}, "
+        f"Area meshes: {n_endfeet}"
+    )
+
+    vasculature_segments = np.asarray(vasculature_segments, dtype=np.float64).reshape(-1, 2, 3)
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 3)
+
+    directions = vasculature_segments[:, 1] - vasculature_segments[:, 0]
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+
+    # the scalar projection of each point, relative to its target, on its segment direction
+    counts = np.diff(packed_meshes.points_offsets)
+    projections = (np.repeat(directions, counts, axis=0) * packed_meshes.points).sum(axis=1)
+    projections -= np.repeat((directions * targets).sum(axis=1), counts)
+
+    lengths = (
+        reduce_segments(np.maximum, projections, packed_meshes.points_offsets)
+        - reduce_segments(np.minimum, projections, packed_meshes.points_offsets)
+    ).astype(np.float32)
+
+    has_triangles = np.diff(packed_meshes.triangles_offsets) > 0
+    lengths[~has_triangles] = 0.0
+
+    if not has_triangles.all():
+        L.info(
+            "Endfeet %s have no triangles. Meshes have not been grown.",
+            packed_meshes.indices[~has_triangles],
         )
 
+    mask = has_triangles & ~np.isclose(lengths, 0.0)
+
+    if not np.array_equal(mask, has_triangles):
+        L.info("Endfeet %s length is zero.", packed_meshes.indices[has_triangles & ~mask])
+
+    diameters = np.zeros(n_endfeet, dtype=np.float32)
+    perimeters = np.zeros(n_endfeet, dtype=np.float32)
+
+    diameters[mask], perimeters[mask] = _endfoot_compartment_features(
+        lengths[mask], packed_meshes.area[mask], packed_meshes.thickness[mask]
+    )
+
     return lengths, diameters, perimeters
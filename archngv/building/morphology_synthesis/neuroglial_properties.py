@@ -4,34 +4,39 @@
 following synthesis
 """
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
-
-from archngv.app.utils import readonly_morphology
+import pandas as pd
+
+from archngv.app.utils import (
+    TASK_CHUNK_SIZE,
+    apply_parallel_function,
+    chunk_ranges,
+    readonly_morphology,
+)
 from archngv.building.morphology_synthesis.annotation import annotate_synapse_location
-from archngv.core.datasets import NeuroglialConnectivity, NeuronalConnectivity
-
-if TYPE_CHECKING:
-    from pandas import DataFrame
+from archngv.core.datasets import CellData, NeuroglialConnectivity, NeuronalConnectivity
 
-    from archngv.core.datastructures import CellData
+# the datasets opened once by each worker process, see _init_worker
+_WORKER_STATE: Dict[str, Any] = {}
 
 
 def astrocyte_morphology_properties(
     seed: int,
-    astrocytes: "CellData",
     n_connections: int,
     paths: Dict[str, Path],
-    map_function=map,
+    n_workers: int = 1,
+    chunk_size: int = TASK_CHUNK_SIZE,
 ) -> Dict[str, np.ndarray]:
     """
     Args:
         seed: Random generator's seed
-        astrocytes: node population of astrocytes
         n_connections: number of astrocyte-neuron connections
-        paths: dictionary with paths
-        map_func: parallelization function
+        paths: dictionary with the paths of the 'astrocytes', 'neuroglial_connectivity' and
+            'synaptic_data' datasets and of the 'morph_dir'
+        n_workers: Number of processes, -1 for all the cores
+        chunk_size: Number of astrocytes processed by each task
 
     Returns:
         A dict mapping string keys to numpy arrays. The following keys are returned:
@@ -41,6 +46,11 @@ def astrocyte_morphology_properties(
                 astrocyte segment id associated with each connected synapse
             - astrocyte_segment_offset: Array of floats corresponding
                 to the segment offset associated with each connected synapse
+
+    Notes:
+        The tasks carry only ranges of astrocyte ids. The workers open the datasets once and
+        return the properties of each chunk as arrays. Each astrocyte is seeded on its own,
+        therefore the result is the same for any number of workers and chunk size.
     """
     properties = {
         "astrocyte_section_id": np.empty(n_connections, dtype=np.uint32),
@@ -52,65 +62,90 @@ def astrocyte_morphology_properties(
         "astrocyte_center_z": np.empty(n_connections, dtype=np.float32),
     }
 
-    it_results = filter(
-        lambda result: result is not None,
-        map_function(NeuroglialWorker(seed), _dispatch_neuroglial_data(astrocytes, paths)),
+    it_results = apply_parallel_function(
+        _properties_from_chunk,
+        chunk_ranges(len(CellData(paths["astrocytes"])), chunk_size),
+        initializer=_init_worker,
+        initargs=(seed, paths),
+        finalizer=_WORKER_STATE.clear,
+        n_workers=n_workers,
     )
 
-    for ids, df_locations in it_results:
-        properties["astrocyte_section_id"][ids] = df_locations.section_id
-        properties["astrocyte_segment_id"][ids] = df_locations.segment_id
-        properties["astrocyte_segment_offset"][ids] = df_locations.segment_offset
-        properties["astrocyte_section_pos"][ids] = df_locations.section_position
-        properties["astrocyte_center_x"][ids] = df_locations.x
-        properties["astrocyte_center_y"][ids] = df_locations.y
-        properties["astrocyte_center_z"][ids] = df_locations.z
+    for ids, section_ids, segment_ids, segment_offsets, section_positions, centers in it_results:
+        properties["astrocyte_section_id"][ids] = section_ids
+        properties["astrocyte_segment_id"][ids] = segment_ids
+        properties["astrocyte_segment_offset"][ids] = segment_offsets
+        properties["astrocyte_section_pos"][ids] = section_positions
+        properties["astrocyte_center_x"][ids] = centers[:, 0]
+        properties["astrocyte_center_y"][ids] = centers[:, 1]
+        properties["astrocyte_center_z"][ids] = centers[:, 2]
 
     return properties
 
 
-class NeuroglialWorker:
-    """Neuroglial properties helper"""
-
-    def __init__(self, seed: int):
-        self._seed = seed
-
-    def __call__(self, data: Dict[str, Any]) -> Optional[Tuple[np.ndarray, "DataFrame"]]:
-        seed = hash((self._seed, data["index"])) % (2**32)
-        np.random.seed(seed)
+def _init_worker(seed: int, paths: Dict[str, Path]) -> None:
+    """Opens the datasets once per worker process."""
+    astrocytes = CellData(paths["astrocytes"])
 
-        return _properties_from_astrocyte(data)
-
-
-def _dispatch_neuroglial_data(
-    astrocytes: "CellData", paths: Dict[str, Path]
-) -> Iterator[Dict[str, Any]]:
-    """Dispatches data to parallel workers"""
-    for astro_id in range(len(astrocytes)):
-        morphology_name = astrocytes.get_property("morphology", ids=astro_id)[0]
-        morphology_path = str(Path(paths["morph_dir"], morphology_name + ".h5"))
-        morphology_pos = astrocytes.positions(index=astro_id)[0]
-
-        data = {
-            "index": astro_id,
-            "morphology_path": morphology_path,
-            "morphology_position": morphology_pos,
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(
+        {
+            "seed": seed,
+            "morph_dir": paths["morph_dir"],
+            "morphology_names": astrocytes.get_property("morphology"),
+            "morphology_positions": astrocytes.positions(),
+            "neuroglial_connectivity": NeuroglialConnectivity(paths["neuroglial_connectivity"]),
+            "synaptic_data": NeuronalConnectivity(paths["synaptic_data"]),
         }
+    )
 
-        data.update(paths)
 
-        yield data
+def _properties_from_chunk(chunk: Tuple[int, int]) -> Tuple[np.ndarray, ...]:
+    """Processes the astrocytes in the [beg, end) chunk.
 
+    Returns:
+        The concatenated connection ids, section ids, segment ids, segment offsets, section
+        positions and (N, 3) segment centers of the astrocytes in the chunk.
+    """
+    beg, end = chunk
+    seed = _WORKER_STATE["seed"]
+
+    connection_ids, locations = [], []
+    for astrocyte_index in range(beg, end):
+        np.random.seed(hash((seed, astrocyte_index)) % (2**32))
+        result = _properties_from_astrocyte(astrocyte_index)
+
+        if result is not None:
+            connection_ids.append(result[0])
+            locations.append(result[1])
+
+    if not connection_ids:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.uint32),
+            np.empty(0, dtype=np.uint32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty((0, 3), dtype=np.float32),
+        )
+
+    locations = pd.concat(locations, ignore_index=True)
+    return (
+        np.concatenate(connection_ids).astype(np.int64, copy=False),
+        locations["section_id"].to_numpy(dtype=np.uint32),
+        locations["segment_id"].to_numpy(dtype=np.uint32),
+        locations["segment_offset"].to_numpy(dtype=np.float32),
+        locations["section_position"].to_numpy(dtype=np.float32),
+        locations[["x", "y", "z"]].to_numpy(dtype=np.float32),
+    )
 
-def _properties_from_astrocyte(data: dict) -> Optional[Tuple[np.ndarray, "DataFrame"]]:
+
+def _properties_from_astrocyte(astrocyte_index: int) -> Optional[Tuple[np.ndarray, pd.DataFrame]]:
     """Processes one astrocyte and returns annotation properties
+
     Args:
-        data: Dictionary with the following keys
-            - index: astrocyte index
-            - neurogial_connectivity: Path to ng connectivity sonata file
-            - synaptic_data: Path to synaptic data sonata file
-            - morphology_path: Path to morphology h5 file
-            - morphology_position: Coordinates of morphology soma position
+        astrocyte_index: The astrocyte id, whose data are taken from the datasets opened by
+            the worker initializer.
 
     Returns:
         A tuple (connections_ids, locations_dataframe) where connection_ids are the
@@ -127,20 +162,21 @@ def _properties_from_astrocyte(data: dict) -> Optional[Tuple[np.ndarray, "DataFr
         neuron pair can be present multiple times. because an astrocyte may encapsulate
         multiple synapses of the same neuron.
     """
-    astrocyte_index = data["index"]
-
-    ng_connectivity = NeuroglialConnectivity(data["neuroglial_connectivity"])
+    ng_connectivity = _WORKER_STATE["neuroglial_connectivity"]
     connection_ids = ng_connectivity.astrocyte_neuron_connections(astrocyte_index)
 
     if connection_ids.size == 0:
         return None
 
     synapse_ids = ng_connectivity.neuronal_synapses(connection_ids)
+    synapse_positions = _WORKER_STATE["synaptic_data"].synapse_positions(synapse_ids)
 
-    synaptic_data = NeuronalConnectivity(data["synaptic_data"])
-    synapse_positions = synaptic_data.synapse_positions(synapse_ids)
-
-    morphology = readonly_morphology(data["morphology_path"], data["morphology_position"])
+    morphology_path = Path(
+        _WORKER_STATE["morph_dir"], _WORKER_STATE["morphology_names"][astrocyte_index] + ".h5"
+    )
+    morphology = readonly_morphology(
+        str(morphology_path), _WORKER_STATE["morphology_positions"][astrocyte_index]
+    )
     locations_dataframe = annotate_synapse_location(morphology, synapse_positions)
 
     return connection_ids, locations_dataframe
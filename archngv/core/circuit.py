@@ -20,6 +20,7 @@ from libsonata import NodeStorage
 
 from archngv.core.constants import Population
 from archngv.core.datasets import Microdomains
+from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
 from archngv.exceptions import NGVError
 
 
@@ -182,7 +183,7 @@ class Vasculature(NGVNodes):
         This class adds the extra objects needed for the vasculature to the NGVNodes. The extras
         are the initial vasculature moprhological file one can use through the
         Vasculature.morphology API. The vasculature's meshes are also available from the
-        Vasculature.surface_mesh API.
+        Vasculature.surface_mesh and Vasculature.surface_mesh_arrays APIs.
     """
 
     @cached_property
@@ -211,6 +212,22 @@ class Vasculature(NGVNodes):
         """Returns vasculature surface mesh object."""
         return trimesh.load(self.config["vasculature_mesh"])
 
+    @cached_property
+    def surface_mesh_arrays(self):
+        """Returns the vasculature surface mesh arrays with their vertex adjacency.
+
+        Returns:
+            VasculatureSurfaceMesh: Memory mapped from the surface mesh cache of the circuit if
+                it is available, else created from the mesh file. The vertex and triangle order
+                is the same in both cases.
+        """
+        cache_path = self.config.get("vasculature_mesh_cache", None)
+
+        if cache_path is not None and Path(cache_path).exists():
+            return VasculatureSurfaceMesh.load(cache_path)
+
+        return VasculatureSurfaceMesh.from_mesh_file(self.config["vasculature_mesh"])
+
 
 class Neurons(NGVNodes):
     """Neurons node population."""
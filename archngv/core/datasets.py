@@ -2,6 +2,8 @@
 
 """Archngv dataset classes."""
 import collections.abc
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
@@ -11,11 +13,18 @@ import numpy as np
 from cached_property import cached_property
 
 from archngv.core.sonata_readers import EdgesReader, NodesReader
+from archngv.core.vasculature_mesh import VasculatureSurfaceMesh, local_meshes_from_references
 from archngv.exceptions import NGVError
 from archngv.spatial import ConvexPolygon
 
 DOMAIN_TRIANGLE_TYPE: Dict[str, Union[int, slice]] = {"polygon_id": 0, "vertices": slice(1, 4)}
 
+# number of queries that are resolved together in the microdomain point-location queries
+DOMAIN_QUERY_BLOCK_SIZE = 8192
+
+# number of groups that are read together when iterating over grouped properties
+GROUP_ITERATION_BATCH_SIZE = 4096
+
 
 class CellData(NodesReader):
     """Cell population information"""
@@ -150,6 +159,11 @@ class H5ContextManager:
     def __init__(self, filepath):
         self._fd = h5py.File(filepath, "r")
 
+    @property
+    def filepath(self) -> str:
+        """Returns the path of the hdf5 file"""
+        return self._fd.filename
+
     def close(self):
         """Close hdf5 file"""
         self._fd.close()
@@ -239,6 +253,181 @@ class GroupedProperties(H5ContextManager):
 
         return self._get_data_slice(property_name, group_index)
 
+    def get_groups(
+        self, property_name: str, group_indices: Iterable[Union[int, np.integer]]
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Returns the values of multiple groups packed in a single array.
+
+        Args:
+            property_name: The name of the property to retrieve.
+            group_indices: The indices of the groups to retrieve, in any order.
+
+        Returns:
+            values: The concatenated values of the groups, in the order of group_indices.
+            offsets: array[int64, (N + 1,)] so that the values of the i-th requested group are
+                values[offsets[i]: offsets[i + 1]]. It is None for properties with one value per
+                group, in which case the i-th value corresponds to the i-th requested group.
+
+        Note:
+            The groups are read in ascending order and adjacent groups are merged into a
+            single contiguous read, which minimizes the number of hdf5 requests.
+        """
+        from archngv.utils.segmented import expand_ranges, offsets_from_counts
+
+        group_indices = np.asarray(group_indices, dtype=np.int64).ravel()
+        dataset = self._data[property_name]
+
+        unique_indices, inverse = np.unique(group_indices, return_inverse=True)
+
+        # no offsets -> one property per group
+        if property_name not in self._offsets:
+            values = _read_ranges(dataset, unique_indices, unique_indices + 1)
+            return values[inverse], None
+
+        if len(unique_indices) == 0:
+            return dataset[0:0], np.zeros(1, dtype=np.int64)
+
+        # read the span of offsets that covers all the requested groups at once
+        span_beg = unique_indices[0]
+        offsets = self._offsets[property_name][span_beg : unique_indices[-1] + 2]
+
+        starts = offsets[unique_indices - span_beg].astype(np.int64)
+        counts = offsets[unique_indices - span_beg + 1].astype(np.int64) - starts
+
+        values = _read_ranges(dataset, starts, starts + counts)
+
+        # the unique groups are packed in values, gather them in the requested order
+        packed_starts = offsets_from_counts(counts)[:-1]
+        counts = counts[inverse]
+
+        return (
+            values[expand_ranges(packed_starts[inverse], counts)],
+            offsets_from_counts(counts),
+        )
+
+    def _get_grouped_values(
+        self, property_name: str, group_indices: Iterable[Union[int, np.integer]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Same as get_groups, for properties with multiple values per group.
+
+        Raises:
+            NGVError: If the property has one value per group.
+        """
+        values, offsets = self.get_groups(property_name, group_indices)
+
+        if offsets is None:
+            raise NGVError(f"Property '{property_name}' has one value per group.")
+
+        return values, offsets
+
+    def _read_block(
+        self, property_names: List[str], beg: int, end: int
+    ) -> Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """Reads the values of the groups [beg, end) of each property in one contiguous read.
+
+        Returns:
+            A dictionary with the property names as keys and the (values, offsets) of the block
+            as values. The offsets are relative to the beginning of the block, or None for
+            properties with one value per group.
+        """
+        block = {}
+        for name in property_names:
+            if name in self._offsets:
+                offsets = self._offsets[name][beg : end + 1].astype(np.int64)
+                values = self._data[name][offsets[0] : offsets[-1]]
+                block[name] = (values, offsets - offsets[0])
+            else:
+                block[name] = (self._data[name][beg:end], None)
+        return block
+
+    def _iter_blocks(
+        self, property_names: List[str], batch_size: int, prefetch: bool
+    ) -> Iterator[Tuple[int, Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]]]]:
+        """Yields the number of groups and the data of consecutive blocks of batch_size groups.
+
+        If prefetch is True, the next block is read in a background thread while the current
+        one is consumed.
+        """
+        # the number of groups of the first property
+        name = property_names[0]
+        if name in self._offsets:
+            n_groups = len(self._offsets[name]) - 1
+        else:
+            n_groups = len(self._data[name])
+
+        ranges = [(beg, min(beg + batch_size, n_groups)) for beg in range(0, n_groups, batch_size)]
+
+        if not prefetch:
+            for beg, end in ranges:
+                yield end - beg, self._read_block(property_names, beg, end)
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = None
+            for i, (beg, end) in enumerate(ranges):
+                if future is None:
+                    future = executor.submit(self._read_block, property_names, beg, end)
+
+                block = future.result()
+
+                future = (
+                    executor.submit(self._read_block, property_names, *ranges[i + 1])
+                    if i + 1 < len(ranges)
+                    else None
+                )
+
+                yield end - beg, block
+
+    def iter_groups(
+        self,
+        property_names: Optional[List[str]] = None,
+        batch_size: int = GROUP_ITERATION_BATCH_SIZE,
+        prefetch: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        """Iterates sequentially over all the groups.
+
+        Instead of one read per group, the datasets are read in contiguous blocks of batch_size
+        groups, which makes full scans bandwidth-bound instead of latency-bound.
+
+        Args:
+            property_names: The properties to retrieve. Default is all of them.
+            batch_size: The number of groups in each block.
+            prefetch: If True, the next block is read in a background thread.
+
+        Yields:
+            A dictionary with the property names as keys and the values of the group, as
+            returned by `get`, as values. The arrays are views into the block.
+        """
+        if property_names is None:
+            property_names = self.property_names
+
+        for n_block_groups, block in self._iter_blocks(property_names, batch_size, prefetch):
+            for i in range(n_block_groups):
+                yield {
+                    name: values[i] if offsets is None else values[offsets[i] : offsets[i + 1]]
+                    for name, (values, offsets) in block.items()
+                }
+
+
+def _read_ranges(dataset: h5py.Dataset, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Returns the concatenation of dataset[starts[i]: ends[i]].
+
+    The ranges must be sorted and not overlapping. Consecutive ranges that touch each other
+    are merged so that they are read in a single request.
+    """
+    mask = ends > starts
+    starts, ends = starts[mask], ends[mask]
+
+    if len(starts) == 0:
+        return dataset[0:0]
+
+    breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+
+    run_starts = starts[np.r_[0, breaks]]
+    run_ends = ends[np.r_[breaks - 1, len(ends) - 1]]
+
+    return np.concatenate([dataset[beg:end] for beg, end in zip(run_starts, run_ends)])
+
 
 TObject = TypeVar("TObject")
 
@@ -280,8 +469,8 @@ class Microdomains(GroupedProperties):
 
     def __iter__(self) -> Iterator[Microdomain]:
         """Microdomain object iterator."""
-        for i in range(self.n_microdomains):
-            yield self.domain_object(i)
+        for group in self.iter_groups(["points", "triangle_data", "neighbors"]):
+            yield Microdomain(group["points"], group["triangle_data"], group["neighbors"])
 
     def __getitem__(self, key: OneOrIterable[np.integer]) -> OneOrList[Microdomain]:
         """List getter."""
@@ -342,16 +531,199 @@ class Microdomains(GroupedProperties):
     @cached_property
     def connectivity(self) -> np.ndarray:
         """Returns the connectivity of the microdomains."""
-        edges = [
-            (cid, nid)
-            for cid in range(self.n_microdomains)
-            for nid in self.domain_neighbors(cid, omit_walls=True)
-        ]
+        from archngv.utils.segmented import segment_ids
+
+        neighbors = self.get("neighbors")
+        edges = np.column_stack((segment_ids(self._offsets["neighbors"][:]), neighbors))
+        edges = edges[neighbors >= 0]
+
         # sort by column [2 3 1] -> [1 2 3]
         sorted_by_column = np.sort(edges, axis=1)
         # take the unique rows
         return np.unique(sorted_by_column, axis=0)
 
+    @cached_property
+    def domain_bounds(self) -> np.ndarray:
+        """Returns the axis aligned bounding boxes of all the microdomains.
+
+        Returns:
+            array[float, (N, 6)]: [xmin, ymin, zmin, xmax, ymax, zmax] for each domain.
+        """
+        points = self.get("points")
+        beg_offsets = self._offsets["points"][:-1]
+
+        return np.column_stack(
+            (np.minimum.reduceat(points, beg_offsets), np.maximum.reduceat(points, beg_offsets))
+        )
+
+    @cached_property
+    def _domain_faces(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the face points, the outward face normals and the face offsets of all the
+        domains, in the global index space.
+        """
+        from archngv.utils.linear_algebra import rowwise_dot
+        from archngv.utils.ngons import (
+            vectorized_consecutive_triangle_vectors,
+            vectorized_triangle_normal,
+        )
+        from archngv.utils.segmented import segment_ids
+
+        points = self.get("points")
+        point_offsets = self._offsets["points"][:]
+        triangle_offsets = self._offsets["triangle_data"][:]
+
+        triangle_domains = segment_ids(triangle_offsets)
+
+        # local to global vertex indices
+        triangles = self.get("triangle_data")[:, DOMAIN_TRIANGLE_TYPE["vertices"]]
+        triangles = triangles + point_offsets[triangle_domains, np.newaxis]
+
+        centroids = np.add.reduceat(points, point_offsets[:-1]) / np.diff(point_offsets)[:, None]
+
+        face_points = points[triangles[:, 0]]
+        face_normals = vectorized_triangle_normal(
+            *vectorized_consecutive_triangle_vectors(points, triangles)
+        )
+
+        # flip the normals that point towards the inside of the domain
+        signed_dist = rowwise_dot(face_points - centroids[triangle_domains], face_normals)
+        face_normals[(signed_dist < 0.0) & ~np.isclose(signed_dist, 0.0)] *= -1.0
+
+        return face_points, face_normals, triangle_offsets
+
+    @cached_property
+    def _bounding_box_index(self) -> Tuple[Any, float]:
+        """Returns a kd-tree of the centers of the domain bounding boxes and the maximum
+        half diagonal of the boxes.
+
+        A point inside a bounding box is closer to its center than the half diagonal. Therefore,
+        a radius query with the maximum half diagonal returns all the candidate boxes.
+        """
+        from scipy.spatial import cKDTree
+
+        bounds = self.domain_bounds
+        centers = 0.5 * (bounds[:, :3] + bounds[:, 3:])
+        half_diagonals = 0.5 * np.linalg.norm(bounds[:, 3:] - bounds[:, :3], axis=1)
+
+        return cKDTree(centers), float(half_diagonals.max(initial=0.0))
+
+    def _query_boxes(
+        self, centers: np.ndarray, half_extents: Optional[np.ndarray], block_size: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the domains that are not separated from each query box in CSR format.
+
+        The queries are resolved in blocks of block_size so that the pairwise candidate arrays
+        remain bounded in memory.
+        """
+        from archngv.spatial.collision import convex_shapes_with_boxes
+        from archngv.utils.segmented import offsets_from_counts
+
+        tree, max_half_diagonal = self._bounding_box_index
+        bounds = self.domain_bounds
+        face_points, face_normals, face_offsets = self._domain_faces
+
+        n_queries = len(centers)
+        counts = np.zeros(n_queries, dtype=np.int64)
+        result = []
+
+        for beg in range(0, n_queries, block_size):
+            end = min(beg + block_size, n_queries)
+
+            block_centers = centers[beg:end]
+            block_half_extents = None if half_extents is None else half_extents[beg:end]
+
+            radii = np.full(end - beg, fill_value=max_half_diagonal)
+            if block_half_extents is not None:
+                radii += np.linalg.norm(block_half_extents, axis=1)
+
+            candidates = tree.query_ball_point(block_centers, r=radii)
+
+            n_candidates = np.fromiter(map(len, candidates), dtype=np.int64, count=len(candidates))
+            query_ids = np.repeat(np.arange(end - beg, dtype=np.int64), n_candidates)
+            domain_ids = np.fromiter(
+                itertools.chain.from_iterable(candidates),
+                dtype=np.int64,
+                count=n_candidates.sum(),
+            )
+
+            # bounding box overlap
+            query_min = query_max = block_centers[query_ids]
+            if block_half_extents is not None:
+                query_min = query_min - block_half_extents[query_ids]
+                query_max = query_max + block_half_extents[query_ids]
+
+            mask = np.all(
+                (bounds[domain_ids, :3] <= query_max) & (query_min <= bounds[domain_ids, 3:]),
+                axis=1,
+            )
+            query_ids, domain_ids = query_ids[mask], domain_ids[mask]
+
+            # half-space tests against the faces of the candidate domains
+            mask = convex_shapes_with_boxes(
+                face_points,
+                face_normals,
+                face_offsets,
+                domain_ids,
+                block_centers[query_ids],
+                None if block_half_extents is None else block_half_extents[query_ids],
+            )
+            query_ids, domain_ids = query_ids[mask], domain_ids[mask]
+
+            order = np.lexsort((domain_ids, query_ids))
+            result.append(domain_ids[order])
+            counts[beg:end] = np.bincount(query_ids, minlength=end - beg)
+
+        domain_ids = np.concatenate(result) if result else np.empty(0, dtype=np.int64)
+        return domain_ids, offsets_from_counts(counts)
+
+    def domains_containing(
+        self, points: np.ndarray, block_size: int = DOMAIN_QUERY_BLOCK_SIZE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the domains that contain each point.
+
+        Args:
+            points: array[float, (N, 3)]
+            block_size: Number of points that are resolved together.
+
+        Returns:
+            domain_ids: array[int64, (K,)]
+            offsets: array[int64, (N + 1,)]
+
+            The sorted ids of the domains containing the i-th point are
+            domain_ids[offsets[i]: offsets[i + 1]].
+
+        Note:
+            Domains overlap, therefore a point may be contained in more than one domain.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        return self._query_boxes(points, None, block_size)
+
+    def domains_intersecting(
+        self, boxes: np.ndarray, block_size: int = DOMAIN_QUERY_BLOCK_SIZE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the domains that intersect each axis aligned box.
+
+        Args:
+            boxes: array[float, (N, 6)] or array[float, (6,)]
+                [xmin, ymin, zmin, xmax, ymax, zmax] for each box.
+            block_size: Number of boxes that are resolved together.
+
+        Returns:
+            domain_ids: array[int64, (K,)]
+            offsets: array[int64, (N + 1,)]
+
+            The sorted ids of the domains intersecting the i-th box are
+            domain_ids[offsets[i]: offsets[i + 1]].
+
+        Note:
+            The test is conservative: a domain the faces of which do not separate it from a box,
+            but which is only close to the box along one of its edges, is also returned.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        centers = 0.5 * (boxes[:, :3] + boxes[:, 3:])
+        half_extents = 0.5 * (boxes[:, 3:] - boxes[:, :3])
+        return self._query_boxes(centers, half_extents, block_size)
+
     def global_triangles(self) -> np.ndarray:
         """Converts microdomain tessellation to a joined mesh.
 
@@ -423,12 +795,103 @@ class EndfootMesh:
     area: np.float32
     unreduced_area: np.float32
     thickness: np.float32
+    vasculature_triangle_ids: Optional[np.ndarray] = None
+
+
+@dataclass
+class PackedEndfootMeshes:
+    """Multiple endfeet meshes packed in contiguous arrays.
+
+    The points of the i-th mesh are points[points_offsets[i]: points_offsets[i + 1]] and its
+    triangles, which index its points locally, are
+    triangles[triangles_offsets[i]: triangles_offsets[i + 1]]. If vasculature_triangle_ids
+    is available, it is grouped with the same triangles_offsets.
+    """
+
+    indices: np.ndarray
+    points: np.ndarray
+    points_offsets: np.ndarray
+    triangles: np.ndarray
+    triangles_offsets: np.ndarray
+    area: np.ndarray
+    unreduced_area: np.ndarray
+    thickness: np.ndarray
+    vasculature_triangle_ids: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        """Returns the number of meshes."""
+        return len(self.indices)
+
+    def __iter__(self) -> Iterator[EndfootMesh]:
+        """Endfoot mesh object iterator."""
+        for i, index in enumerate(self.indices):
+            t_beg, t_end = self.triangles_offsets[i], self.triangles_offsets[i + 1]
+            yield EndfootMesh(
+                index=int(index),
+                points=self.points[self.points_offsets[i] : self.points_offsets[i + 1]],
+                triangles=self.triangles[t_beg:t_end],
+                area=self.area[i],
+                unreduced_area=self.unreduced_area[i],
+                thickness=self.thickness[i],
+                vasculature_triangle_ids=(
+                    None
+                    if self.vasculature_triangle_ids is None
+                    else self.vasculature_triangle_ids[t_beg:t_end]
+                ),
+            )
 
 
 class EndfootSurfaceMeshes(GroupedProperties):
-    """Access to the endfeet meshes."""
+    """Access to the endfeet meshes.
+
+    The meshes are either stored as copies of their points and triangles, or as references to
+    the triangles of the vasculature mesh (see export_endfeet_mesh_references). In the latter
+    case the local meshes are lazily reconstructed from the vasculature mesh.
+    """
+
+    def __init__(self, filepath, vasculature_mesh_path: Optional[Path] = None):
+        """
+        Args:
+            filepath: Path to the endfeet meshes hdf5 file.
+            vasculature_mesh_path: Path to the vasculature mesh, if it has moved since the
+                references were written. Only used for referenced meshes.
+        """
+        super().__init__(filepath)
+        self._vasculature_mesh_path = vasculature_mesh_path
+
+    @property
+    def is_referenced(self) -> bool:
+        """Returns True if the meshes are stored as references into the vasculature mesh."""
+        return "vasculature_triangle_ids" in self._data
+
+    @cached_property
+    def _vasculature_mesh(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the points and triangles of the referenced vasculature mesh."""
+        from archngv.utils.generics import file_checksum
+
+        filepath = self._vasculature_mesh_path or self._fd.attrs["vasculature_mesh_path"]
+
+        if not Path(filepath).exists():
+            raise NGVError(f"Referenced vasculature mesh {filepath} does not exist.")
+
+        if file_checksum(filepath) != self._fd.attrs["vasculature_mesh_checksum"]:
+            raise NGVError(
+                f"Vasculature mesh {filepath} differs from the one the endfeet refer to."
+            )
+
+        if h5py.is_hdf5(filepath):
+            mesh = VasculatureSurfaceMesh.load(filepath)
+            return mesh.points, mesh.triangles
+
+        import openmesh
+
+        mesh = openmesh.read_trimesh(str(filepath))
+        return mesh.points(), mesh.face_vertex_indices()
 
     def _object(self, index: int) -> EndfootMesh:
+        if self.is_referenced:
+            return next(iter(self.packed_meshes([index])))
+
         return EndfootMesh(
             index=index,
             points=self.mesh_points(index),
@@ -440,17 +903,82 @@ class EndfootSurfaceMeshes(GroupedProperties):
 
     def __getitem__(self, key: OneOrIterable[np.integer]) -> OneOrList[EndfootMesh]:
         """Endfoot mesh object getter."""
+        if isinstance(key, collections.abc.Iterable):
+            return list(self.packed_meshes(key))
         return _apply_callable(self._object, key)
 
     def __iter__(self) -> Iterator[EndfootMesh]:
         """Endfoot iterator."""
-        for index in range(self.__len__()):
-            yield self._object(index)
+        if self.is_referenced:
+            n_endfeet = len(self)
+            for beg in range(0, n_endfeet, GROUP_ITERATION_BATCH_SIZE):
+                end = min(beg + GROUP_ITERATION_BATCH_SIZE, n_endfeet)
+                yield from self.packed_meshes(np.arange(beg, end))
+            return
+
+        groups = self.iter_groups(
+            ["points", "triangles", "surface_area", "unreduced_surface_area", "surface_thickness"]
+        )
+        for index, group in enumerate(groups):
+            yield EndfootMesh(
+                index=index,
+                points=group["points"],
+                triangles=group["triangles"],
+                area=group["surface_area"],
+                unreduced_area=group["unreduced_surface_area"],
+                thickness=group["surface_thickness"],
+            )
 
     def mesh_points(self, endfoot_index: Optional[int] = None) -> np.ndarray:
         """Return the points of the endfoot mesh."""
+        if self.is_referenced:
+            return self.packed_meshes(self._indices(endfoot_index)).points
         return self.get("points", group_index=endfoot_index)
 
     def mesh_triangles(self, endfoot_index: Optional[int] = None) -> np.ndarray:
         """Return the triangles of the endfoot mesh."""
+        if self.is_referenced:
+            return self.packed_meshes(self._indices(endfoot_index)).triangles
         return self.get("triangles", group_index=endfoot_index)
+
+    def _indices(self, endfoot_index: Optional[int]) -> np.ndarray:
+        """Returns all the endfeet indices if endfoot_index is None, else endfoot_index."""
+        if endfoot_index is None:
+            return np.arange(len(self), dtype=np.int64)
+        return np.array([endfoot_index], dtype=np.int64)
+
+    def packed_meshes(
+        self, endfeet_indices: Iterable[Union[int, np.integer]]
+    ) -> PackedEndfootMeshes:
+        """Returns the meshes of multiple endfeet packed in contiguous arrays.
+
+        Each property is fetched with one bulk read for all the endfeet, instead of one read
+        per endfoot.
+        """
+        endfeet_indices = np.asarray(endfeet_indices, dtype=np.int64).ravel()
+
+        if self.is_referenced:
+            triangle_ids, triangles_offsets = self._get_grouped_values(
+                "vasculature_triangle_ids", endfeet_indices
+            )
+            vasculature_points, vasculature_triangles = self._vasculature_mesh
+            points, points_offsets, triangles = local_meshes_from_references(
+                points=vasculature_points,
+                triangles=vasculature_triangles,
+                triangle_ids=triangle_ids,
+                offsets=triangles_offsets,
+            )
+        else:
+            points, points_offsets = self._get_grouped_values("points", endfeet_indices)
+            triangles, triangles_offsets = self._get_grouped_values("triangles", endfeet_indices)
+
+        return PackedEndfootMeshes(
+            indices=endfeet_indices,
+            points=points,
+            points_offsets=points_offsets,
+            triangles=triangles,
+            triangles_offsets=triangles_offsets,
+            area=self.get_groups("surface_area", endfeet_indices)[0],
+            unreduced_area=self.get_groups("unreduced_surface_area", endfeet_indices)[0],
+            thickness=self.get_groups("surface_thickness", endfeet_indices)[0],
+        )
@@ -55,6 +55,10 @@ class LibSonataReader:
         """Returns source nodes"""
         return self._impl.source_nodes(self._selection(ids=ids)).astype(np.int64)
 
+    def get_target_nodes(self, ids=None):
+        """Returns target nodes"""
+        return self._impl.target_nodes(self._selection(ids=ids)).astype(np.int64)
+
     def get_property(self, property_name, ids=None):
         """Returns a numpy array containing the values corresponding to property_name"""
         selection = self._selection(ids=ids)
@@ -0,0 +1,130 @@
+# SPDX-License-Identifier: Apache-2.0
+
+"""Vasculature surface mesh arrays and their memory mapped cache."""
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Tuple
+
+import h5py
+import numpy as np
+
+from archngv.exceptions import NGVError
+
+
+def _memory_mapped(dataset: h5py.Dataset) -> np.ndarray:
+    """Returns a read-only memory map of a contiguous uncompressed dataset, or its values if the
+    dataset cannot be mapped, e.g. if it is chunked or empty.
+    """
+    offset = dataset.id.get_offset()
+
+    if dataset.chunks is not None or offset is None:
+        return dataset[...]
+
+    return np.memmap(
+        dataset.file.filename, mode="r", dtype=dataset.dtype, shape=dataset.shape, offset=offset
+    )
+
+
+@dataclass
+class VasculatureSurfaceMesh:
+    """Vasculature surface mesh with its vertex adjacency and triangle areas precomputed.
+
+    The neighbors of the i-th vertex are neighbors[neighbors_offsets[i]: neighbors_offsets[i + 1]]
+    in the order of the vertex-vertex circulator of openmesh.
+
+    Loading the mesh from its cache (see export_vasculature_surface_mesh) memory maps the arrays
+    instead of parsing the mesh file.
+    """
+
+    points: np.ndarray
+    triangles: np.ndarray
+    neighbors: np.ndarray
+    neighbors_offsets: np.ndarray
+    triangle_areas: np.ndarray
+
+    @classmethod
+    def from_openmesh(cls, mesh) -> "VasculatureSurfaceMesh":
+        """Creates the surface mesh from an openmesh TriMesh."""
+        from archngv.utils.ngons import vectorized_triangle_area
+        from archngv.utils.segmented import offsets_from_counts
+
+        points = mesh.points()
+        triangles = mesh.face_vertex_indices().astype(np.int64)
+
+        # vertex neighbors padded with -1
+        neighbors = mesh.vv_indices()
+        mask = neighbors >= 0
+
+        p0s, p1s, p2s = points[triangles.T]
+
+        return cls(
+            points=points,
+            triangles=triangles,
+            neighbors=neighbors[mask].astype(np.int64),
+            neighbors_offsets=offsets_from_counts(np.count_nonzero(mask, axis=1)),
+            triangle_areas=vectorized_triangle_area(p0s - p1s, p0s - p2s),
+        )
+
+    @classmethod
+    def from_mesh_file(cls, filepath: Path) -> "VasculatureSurfaceMesh":
+        """Reads a mesh file, e.g. an OBJ, with openmesh and creates the surface mesh."""
+        import openmesh
+
+        return cls.from_openmesh(openmesh.read_trimesh(str(filepath)))
+
+    @classmethod
+    def load(cls, filepath: Path) -> "VasculatureSurfaceMesh":
+        """Memory maps the surface mesh cache at filepath."""
+        with h5py.File(filepath, "r") as fd:
+            return cls(**{field.name: _memory_mapped(fd[field.name]) for field in fields(cls)})
+
+    def compact(self) -> "VasculatureSurfaceMesh":
+        """Returns the surface mesh with int32 ids and float32 geometry.
+
+        The arrays that already have these dtypes are not copied.
+        """
+        if max(len(self.points), len(self.triangles), len(self.neighbors)) > np.iinfo(np.int32).max:
+            raise NGVError("The vasculature surface mesh is too large for int32 ids.")
+
+        return VasculatureSurfaceMesh(
+            points=np.asarray(self.points, dtype=np.float32),
+            triangles=np.asarray(self.triangles, dtype=np.int32),
+            neighbors=np.asarray(self.neighbors, dtype=np.int32),
+            neighbors_offsets=np.asarray(self.neighbors_offsets, dtype=np.int32),
+            triangle_areas=np.asarray(self.triangle_areas, dtype=np.float32),
+        )
+
+    def to_trimesh(self):
+        """Returns the surface mesh as a trimesh.Trimesh."""
+        import trimesh
+
+        return trimesh.Trimesh(vertices=self.points, faces=self.triangles, process=False)
+
+
+def local_meshes_from_references(
+    points: np.ndarray, triangles: np.ndarray, triangle_ids: np.ndarray, offsets: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reconstructs the local mesh of each group of triangle ids of a mesh.
+
+    Args:
+        points: array[float, (N, 3)] The points of the entire mesh.
+        triangles: array[int, (M, 3)] The triangles of the entire mesh.
+        triangle_ids: array[int, (K,)] The triangle ids of all the groups.
+        offsets: array[int, (G + 1,)] The triangle ids of the i-th group are
+            triangle_ids[offsets[i]: offsets[i + 1]].
+
+    Returns:
+        local_points: array[float32, (L, 3)] The points of all the groups.
+        points_offsets: array[int64, (G + 1,)] The offsets of the points of each group.
+        local_triangles: array[int64, (K, 3)] The triangles of all the groups, indexing the
+            points of their group locally.
+
+    Notes:
+        The vertices of each group are sorted by their global index, as with np.unique.
+    """
+    from archngv.utils.ngons import segmented_global_to_local_triangles
+
+    vertices, points_offsets, local_triangles = segmented_global_to_local_triangles(
+        triangles[triangle_ids], offsets
+    )
+    return points[vertices].astype(np.float32), points_offsets, local_triangles
@@ -134,3 +134,47 @@ def convex_shape_with_spheres(face_points, face_normals, target_positions, targe
     signed_dist[np.isclose(signed_dist, 0.0)] = 0.0
 
     return ~np.any(signed_dist > 0.0, axis=1)
+
+
+def convex_shapes_with_boxes(
+    face_points, face_normals, face_offsets, shape_ids, box_centers, box_half_extents=None
+):
+    """Pairwise half-space test between convex shapes and axis aligned boxes.
+
+    The faces of the i-th convex shape are face_points[face_offsets[i]: face_offsets[i + 1]]
+    and the respective outward face_normals. The k-th pair is the shape shape_ids[k] and the box
+    with center box_centers[k] and half extent box_half_extents[k].
+
+    A pair is rejected if the box lies entirely outside at least one of the shape's face planes.
+    For points (no half extents) this is the exact inclusion test of convex_shape_with_spheres.
+    For boxes it is conservative: a box close to an edge of the shape may be kept.
+
+    Args:
+        face_points: array[float, (F, 3)]
+        face_normals: array[float, (F, 3)]
+        face_offsets: array[int, (S + 1,)]
+        shape_ids: array[int, (K,)]
+        box_centers: array[float, (K, 3)]
+        box_half_extents: array[float, (K, 3)] or None for points
+
+    Returns:
+        array[bool, (K,)]: True for the pairs that are not separated by a face plane.
+    """
+    from archngv.utils.segmented import expand_ranges
+
+    face_counts = face_offsets[shape_ids + 1] - face_offsets[shape_ids]
+    pair_ids = np.repeat(np.arange(len(shape_ids), dtype=np.int64), face_counts)
+    face_ids = expand_ranges(face_offsets[shape_ids], face_counts)
+
+    normals = face_normals[face_ids]
+    signed_dist = rowwise_dot(box_centers[pair_ids] - face_points[face_ids], normals)
+
+    # the closest corner of the box to the plane
+    if box_half_extents is not None:
+        signed_dist -= rowwise_dot(np.abs(normals), box_half_extents[pair_ids])
+
+    # fix accuracy issues
+    signed_dist[np.isclose(signed_dist, 0.0)] = 0.0
+
+    n_outside = np.bincount(pair_ids[signed_dist > 0.0], minlength=len(shape_ids))
+    return n_outside == 0
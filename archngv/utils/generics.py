@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """Generic utilities."""
+import hashlib
 from collections.abc import Iterable
 
 
@@ -14,3 +15,12 @@ def ensure_list(v):
     if is_iterable(v):
         return list(v)
     return [v]
+
+
+def file_checksum(filepath, chunk_size=2**20):
+    """Returns the sha256 hex digest of the contents of the file at filepath."""
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
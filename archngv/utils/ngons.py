@@ -359,6 +359,54 @@ def local_to_global_triangles(triangles, ps_tris_offsets, local_to_global_vertic
     return global_tris
 
 
+def segmented_global_to_local_triangles(triangles, offsets):
+    """Converts groups of triangles from the global index space to the local one of each group.
+
+    Args:
+        triangles: array[int, (K, 3)]
+            The triangles of all the groups, indexing the vertices of the entire mesh.
+        offsets: array[int, (G + 1,)]
+            The triangles of the i-th group are triangles[offsets[i]: offsets[i + 1]].
+
+    Returns:
+        vertices: array[int, (L,)]
+            The global vertex ids of all the groups, with the dtype of the triangles.
+        vertices_offsets: array[int64, (G + 1,)]
+            The offsets of the vertices of each group.
+        local_triangles: array[int64, (K, 3)]
+            The triangles of all the groups, indexing the vertices of their group locally.
+
+    Notes:
+        The vertices of each group are sorted by their global index, as with np.unique.
+    """
+    from archngv.utils.segmented import offsets_from_counts, segment_ids
+
+    vertices = np.asarray(triangles).ravel()
+    vertex_groups = np.repeat(segment_ids(offsets), 3)
+
+    order = np.lexsort((vertices, vertex_groups))
+
+    sorted_vertices = vertices[order]
+    sorted_groups = vertex_groups[order]
+
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = (sorted_vertices[1:] != sorted_vertices[:-1]) | (
+        sorted_groups[1:] != sorted_groups[:-1]
+    )
+
+    # the global index of the unique (group, vertex) pair of each vertex
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(is_first) - 1
+
+    vertices_offsets = offsets_from_counts(
+        np.bincount(sorted_groups[is_first], minlength=len(offsets) - 1)
+    )
+
+    local_triangles = (inverse - vertices_offsets[vertex_groups]).reshape(-1, 3)
+
+    return sorted_vertices[is_first], vertices_offsets, local_triangles
+
+
 def local_to_global_mapping(points, triangles, ps_tris_offsets, triangle_labels=None, decimals=4):
     """Given an array of points return an array of indices that correspond
     to all the unique points in the array.
@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: Apache-2.0
+
+"""Helpers for segmented (CSR-style) arrays.
+
+A segmented array is a flat array of values accompanied by an offsets array, so that the values
+of the i-th segment are values[offsets[i]: offsets[i + 1]].
+"""
+import numpy as np
+
+
+def offsets_from_counts(counts):
+    """Returns the offsets of the segments with the given counts.
+
+    Args:
+        counts: array[int, (N,)]
+
+    Returns:
+        offsets: array[int64, (N + 1,)]
+    """
+    offsets = np.empty(len(counts) + 1, dtype=np.int64)
+    offsets[0] = 0
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def segment_ids(offsets):
+    """Returns the segment index for each element of the flat array.
+
+    Example:
+        offsets = [0, 2, 2, 5] -> [0, 0, 2, 2, 2]
+    """
+    return np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+
+
+def expand_ranges(starts, counts):
+    """Concatenates the ranges [starts[i], starts[i] + counts[i]) into a flat array.
+
+    Example:
+        starts = [5, 0, 10], counts = [2, 0, 3] -> [5, 6, 10, 11, 12]
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+
+    offsets = offsets_from_counts(counts)
+    shifts = np.repeat(starts - offsets[:-1], counts)
+
+    return np.arange(offsets[-1], dtype=np.int64) + shifts
+
+
+def reduce_segments(ufunc, values, offsets, empty_value=0):
+    """Reduces the values of each segment with the ufunc, e.g. np.maximum.
+
+    Args:
+        ufunc: numpy.ufunc
+        values: array[(offsets[-1], ...)]
+        offsets: array[int, (N + 1,)]
+        empty_value: The result of the empty segments.
+
+    Returns:
+        reduced: array[(N, ...)]
+
+    Example:
+        np.add, values = [1, 2, 3, 4], offsets = [0, 1, 1, 4] -> [1, 0, 9]
+    """
+    values = np.asarray(values)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    result = np.full((len(offsets) - 1,) + values.shape[1:], empty_value, dtype=values.dtype)
+
+    # reduceat reduces up to the next index, the empty segments in between have no values
+    non_empty = offsets[:-1] < offsets[1:]
+    if non_empty.any():
+        result[non_empty] = ufunc.reduceat(values[: offsets[-1]], offsets[:-1][non_empty], axis=0)
+
+    return result
@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """ Statistics related functions """
+import numpy as np
 from scipy import stats
 
 
@@ -18,3 +19,29 @@ def truncated_normal(mean_value, sdev, min_value, max_value):
         mean_value,
         sdev,
     )
+
+
+def histogram_summary(values, bins=20):
+    """Returns a json serializable summary of the distribution of the values
+
+    Args:
+        values: array[float, (N,)]
+        bins: int
+            Number of histogram bins
+
+    Returns:
+        dict with the min, max, mean, the bin edges and the counts of the histogram
+    """
+    values = np.asarray(values)
+
+    if values.size == 0:
+        return {"min": None, "max": None, "mean": None, "bin_edges": [], "counts": []}
+
+    counts, bin_edges = np.histogram(values, bins=bins)
+    return {
+        "min": values.min().item(),
+        "max": values.max().item(),
+        "mean": float(values.mean()),
+        "bin_edges": bin_edges.tolist(),
+        "counts": counts.tolist(),
+    }
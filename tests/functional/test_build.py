@@ -172,6 +172,7 @@ def test_config():
                             "type": "vasculature",
                             "vasculature_file": f"{DATA_DIR}/atlas/vasculature.h5",
                             "vasculature_mesh": f"{DATA_DIR}/atlas/vasculature.obj",
+                            "vasculature_mesh_cache": "$BASE_DIR/meshes/vasculature_surface_mesh.h5",
                         },
                     },
                 },
@@ -22,11 +22,13 @@ FIN_SONATA_DIR = BUILD_DIR / "sonata"
 TMP_SONATA_DIR = BUILD_DIR / "sonata.tmp"
 
 
-def assert_cli_run(cli, cmd_list):
+def assert_cli_run(cli, cmd_list, expected_files=()):
     runner = click.testing.CliRunner()
     with runner.isolated_filesystem():
         result = runner.invoke(cli, [str(p) for p in cmd_list])
         assert result.exit_code == 0, "".join(traceback.format_exception(*result.exc_info))
+        for filename in expected_files:
+            assert Path(filename).exists(), filename
 
 
 def test_ngv_config():
@@ -194,9 +196,67 @@ def test_gliovascular_connectivity():
             "--output",
             "gliovascular.h5",
         ],
+        expected_files=["gliovascular.h5", "gliovascular.metrics.json"],
     )
 
 
+def test_gliovascular_connectivity__shards():
+    import h5py
+
+    common = [
+        "--config",
+        BIONAME_DIR / "MANIFEST.yaml",
+        "--astrocytes",
+        FIN_SONATA_DIR / "nodes/glia.h5",
+        "--microdomains",
+        BUILD_DIR / "microdomains.h5",
+        "--vasculature",
+        FIN_SONATA_DIR / "nodes/vasculature.h5",
+        "--seed",
+        0,
+        "--population-name",
+        "gliovascular",
+    ]
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        for args in (
+            ["--output", "full.h5"],
+            ["--shard", 0, 2, "--output", "shard0.h5"],
+            ["--astrocyte-id-range", 2, 5, "--output", "shard1.h5"],
+        ):
+            result = runner.invoke(
+                tested.gliovascular_connectivity, [str(p) for p in common + args]
+            )
+            assert result.exit_code == 0, "".join(traceback.format_exception(*result.exc_info))
+
+        result = runner.invoke(
+            tested.merge_gliovascular_connectivity,
+            [
+                str(p)
+                for p in [
+                    "--shards",
+                    "shard1.h5",
+                    "--shards",
+                    "shard0.h5",
+                    "--astrocytes",
+                    FIN_SONATA_DIR / "nodes/glia.h5",
+                    "--vasculature",
+                    FIN_SONATA_DIR / "nodes/vasculature.h5",
+                    "--population-name",
+                    "gliovascular",
+                    "--output",
+                    "merged.h5",
+                ]
+            ],
+        )
+        assert result.exit_code == 0, "".join(traceback.format_exception(*result.exc_info))
+
+        with h5py.File("full.h5", "r") as full, h5py.File("merged.h5", "r") as merged:
+            for name in ("source_node_id", "target_node_id", "0/endfoot_id", "0/endfoot_surface_x"):
+                dataset = f"edges/gliovascular/{name}"
+                np.testing.assert_array_equal(merged[dataset][:], full[dataset][:])
+
+
 def test_gliovascular_finalize():
     assert_cli_run(
         tested.attach_endfeet_info_to_gliovascular_connectivity,
@@ -281,6 +341,19 @@ def test_glialglial_connectivity():
     )
 
 
+def test_vasculature_mesh_cache():
+    assert_cli_run(
+        tested.build_vasculature_mesh_cache,
+        [
+            "--vasculature-mesh-path",
+            DATA_DIR.parents[1] / "building/endfeet_reconstruction/data/plane_10x10.obj",
+            "--output-path",
+            "meshes/vasculature_surface_mesh.h5",
+        ],
+        expected_files=["meshes/vasculature_surface_mesh.h5"],
+    )
+
+
 def test_endfeet_meshes():
     assert_cli_run(
         tested.build_endfeet_surface_meshes,
@@ -1,8 +1,11 @@
 import contextlib
 import tempfile
 
+import pytest
+
 from archngv.app import utils as tested
 from archngv.app.utils import write_yaml
+from archngv.exceptions import NGVError
 
 
 @contextlib.contextmanager
@@ -24,3 +27,43 @@ def test_load_ngv_manifest():
     with temp_yaml_file(new_manifest) as yaml_file:
         res = tested.load_ngv_manifest(yaml_file)
         assert res["common"]["p1"] == 1
+
+
+def test_chunk_ranges():
+    assert tested.chunk_ranges(0, 3) == []
+    assert tested.chunk_ranges(7, 3) == [(0, 3), (3, 6), (6, 7)]
+    assert tested.chunk_ranges(6, 3) == [(0, 3), (3, 6)]
+    assert tested.chunk_ranges(2, 5) == [(0, 2)]
+
+    with pytest.raises(NGVError):
+        tested.chunk_ranges(2, 0)
+
+
+_STATE = {}
+
+
+def _init_state(offset):
+    _STATE["offset"] = offset
+
+
+def _sum_range(chunk):
+    return sum(range(*chunk)) + _STATE["offset"]
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_apply_parallel_function(n_workers):
+    chunks = tested.chunk_ranges(10, 3)
+    result = list(
+        tested.apply_parallel_function(
+            _sum_range,
+            chunks,
+            initializer=_init_state,
+            initargs=(n_workers,),
+            finalizer=_STATE.clear,
+            n_workers=n_workers,
+        )
+    )
+    assert result == [3 + n_workers, 12 + n_workers, 21 + n_workers, 9 + n_workers]
+
+    # the state of the current process is released
+    assert not _STATE
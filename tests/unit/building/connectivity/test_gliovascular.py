@@ -0,0 +1,147 @@
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+
+from archngv.building.connectivity import gliovascular as tested
+from archngv.exceptions import NGVError
+
+
+def test_section_segment_lookup():
+    rng = np.random.default_rng(0)
+
+    section_ids = np.repeat(np.arange(20), rng.integers(1, 10, size=20))
+    segment_ids = np.concatenate([np.arange(n) for n in np.bincount(section_ids)])
+
+    permutation = rng.permutation(len(section_ids))
+    section_ids, segment_ids = section_ids[permutation], segment_ids[permutation]
+
+    lookup = tested.SectionSegmentLookup(section_ids, segment_ids)
+
+    queries = rng.integers(0, len(section_ids), size=100)
+
+    npt.assert_array_equal(lookup(section_ids[queries], segment_ids[queries]), queries)
+
+    # the same as the pandas multi-index lookup
+    df = pd.DataFrame({"section_id": section_ids, "segment_id": segment_ids})
+    df["index"] = df.index
+    df = df.set_index(["section_id", "segment_id"])
+    expected = df.loc[
+        pd.MultiIndex.from_arrays([section_ids[queries], segment_ids[queries]]), "index"
+    ].to_numpy()
+    npt.assert_array_equal(lookup(section_ids[queries], segment_ids[queries]), expected)
+
+
+def test_section_segment_lookup__missing():
+    lookup = tested.SectionSegmentLookup([0, 0, 2, 2], [0, 1, 0, 2])
+
+    npt.assert_array_equal(lookup([2, 0, 2], [2, 1, 0]), [3, 1, 2])
+    npt.assert_array_equal(lookup([], []), np.empty(0, dtype=np.int64))
+
+    for section_id, segment_id in [(1, 0), (2, 1), (0, 2), (3, 0), (-1, 0)]:
+        with pytest.raises(NGVError):
+            lookup([section_id], [segment_id])
+
+
+def test_shard_range():
+    ranges = [tested.shard_range(10, i, 3) for i in range(3)]
+    assert ranges == [(0, 3), (3, 6), (6, 10)]
+
+    assert [tested.shard_range(2, i, 4) for i in range(4)] == [(0, 0), (0, 1), (1, 1), (1, 2)]
+
+    with pytest.raises(NGVError):
+        tested.shard_range(10, 3, 3)
+
+
+def test_astrocyte_id_range_of():
+    assert tested.astrocyte_id_range_of(10) is None
+    assert tested.astrocyte_id_range_of(10, astrocyte_id_range=(2, 5)) == (2, 5)
+    assert tested.astrocyte_id_range_of(10, shard=(1, 3)) == (3, 6)
+
+    with pytest.raises(NGVError, match="mutually exclusive"):
+        tested.astrocyte_id_range_of(10, astrocyte_id_range=(2, 5), shard=(1, 3))
+
+    for astrocyte_id_range in [(-1, 5), (5, 2), (2, 11)]:
+        with pytest.raises(NGVError, match="is not in"):
+            tested.astrocyte_id_range_of(10, astrocyte_id_range=astrocyte_id_range)
+
+
+def _write_shard(filepath, beg, end, astrocyte_ids):
+    import h5py
+
+    with h5py.File(filepath, "w") as h5f:
+        group = h5f.create_group("edges/gliovascular")
+        group.attrs[tested.SHARD_RANGE_ATTRIBUTE] = (beg, end)
+        group["target_node_id"] = np.asarray(astrocyte_ids, dtype=np.uint64)
+        group["source_node_id"] = np.arange(len(astrocyte_ids), dtype=np.uint64) + 10 * beg
+        group["0/endfoot_id"] = np.arange(len(astrocyte_ids), dtype=np.uint64)
+
+
+def test_merge_gliovascular_shards(tmp_path):
+    _write_shard(tmp_path / "1.h5", 3, 5, [3, 3, 4])
+    _write_shard(tmp_path / "0.h5", 0, 3, [0, 2])
+    _write_shard(tmp_path / "2.h5", 5, 6, [])
+
+    astrocyte_ids, vasculature_ids, properties = tested.merge_gliovascular_shards(
+        [tmp_path / "1.h5", tmp_path / "2.h5", tmp_path / "0.h5"], "gliovascular", 6
+    )
+    npt.assert_array_equal(astrocyte_ids, [0, 2, 3, 3, 4])
+    npt.assert_array_equal(vasculature_ids, [0, 1, 30, 31, 32])
+    npt.assert_array_equal(properties["endfoot_id"], np.arange(5))
+
+    # missing shard
+    with pytest.raises(NGVError, match="not contiguous"):
+        tested.merge_gliovascular_shards([tmp_path / "1.h5", tmp_path / "2.h5"], "gliovascular", 6)
+
+    with pytest.raises(NGVError, match="cover 5 out of 6"):
+        tested.merge_gliovascular_shards([tmp_path / "1.h5", tmp_path / "0.h5"], "gliovascular", 6)
+
+    with pytest.raises(NGVError):
+        tested.merge_gliovascular_shards([], "gliovascular", 6)
+
+
+def test_write_gliovascular_edge_population(tmp_path):
+    import voxcell
+
+    vasculature_nodes = voxcell.CellCollection("vasculature")
+    vasculature_nodes.positions = np.zeros((50, 3))
+    astrocytes = voxcell.CellCollection("astrocytes")
+    astrocytes.positions = np.zeros((6, 3))
+
+    shards = [((0, 3), [0, 2]), ((3, 5), [3, 3, 4]), ((5, 6), [])]
+    for i, ((beg, end), astrocyte_ids) in enumerate(shards):
+        edges = (
+            np.asarray(astrocyte_ids, dtype=np.int64),
+            np.arange(len(astrocyte_ids), dtype=np.int64) + 10 * beg,
+            {"endfoot_id": np.arange(len(astrocyte_ids), dtype=np.uint64)},
+        )
+        tested.write_gliovascular_edge_population(
+            str(tmp_path / f"{i}.h5"),
+            "gliovascular",
+            vasculature_nodes,
+            astrocytes,
+            edges,
+            astrocyte_id_range=(beg, end),
+        )
+
+    astrocyte_ids, vasculature_ids, properties = tested.merge_gliovascular_shards(
+        [tmp_path / f"{i}.h5" for i in range(3)], "gliovascular", 6
+    )
+    npt.assert_array_equal(astrocyte_ids, [0, 2, 3, 3, 4])
+    npt.assert_array_equal(vasculature_ids, [0, 1, 30, 31, 32])
+    npt.assert_array_equal(properties["endfoot_id"], np.arange(5))
+
+    tested.write_gliovascular_edge_population(
+        str(tmp_path / "merged.h5"),
+        "gliovascular",
+        vasculature_nodes,
+        astrocytes,
+        (astrocyte_ids, vasculature_ids, properties),
+    )
+
+    import h5py
+
+    with h5py.File(tmp_path / "merged.h5", "r") as h5f:
+        group = h5f["edges/gliovascular"]
+        assert tested.SHARD_RANGE_ATTRIBUTE not in group.attrs
+        npt.assert_array_equal(group["target_node_id"][:], astrocyte_ids)
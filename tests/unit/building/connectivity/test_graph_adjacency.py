@@ -0,0 +1,61 @@
+import numpy as np
+import numpy.testing as npt
+from vascpy.utils.adjacency import AdjacencyMatrix
+
+from archngv.building.connectivity.detail.gliovascular_generation import graph_adjacency as tested
+
+
+def _random_edges(n_vertices, n_edges, seed=0):
+    rng = np.random.default_rng(seed)
+    edges = rng.integers(0, n_vertices, size=(3 * n_edges, 2))
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    _, idx = np.unique(edges, axis=0, return_index=True)
+    return edges[np.sort(idx)][:n_edges]
+
+
+def test_edge_adjacency__vascpy_equivalence():
+    n_vertices = 50
+    edges = _random_edges(n_vertices, 200)
+
+    expected = AdjacencyMatrix(edges, n_vertices=n_vertices)
+    adjacency = tested.EdgeAdjacency(edges, n_vertices=n_vertices)
+
+    assert adjacency.n_edges == len(edges)
+
+    for vertex in range(n_vertices):
+        npt.assert_array_equal(adjacency.successors(vertex), expected.successors(vertex))
+        npt.assert_array_equal(adjacency.predecessors(vertex), expected.predecessors(vertex))
+        npt.assert_array_equal(edges[adjacency.outgoing_edges(vertex), 0], vertex)
+        npt.assert_array_equal(edges[adjacency.incoming_edges(vertex), 1], vertex)
+
+    for u, v in edges:
+        assert adjacency.edge_index(u, v) == expected.edge_index(u, v)
+
+    npt.assert_array_equal(adjacency.edge_indices(edges[:, 0], edges[:, 1]), np.arange(len(edges)))
+
+
+def test_edge_adjacency__missing():
+    edges = np.array([[0, 1], [1, 2], [1, 3], [0, 1]])
+    adjacency = tested.EdgeAdjacency(edges, n_vertices=5)
+
+    # duplicate edges resolve to the smallest id
+    npt.assert_array_equal(
+        adjacency.edge_indices([0, 1, 2, 3, 4], [1, 3, 1, 4, 4]), [0, 2, -1, -1, -1]
+    )
+
+    npt.assert_array_equal(adjacency.first_outgoing_edges([0, 1, 2, 4]), [0, 1, -1, -1])
+    npt.assert_array_equal(adjacency.first_incoming_edges([0, 1, 2, 3]), [-1, 0, 1, 2])
+
+
+def test_edge_adjacency__readonly():
+    adjacency = tested.EdgeAdjacency(np.array([[0, 1], [1, 2]]))
+    assert adjacency.n_vertices == 3
+    assert not adjacency.out_offsets.flags.writeable
+    assert not adjacency.in_edges.flags.writeable
+
+
+def test_edge_adjacency__empty():
+    adjacency = tested.EdgeAdjacency(np.empty((0, 2), dtype=np.int64), n_vertices=2)
+    assert adjacency.n_edges == 0
+    npt.assert_array_equal(adjacency.edge_indices([0], [1]), [-1])
+    npt.assert_array_equal(adjacency.first_outgoing_edges([0, 1]), [-1, -1])
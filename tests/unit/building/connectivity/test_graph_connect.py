@@ -0,0 +1,132 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+from scipy.spatial import ConvexHull
+
+from archngv.building.connectivity.detail.gliovascular_generation import graph_connect as tested
+from archngv.building.connectivity.detail.gliovascular_generation.graph_reachout import strategy
+from archngv.building.connectivity.detail.gliovascular_generation.graph_targeting import (
+    PotentialTargets,
+)
+from archngv.building.exporters import export_microdomains
+from archngv.core.datasets import Microdomain, Microdomains
+from archngv.utils.statistics import histogram_summary
+
+
+@pytest.fixture(scope="module")
+def domains(tmp_path_factory):
+    unit_cube = np.array(
+        [[x, y, z] for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)], dtype=np.float32
+    )
+
+    domains = []
+    for corner in np.ndindex(4, 3, 2):
+        points = 12.0 * unit_cube + 10.0 * np.asarray(corner, dtype=np.float32)
+        triangles = ConvexHull(points).simplices
+        domains.append(
+            Microdomain(
+                points,
+                np.column_stack((np.arange(len(triangles)), triangles)),
+                np.full(len(triangles), fill_value=-1),
+            )
+        )
+    filepath = tmp_path_factory.mktemp("domains") / "microdomains.h5"
+    export_microdomains(filepath, domains, np.ones(len(domains)))
+
+    with Microdomains(filepath) as microdomains:
+        yield microdomains
+
+
+@pytest.fixture(scope="module")
+def potential_targets():
+    rng = np.random.default_rng(0)
+    n_targets = 2000
+    return PotentialTargets(
+        positions=rng.uniform(0.0, 42.0, size=(n_targets, 3)),
+        radii=rng.uniform(0.1, 0.5, size=n_targets),
+        edge_indices=np.arange(n_targets),
+        section_ids=rng.integers(0, 50, size=n_targets),
+        segment_ids=np.zeros(n_targets, dtype=np.int64),
+    )
+
+
+def test_astrocyte_random_generator():
+    first = tested.astrocyte_random_generator(0, 3).random(5)
+    npt.assert_array_equal(first, tested.astrocyte_random_generator(0, 3).random(5))
+    assert not np.allclose(first, tested.astrocyte_random_generator(0, 4).random(5))
+    assert not np.allclose(first, tested.astrocyte_random_generator(1, 3).random(5))
+
+
+@pytest.mark.parametrize("reachout_strategy", ["maximum_reachout", "random_selection"])
+def test_domains_to_vasculature__chunking_invariance(domains, potential_targets, reachout_strategy):
+    cell_ids = np.arange(len(domains))
+    properties = {"endfeet_distribution": [4, 2, 0, 15]}
+
+    expected, _ = tested.domains_to_vasculature(
+        cell_ids, strategy(reachout_strategy), potential_targets, domains, properties, seed=1
+    )
+    assert expected.shape[1] == 2
+    assert len(expected) > 0
+    npt.assert_array_equal(np.diff(expected[:, 0]) >= 0, True)
+
+    for chunk_size, n_workers in [(1, 1), (5, 1), (5, 2)]:
+        result, _ = tested.domains_to_vasculature(
+            cell_ids,
+            strategy(reachout_strategy),
+            potential_targets,
+            domains,
+            properties,
+            seed=1,
+            n_workers=n_workers,
+            chunk_size=chunk_size,
+        )
+        npt.assert_array_equal(result, expected)
+
+    # the streams are per astrocyte, a subset of astrocytes gets the same edges
+    subset, _ = tested.domains_to_vasculature(
+        cell_ids[10:],
+        strategy(reachout_strategy),
+        potential_targets,
+        domains,
+        properties,
+        seed=1,
+        chunk_size=3,
+    )
+    mask = expected[:, 0] >= 10
+    npt.assert_array_equal(subset[:, 0] + 10, expected[mask, 0])
+    npt.assert_array_equal(subset[:, 1], expected[mask, 1])
+
+
+def test_domains_to_vasculature__empty(domains, potential_targets):
+    result, metrics = tested.domains_to_vasculature(
+        np.empty(0, dtype=np.int64),
+        strategy("maximum_reachout"),
+        potential_targets,
+        domains,
+        {"endfeet_distribution": [4, 2, 0, 15]},
+    )
+    assert result.shape == (0, 2)
+    assert metrics == {
+        "n_astrocytes": 0,
+        "n_edges": 0,
+        "n_candidate_targets": 0,
+        "targets_per_domain": histogram_summary([]),
+        "endfeet_per_domain": histogram_summary([]),
+        "n_reachout_selections": 0,
+    }
+
+
+def test_domains_to_vasculature__metrics(domains, potential_targets):
+    edges, metrics = tested.domains_to_vasculature(
+        np.arange(len(domains)),
+        strategy("maximum_reachout"),
+        potential_targets,
+        domains,
+        {"endfeet_distribution": [4, 2, 0, 15]},
+        seed=1,
+    )
+    assert metrics["n_astrocytes"] == len(domains)
+    assert metrics["n_edges"] == len(edges)
+    assert sum(metrics["targets_per_domain"]["counts"]) == len(domains)
+    assert sum(metrics["endfeet_per_domain"]["counts"]) == len(domains)
+    assert 0 < metrics["n_reachout_selections"] <= len(domains)
@@ -109,3 +109,26 @@ def test_create_targets():
         ),
     )
     assert_allclose(segments, np.array([0, 0, 0, 1, 1], dtype=np.uint64))
+
+
+def test_distribution_on_line_graph__zero_length_segments():
+    points = np.array([[0, 0, 0], [0, 0, 0], [0, 0, 4], [0, 0, 4], [0, 0, 10]], dtype=np.float64)
+
+    positions, segments = graph_targeting._distribution_on_line_graph(
+        points[:-1], points[1:], linear_density=0.5
+    )
+
+    assert_allclose(
+        positions,
+        [[0.0, 0.0, 0.0], [0.0, 0.0, 2.0], [0.0, 0.0, 4.0], [0.0, 0.0, 6.0], [0.0, 0.0, 8.0]],
+    )
+    # a target at the end of a segment belongs to it, zero-length segments have no targets
+    assert_allclose(segments, [1, 1, 1, 3, 3])
+
+
+def test_distribution_on_line_graph__empty():
+    positions, segments = graph_targeting._distribution_on_line_graph(
+        np.zeros((2, 3)), np.zeros((2, 3)), linear_density=1.0
+    )
+    assert positions.shape == (0, 3)
+    assert segments.shape == (0,)
@@ -1,13 +1,12 @@
 from random import shuffle
 
 import numpy as np
-import pandas as pd
 
 from archngv.building.connectivity.detail.gliovascular_generation.graph_reachout import (
-    _argsort_components,
     _distribute_elements_in_buckets,
     _maximum_reachout,
     _select_component_targets,
+    _sorted_section_components,
 )
 
 
@@ -80,49 +79,94 @@ def test_select_component_targets__point_line():
 
     source = np.array([3.0, -1.0, 0.0])
 
-    component = pd.DataFrame({"x": points[:, 0], "y": points[:, 1], "z": points[:, 2]})
-
-    ids = _select_component_targets(source, component, 1)
+    ids = _select_component_targets(source, points, 1)
 
     np.testing.assert_allclose(ids, [3])
 
-    ids = _select_component_targets(source, component, 2)
+    ids = _select_component_targets(source, points, 2)
 
     assert set(ids) == set([3, 6])
 
-    ids = _select_component_targets(source, component, 3)
+    ids = _select_component_targets(source, points, 3)
 
     assert set(ids) == set([0, 3, 6])
 
-    ids = _select_component_targets(source, component, 4)
+    ids = _select_component_targets(source, points, 4)
 
     assert set(ids) == set([0, 3, 4, 6])
 
-    ids = _select_component_targets(source, component, 5)
+    ids = _select_component_targets(source, points, 5)
 
     assert set(ids) == set([0, 1, 3, 4, 6])
 
-    ids = _select_component_targets(source, component, 7)
+    ids = _select_component_targets(source, points, 7)
 
     assert set(ids) == set(range(7))
 
 
-def test_argsort_components():
+def test_select_component_targets__ties():
+    # all the points are equidistant from the first one
+    points = np.array(
+        [
+            [1.0, 0.0, 0.0],
+            [0.0, 1.0, 0.0],
+            [0.0, 0.0, 0.0],
+            [-1.0, 0.0, 0.0],
+            [0.0, -1.0, 0.0],
+        ]
+    )
+    source = np.array([0.0, 0.0, 0.1])
+
+    # the smallest index wins the ties
+    np.testing.assert_array_equal(_select_component_targets(source, points, 2), [0, 2])
+    np.testing.assert_array_equal(_select_component_targets(source, points, 3), [0, 1, 2])
+    np.testing.assert_array_equal(_select_component_targets(source, points, 5), range(5))
+
+
+def test_sorted_section_components():
     source = np.array([0.0, -1.0, 2.0])
 
-    comps = []
+    positions = np.vstack(
+        [
+            np.column_stack((np.ones(10) * 2.0 + i, np.arange(-5.0, 5.0), np.zeros(10)))
+            for i in range(5)
+        ]
+    )
+    section_ids = np.repeat([2, 0, 4, 1, 3], 10)
+
+    # interleave the sections
+    permutation = np.random.default_rng(0).permutation(len(positions))
+    inverse = np.argsort(permutation)
+
+    components, offsets, closest_vertices = _sorted_section_components(
+        source, positions[permutation], section_ids[permutation]
+    )
+
+    # the components are sorted by the x of their rows, i.e. sections 2, 0, 4, 1, 3
+    np.testing.assert_array_equal(closest_vertices, inverse[[4, 14, 24, 34, 44]])
+    np.testing.assert_array_equal(offsets, [0, 10, 20, 30, 40, 50])
+
+    for i, section_id in enumerate([2, 0, 4, 1, 3]):
+        np.testing.assert_array_equal(
+            components[offsets[i] : offsets[i + 1]],
+            np.flatnonzero(section_ids[permutation] == section_id),
+        )
 
-    for i in range(5):
-        points = np.column_stack((np.ones(10) * 2.0 + i, np.arange(-5.0, 5.0), np.zeros(10)))
-        component = pd.DataFrame({"x": points[:, 0], "y": points[:, 1], "z": points[:, 2]})
 
-        comps.append(component)
+def test_maximum_reachout():
+    source = np.array([0.0, 0.0, 0.0])
 
-    shuffle_ids = [2, 0, 4, 1, 3]
-    comps = [comps[i] for i in shuffle_ids]
+    # two sections along x, the first one closer to the source
+    positions = np.vstack(
+        [
+            np.column_stack((np.arange(5.0), np.full(5, 1.0), np.zeros(5))),
+            np.column_stack((np.arange(5.0), np.full(5, 10.0), np.zeros(5))),
+        ]
+    )
+    section_ids = np.array([7] * 5 + [3] * 5)
 
-    sorted_ids, closest_vertices = _argsort_components(source, comps)
-    expected_ids = [1, 3, 0, 4, 2]
+    # fewer classes than components: the closest point of the closest components
+    np.testing.assert_array_equal(_maximum_reachout(source, positions, section_ids, 1), [0])
 
-    assert np.allclose(closest_vertices, 4)
-    assert np.allclose(sorted_ids, expected_ids)
+    ids = _maximum_reachout(source, positions, section_ids, 4)
+    assert set(ids) == {0, 4, 5, 9}
@@ -0,0 +1,116 @@
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+from ngv_ctools.fast_marching_method import second_order_solutions
+from vascpy import PointVasculature
+
+from archngv.building.connectivity.detail.gliovascular_generation import (
+    surface_intersection as tested,
+)
+from archngv.building.connectivity.detail.gliovascular_generation.graph_targeting import (
+    PotentialTargets,
+)
+
+
+def test_second_order_solutions_batch():
+    coefficients = np.array(
+        [
+            [1.0, 0.0, -4.0],
+            [1.0, 2.0, 5.0],
+            [0.0, 2.0, -4.0],
+            [0.0, 0.0, 1.0],
+            [1.0, -2.0, 1.0],
+            [-1.0, 0.0, 4.0],
+            [1e-12, 1.0, 1.0],
+            [2.0, 3.0, -1.0],
+            [1.0, 1e8, 1.0],
+            [1.0, -1e8, 1.0],
+        ]
+    )
+    coefficients = np.vstack(
+        (coefficients, np.random.default_rng(0).uniform(-10.0, 10.0, size=(100, 3)))
+    )
+
+    expected = np.array([second_order_solutions(*row) for row in coefficients])
+    result = tested.second_order_solutions_batch(*coefficients.T)
+
+    npt.assert_allclose(result, expected, rtol=1e-12)
+
+
+@pytest.fixture
+def vasculature():
+    """Three cylinder segments along the x axis, followed by a truncated cone."""
+    node_properties = pd.DataFrame(
+        {
+            "x": [0.0, 10.0, 20.0, 30.0, 40.0],
+            "y": 0.0,
+            "z": 0.0,
+            "diameter": [2.0, 2.0, 2.0, 2.0, 4.0],
+        }
+    )
+    edge_properties = pd.DataFrame(
+        {
+            "start_node": [0, 1, 2, 3],
+            "end_node": [1, 2, 3, 4],
+            "type": 0,
+            "section_id": 0,
+            "segment_id": [0, 1, 2, 3],
+        }
+    )
+    return PointVasculature(node_properties, edge_properties)
+
+
+def test_surface_intersect(vasculature):
+    targets = PotentialTargets(
+        positions=np.array(
+            [[15.0, 0.0, 0.0], [9.0, 0.0, 0.0], [35.0, 0.0, 0.0], [5.0, 0.0, 0.0]],
+            dtype=np.float32,
+        ),
+        radii=np.ones(4, dtype=np.float32),
+        edge_indices=np.array([1, 0, 3, 0]),
+        section_ids=np.zeros(4, dtype=np.int64),
+        segment_ids=np.array([1, 0, 3, 0]),
+    )
+    astrocyte_positions = np.array(
+        [[15.0, 5.0, 0.0], [29.0, 2.0, 0.0], [35.0, 0.0, 10.0], [5.0, 0.5, 0.0]]
+    )
+    astrocyte_target_edges = np.array([[0, 0], [1, 1], [2, 2], [3, 3]])
+
+    metrics = {}
+    positions, astrocyte_ids, edge_ids = tested.surface_intersect(
+        astrocyte_positions, targets, astrocyte_target_edges, vasculature, metrics=metrics
+    )
+
+    assert metrics == {
+        "n_pairs": 4,
+        "n_established": 3,
+        "n_fallbacks": 1,
+        "n_fallback_steps": 1,
+        "n_established_after_fallback": 1,
+    }
+
+    # the last soma is inside the vessel, there is no intersection
+    npt.assert_array_equal(astrocyte_ids, [0, 1, 2])
+
+    # the second pair intersects the next segment
+    npt.assert_array_equal(edge_ids, [1, 1, 3])
+
+    npt.assert_allclose(
+        positions, [[15.0, 1.0, 0.0], [19.0, 1.0, 0.0], [35.0, 0.0, 1.5]], atol=1e-5
+    )
+
+
+def test_surface_intersect__empty(vasculature):
+    targets = PotentialTargets(
+        positions=np.zeros((1, 3), dtype=np.float32),
+        radii=np.ones(1, dtype=np.float32),
+        edge_indices=np.zeros(1, dtype=np.int64),
+        section_ids=np.zeros(1, dtype=np.int64),
+        segment_ids=np.zeros(1, dtype=np.int64),
+    )
+    positions, astrocyte_ids, edge_ids = tested.surface_intersect(
+        np.zeros((1, 3)), targets, np.empty((0, 2), dtype=np.int64), vasculature
+    )
+    assert positions.shape == (0, 3)
+    assert len(astrocyte_ids) == len(edge_ids) == 0
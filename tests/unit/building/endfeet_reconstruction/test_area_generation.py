@@ -2,7 +2,9 @@ import numpy as np
 from numpy import testing as npt
 
 from archngv.building.endfeet_reconstruction import area_generation as _a
+from archngv.building.endfeet_reconstruction.area_shrinking import shrink_surface_mesh
 from archngv.building.endfeet_reconstruction.groups import GroupedElements
+from archngv.utils.ngons import vectorized_triangle_area
 
 
 def test_endfeet_meshes():
@@ -26,20 +28,7 @@ def test_endfeet_meshes():
     npt.assert_allclose(expected_areas, areas)
 
 
-def test_global_to_local_indices():
-    global_triangles = np.array([[6, 7, 8], [24, 25, 26], [45, 46, 47], [42, 43, 44], [9, 10, 11]])
-
-    expected_global_vertices = [6, 7, 8, 9, 10, 11, 24, 25, 26, 42, 43, 44, 45, 46, 47]
-
-    expected_local_triangles = [[0, 1, 2], [6, 7, 8], [12, 13, 14], [9, 10, 11], [3, 4, 5]]
-
-    vertices_global, triangles_local = _a._global_to_local_indices(global_triangles)
-
-    npt.assert_array_equal(vertices_global, expected_global_vertices)
-    npt.assert_array_equal(triangles_local, expected_local_triangles)
-
-
-def test_shrink_endfoot_triangles():
+def test_shrink_endfeet_triangles():
     triangles = np.array(
         [
             [0, 1, 2],
@@ -115,28 +104,98 @@ def test_shrink_endfoot_triangles():
         ]
     )
 
-    current_area = triangle_areas.sum()
-    target_area = current_area * 0.2
+    # the first group is shrunk, the second one is already smaller than its target
+    triangle_ids = np.concatenate((np.arange(20), [3, 1, 2]))
+    offsets = np.array([0, 20, 23])
 
-    t_tris = _a._shrink_endfoot_triangles(
-        triangles, triangle_areas, triangle_travel_times, current_area, target_area
+    current_areas = np.array([triangle_areas.sum(), triangle_areas[[3, 1, 2]].sum()])
+    target_areas = current_areas * [0.2, 1.5]
+
+    shrunk_ids, shrunk_offsets = _a._shrink_endfeet_triangles(
+        triangle_ids,
+        offsets,
+        triangle_areas,
+        triangle_travel_times,
+        current_areas,
+        target_areas,
     )
-    expected_triangle_ids = np.array([2, 8, 15, 14, 3])
-    # expected_vertices = np.unique(triangles[expected_triangle_ids])
-
-    # expected global triangles
-    # [[ 6  7  8]
-    #  [24 25 26]
-    #  [45 46 47]
-    #  [42 43 44]
-    #  [ 9 10 11]]
+    npt.assert_array_equal(shrunk_ids, [2, 8, 15, 14, 3, 3, 1, 2])
+    npt.assert_array_equal(shrunk_offsets, [0, 5, 8])
+
+    # expected global triangles of the first group
     expected_triangles = [[6, 7, 8], [24, 25, 26], [45, 46, 47], [42, 43, 44], [9, 10, 11]]
-    """
-    expected_local_triangles = [[0, 1, 2],
-                                [6, 7, 8],
-                                [12, 13, 14],
-                                [9, 10, 11],
-                                [3, 4, 5]]
-    """
-    # npt.assert_array_equal(expected_vertices, vertices)
-    npt.assert_array_equal(expected_triangles, t_tris)
+    npt.assert_array_equal(triangles[shrunk_ids[:5]], expected_triangles)
+
+    # same as shrinking the group on its own
+    npt.assert_array_equal(
+        shrunk_ids[:5],
+        shrink_surface_mesh(
+            triangle_areas, triangle_travel_times, current_areas[0], target_areas[0]
+        ),
+    )
+
+
+def test_shrink_endfeet_triangles__empty_groups():
+    shrunk_ids, shrunk_offsets = _a._shrink_endfeet_triangles(
+        np.array([0, 1], dtype=np.int64),
+        np.array([0, 0, 2, 2]),
+        np.array([1.0, 2.0]),
+        np.array([0.5, 0.1]),
+        np.array([0.0, 3.0, 0.0], dtype=np.float32),
+        np.array([0.0, 2.5, 0.0]),
+    )
+    npt.assert_array_equal(shrunk_ids, [1])
+    npt.assert_array_equal(shrunk_offsets, [0, 0, 1, 1])
+
+
+def _assert_endfeet_equal(result, expected):
+    assert len(result) == len(expected)
+    for mesh, expected_mesh in zip(result, expected):
+        assert mesh.index == expected_mesh.index
+        npt.assert_array_equal(mesh.points, expected_mesh.points)
+        npt.assert_array_equal(mesh.triangles, expected_mesh.triangles)
+        npt.assert_array_equal(
+            mesh.vasculature_triangle_ids, expected_mesh.vasculature_triangle_ids
+        )
+        npt.assert_equal(mesh.area, expected_mesh.area)
+        npt.assert_equal(mesh.unreduced_area, expected_mesh.unreduced_area)
+        npt.assert_equal(mesh.thickness, expected_mesh.thickness)
+
+
+def test_process_endfeet__chunking_invariance():
+    from archngv.building.endfeet_reconstruction.groups import group_elements
+
+    rng = np.random.default_rng(0)
+
+    n_endfeet = 30
+    points = rng.random((200, 3))
+    triangles = rng.integers(0, len(points), size=(500, 3))
+
+    p0s, p1s, p2s = points[triangles.T]
+    triangle_areas = vectorized_triangle_area(p0s - p1s, p0s - p2s)
+    triangle_travel_times = rng.random(len(triangles))
+
+    # unassigned triangles and endfeet without any triangles
+    triangle_groups = rng.integers(-1, n_endfeet, size=len(triangles))
+    triangle_groups[triangle_groups == 7] = -1
+    grouped_triangles = group_elements(triangle_groups)
+
+    endfeet_areas = _a._endfeet_areas(grouped_triangles, triangle_areas, n_endfeet)
+    target_areas = endfeet_areas * rng.uniform(0.5, 1.5, size=n_endfeet)
+    thicknesses = rng.random(n_endfeet)
+
+    args = (
+        points,
+        triangles,
+        grouped_triangles,
+        triangle_areas,
+        triangle_travel_times,
+        _a.EndfeetProperties(endfeet_areas, target_areas, thicknesses),
+    )
+
+    expected = list(_a._process_endfeet(*args))
+    npt.assert_array_equal([mesh.index for mesh in expected], np.delete(np.arange(n_endfeet), 7))
+
+    for n_workers, chunk_size in [(1, 1), (1, 4), (2, 4), (2, 100)]:
+        result = list(_a._process_endfeet(*args, n_workers=n_workers, chunk_size=chunk_size))
+        _assert_endfeet_equal(result, expected)
@@ -69,3 +69,124 @@ def test_component(plane_mesh, endfeet_points, parameters):
 
         for i, mesh in enumerate(meshes):
             assert i == mesh.index
+
+
+def test_component__compact(plane_mesh, endfeet_points, parameters):
+    np.random.seed(0)
+    expected = list(endfeet_area_generation(plane_mesh, parameters, endfeet_points))
+
+    np.random.seed(0)
+    result = list(endfeet_area_generation(plane_mesh, parameters, endfeet_points, compact=True))
+
+    assert len(result) == len(expected)
+    for mesh, expected_mesh in zip(result, expected):
+        assert mesh.index == expected_mesh.index
+        assert mesh.points.dtype == np.float32
+        npt.assert_allclose(mesh.points, expected_mesh.points)
+
+        # the triangles with equal travel times may be in different order
+        npt.assert_array_equal(
+            np.sort(mesh.vasculature_triangle_ids), np.sort(expected_mesh.vasculature_triangle_ids)
+        )
+        npt.assert_allclose(mesh.area, expected_mesh.area, rtol=1e-6)
+        npt.assert_allclose(mesh.unreduced_area, expected_mesh.unreduced_area, rtol=1e-6)
+
+
+def test_component__vasculature_references(plane_mesh, endfeet_points, parameters, tmp_path):
+    from archngv.building.exporters import export_endfeet_mesh_references
+
+    mesh_path = str(_PATH / "data/plane_10x10.obj")
+
+    np.random.seed(0)
+    copied_path = str(tmp_path / "copied.h5")
+    export_endfeet_meshes(
+        copied_path,
+        endfeet_area_generation(plane_mesh, parameters, endfeet_points),
+        len(endfeet_points),
+    )
+
+    np.random.seed(0)
+    referenced_path = str(tmp_path / "referenced.h5")
+    export_endfeet_mesh_references(
+        referenced_path,
+        endfeet_area_generation(plane_mesh, parameters, endfeet_points),
+        len(endfeet_points),
+        mesh_path,
+    )
+
+    copied = EndfootSurfaceMeshes(copied_path)
+    referenced = EndfootSurfaceMeshes(referenced_path)
+
+    assert not copied.is_referenced
+    assert referenced.is_referenced
+    assert len(copied) == len(referenced)
+
+    for name in ("surface_area", "unreduced_surface_area", "surface_thickness"):
+        npt.assert_allclose(referenced.get(name), copied.get(name))
+
+    npt.assert_allclose(referenced.mesh_points(), copied.mesh_points())
+    npt.assert_array_equal(referenced.mesh_triangles(), copied.mesh_triangles())
+
+    ids = [4, 0, 2]
+    for expected, mesh in zip(copied[ids], referenced[ids]):
+        assert expected.index == mesh.index
+        npt.assert_allclose(mesh.points, expected.points)
+        npt.assert_array_equal(mesh.triangles, expected.triangles)
+        npt.assert_allclose(mesh.area, expected.area)
+
+    mesh = referenced[1]
+    npt.assert_allclose(mesh.points, copied.mesh_points(1))
+    npt.assert_array_equal(mesh.triangles, copied.mesh_triangles(1))
+
+
+def test_component__vasculature_mesh_cache(plane_mesh, endfeet_points, parameters, tmp_path):
+    from archngv.building.exporters import (
+        export_endfeet_mesh_references,
+        export_vasculature_surface_mesh,
+    )
+    from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
+
+    cache_path = tmp_path / "vasculature_mesh.h5"
+    export_vasculature_surface_mesh(cache_path, VasculatureSurfaceMesh.from_openmesh(plane_mesh))
+
+    cached_mesh = VasculatureSurfaceMesh.load(cache_path)
+    assert isinstance(cached_mesh.points, np.memmap)
+    assert isinstance(cached_mesh.neighbors, np.memmap)
+
+    np.random.seed(0)
+    expected_path = str(tmp_path / "expected.h5")
+    export_endfeet_meshes(
+        expected_path,
+        endfeet_area_generation(plane_mesh, parameters, endfeet_points),
+        len(endfeet_points),
+    )
+
+    np.random.seed(0)
+    result_path = str(tmp_path / "result.h5")
+    export_endfeet_meshes(
+        result_path,
+        endfeet_area_generation(cached_mesh, parameters, endfeet_points),
+        len(endfeet_points),
+    )
+
+    expected = EndfootSurfaceMeshes(expected_path)
+    result = EndfootSurfaceMeshes(result_path)
+
+    for name in ("surface_area", "unreduced_surface_area", "surface_thickness"):
+        npt.assert_array_equal(result.get(name), expected.get(name))
+
+    npt.assert_array_equal(result.mesh_points(), expected.mesh_points())
+    npt.assert_array_equal(result.mesh_triangles(), expected.mesh_triangles())
+
+    # the endfeet can also refer to the cache instead of the mesh file
+    np.random.seed(0)
+    referenced_path = str(tmp_path / "referenced.h5")
+    export_endfeet_mesh_references(
+        referenced_path,
+        endfeet_area_generation(cached_mesh, parameters, endfeet_points),
+        len(endfeet_points),
+        cache_path,
+    )
+    referenced = EndfootSurfaceMeshes(referenced_path)
+    npt.assert_allclose(referenced.mesh_points(), expected.mesh_points())
+    npt.assert_array_equal(referenced.mesh_triangles(), expected.mesh_triangles())
@@ -2,9 +2,11 @@ import os
 
 import numpy as np
 import openmesh
+import pytest
 from numpy import testing as npt
 
 from archngv.building.endfeet_reconstruction import fast_marching_method as _fmm
+from archngv.exceptions import NGVError
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 
@@ -48,23 +50,18 @@ def test_closest_mesh_nodes__overlapping():
     * -- *
 
     Expected Result:
-    +---------------------------------+
-    |                                 |
-    |   .   .  .   F   .   .  .   .   |
-    |                                 |
-    |   .   A  .   .   .   .  .   .   |
-    |   .   .  .   .   .   .  B   .   |
-    |                                 |
-    |   .   .  .   .   C   .  .   .   |
-    |                                 |
-    |   .   .  .   .   .   .  .   .   |
-    |                                 |
-    |   .   .  .   D   .   .  .   E   |
-    |   .   .  .   .   .   .  .   .   |
-    |                                 |
-    |   .   .  .   .   .   .  .   .   |
-    |                                 |
-    +---------------------------------+
+    +--------------------------------+
+    |  .  .  .  .  .  .  .  .  .  .  |
+    |  .  .  F  .  .  .  .  .  .  .  |
+    |  .  .  .  .  .  .  .  .  .  .  |
+    |  .  .  .  .  .  .  .  .  .  .  |
+    |  .  .  E  .  .  C  .  .  A  .  |
+    |  .  .  .  .  .  .  .  .  .  .  |
+    |  .  .  .  .  .  .  .  .  .  .  |
+    |  .  .  .  .  .  D  .  .  B  .  |
+    |  .  .  .  .  .  .  .  .  .  .  |
+    |  .  .  .  .  .  .  .  .  .  .  |
+    +--------------------------------+
     """
     plane = openmesh.read_trimesh(os.path.join(DATA_DIR, "plane_10x10.obj"))
     neighbors, nn_offsets, xyz = _fmm._mesh_to_flat_arrays(plane)
@@ -81,7 +78,7 @@ def test_closest_mesh_nodes__overlapping():
     )
 
     mesh_vertices = _fmm._find_closest_mesh_nodes(endfeet_points, xyz, neighbors, nn_offsets)
-    npt.assert_allclose(mesh_vertices, [72, 67, 55, 34, 38, 84])
+    npt.assert_allclose(mesh_vertices, [58, 28, 55, 25, 52, 82])
 
 
 def test_closest_mesh_nodes__overlapping_and_normal():
@@ -102,7 +99,50 @@ def test_closest_mesh_nodes__overlapping_and_normal():
     )
 
     mesh_vertices = _fmm._find_closest_mesh_nodes(endfeet_points, xyz, neighbors, nn_offsets)
-    npt.assert_allclose(mesh_vertices, [0, 72, 67, 55, 34, 38, 84, 99])
+    npt.assert_allclose(mesh_vertices, [0, 58, 28, 55, 25, 52, 82, 99])
+
+
+def _assert_disjoint_one_rings(mesh_vertices, neighbors, nn_offsets):
+    rings = [
+        set(neighbors[nn_offsets[v] : nn_offsets[v + 1]]) | {v} for v in np.unique(mesh_vertices)
+    ]
+    assert len(np.unique(mesh_vertices)) == len(mesh_vertices)
+    for i, ring in enumerate(rings):
+        for other in rings[i + 1 :]:
+            assert not ring & other
+
+
+def test_closest_mesh_nodes__multiple_overlapping_groups():
+    plane = openmesh.read_trimesh(os.path.join(DATA_DIR, "plane_10x10.obj"))
+    neighbors, nn_offsets, xyz = _fmm._mesh_to_flat_arrays(plane)
+
+    # three endfeet converge to each of the nodes 11, 18 and 88
+    endfeet_points = np.repeat(xyz[[11, 18, 88]], 3, axis=0)
+    endfeet_points[:, 2] = np.tile([0.01, 0.0, 0.02], 3)
+
+    mesh_vertices = _fmm._find_closest_mesh_nodes(endfeet_points, xyz, neighbors, nn_offsets)
+
+    # the closest endfoot of each group stays at the node
+    npt.assert_array_equal(mesh_vertices[[1, 4, 7]], [11, 18, 88])
+    _assert_disjoint_one_rings(mesh_vertices, neighbors, nn_offsets)
+
+    # the result does not depend on the order of the groups
+    permutation = np.array([6, 7, 8, 0, 1, 2, 3, 4, 5])
+    npt.assert_array_equal(
+        _fmm._find_closest_mesh_nodes(endfeet_points[permutation], xyz, neighbors, nn_offsets),
+        mesh_vertices[permutation],
+    )
+
+
+def test_closest_mesh_nodes__no_available_vertices():
+    plane = openmesh.read_trimesh(os.path.join(DATA_DIR, "plane_10x10.obj"))
+    neighbors, nn_offsets, xyz = _fmm._mesh_to_flat_arrays(plane)
+
+    endfeet_points = np.repeat(xyz[[55]], 30, axis=0)
+    endfeet_points[:, 2] = np.linspace(0.0, 0.1, 30)
+
+    with pytest.raises(NGVError, match="Could not find neighboring available vertices"):
+        _fmm._find_closest_mesh_nodes(endfeet_points, xyz, neighbors, nn_offsets)
 
 
 def test_mesh_to_flat_arrays():
@@ -168,3 +208,107 @@ def test_mesh_to_flat_arrays():
     npt.assert_allclose(expected_neighbors, neighbors)
     npt.assert_allclose(expected_offsets, offsets)
     npt.assert_allclose(expected_xyz, xyz)
+
+
+def test_block_submesh():
+    plane = openmesh.read_trimesh(os.path.join(DATA_DIR, "plane_10x10.obj"))
+    neighbors, nn_offsets, _ = _fmm._mesh_to_flat_arrays(plane)
+
+    vertices, local_neighbors, local_offsets = _fmm._block_submesh(
+        np.array([54, 55]), neighbors, nn_offsets
+    )
+    npt.assert_array_equal(vertices, [44, 45, 46, 53, 54, 55, 56, 63, 64, 65])
+
+    # only the block vertices have neighbors, in the same ring order
+    npt.assert_array_equal(np.diff(local_offsets), [0, 0, 0, 0, 6, 6, 0, 0, 0, 0])
+    npt.assert_array_equal(
+        vertices[local_neighbors],
+        np.concatenate(
+            (
+                neighbors[nn_offsets[54] : nn_offsets[55]],
+                neighbors[nn_offsets[55] : nn_offsets[56]],
+            )
+        ),
+    )
+
+
+@pytest.fixture(scope="module")
+def sphere_mesh():
+    import trimesh
+
+    sphere = trimesh.creation.icosphere(subdivisions=4, radius=100.0)
+    return openmesh.TriMesh(sphere.vertices, sphere.faces)
+
+
+@pytest.fixture(scope="module")
+def sphere_seeds(sphere_mesh):
+    points = sphere_mesh.points()
+    return points[np.random.default_rng(0).choice(len(points), size=100, replace=False)]
+
+
+def test_fast_marching_eikonal_solver__partitioned(sphere_mesh, sphere_seeds):
+    expected = _fmm.fast_marching_eikonal_solver(sphere_mesh, sphere_seeds, 15.0)
+
+    # the overlapping blocks cover the entire mesh
+    result = _fmm.fast_marching_eikonal_solver(
+        sphere_mesh, sphere_seeds, 15.0, block_size=50.0, overlap=200.0
+    )
+    for values, expected_values in zip(result, expected):
+        npt.assert_array_equal(values, expected_values)
+
+    # the propagation order at the fronts of the wavefronts may differ across the blocks
+    groups, travel_times, status = _fmm.fast_marching_eikonal_solver(
+        sphere_mesh, sphere_seeds, 15.0, block_size=50.0
+    )
+    assert np.count_nonzero(groups != expected[0]) < 0.01 * len(groups)
+    npt.assert_array_equal(status, expected[2])
+
+    is_visited = status == 1
+    is_different = ~np.isclose(travel_times[is_visited], expected[1][is_visited])
+    assert np.count_nonzero(is_different) < 0.01 * np.count_nonzero(is_visited)
+
+    result = _fmm.fast_marching_eikonal_solver(
+        sphere_mesh, sphere_seeds, 15.0, block_size=50.0, n_workers=2
+    )
+    npt.assert_array_equal(result[0], groups)
+    npt.assert_array_equal(result[1], travel_times)
+
+
+def test_fast_marching_eikonal_solver__partitioned_realistic_overlap():
+    import trimesh
+
+    sphere = trimesh.creation.icosphere(subdivisions=5, radius=100.0)
+    mesh = openmesh.TriMesh(sphere.vertices, sphere.faces)
+
+    points = mesh.points()
+    seeds = points[np.random.default_rng(1).choice(len(points), size=400, replace=False)]
+
+    cutoff_distance = 15.0
+    expected_groups, expected_travel_times, expected_status = _fmm.fast_marching_eikonal_solver(
+        mesh, seeds, cutoff_distance
+    )
+
+    # many blocks, each of which sees only the seeds within twice the cutoff around it
+    block_size = 2.0 * cutoff_distance
+    _, blocks, _, _ = _fmm._block_vertices(np.asarray(points), block_size)
+    assert len(blocks) > 100
+
+    groups, travel_times, status = _fmm.fast_marching_eikonal_solver(
+        mesh, seeds, cutoff_distance, block_size=block_size, overlap=2.0 * cutoff_distance
+    )
+    npt.assert_array_equal(status, expected_status)
+
+    is_visited = expected_status == 1
+    assert np.count_nonzero(is_visited) > 0.5 * len(points)
+
+    assert np.count_nonzero(groups != expected_groups) < 0.002 * np.count_nonzero(is_visited)
+
+    is_different = ~np.isclose(travel_times[is_visited], expected_travel_times[is_visited])
+    assert np.count_nonzero(is_different) < 0.005 * np.count_nonzero(is_visited)
+
+
+def test_fast_marching_eikonal_solver__partitioned_overlap(sphere_mesh, sphere_seeds):
+    with pytest.raises(NGVError, match="must be at least the cutoff distance"):
+        _fmm.fast_marching_eikonal_solver(
+            sphere_mesh, sphere_seeds, 15.0, block_size=50.0, overlap=10.0
+        )
@@ -0,0 +1,94 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy import testing as npt
+from vascpy import PointVasculature
+
+from archngv.building.endfeet_reconstruction import gliovascular_properties as tested
+from archngv.core.datasets import CellData, EndfootSurfaceMeshes, GliovascularConnectivity
+
+BUILD_DIR = Path(__file__).resolve().parents[2] / "app/data/frozen-build"
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return (
+        CellData(BUILD_DIR / "sonata/nodes/glia.h5"),
+        GliovascularConnectivity(BUILD_DIR / "sonata.tmp/edges/gliovascular.connectivity.h5"),
+        PointVasculature.load_sonata(BUILD_DIR / "sonata/nodes/vasculature.h5"),
+        EndfootSurfaceMeshes(BUILD_DIR / "endfeet_meshes.h5"),
+        BUILD_DIR / "morphologies",
+    )
+
+
+def _per_astrocyte_data(astrocytes, gv_connectivity, morph_dir):
+    """The data of each astrocyte, read one astrocyte at a time."""
+    for astro_id in range(len(astrocytes)):
+        endfeet_ids = gv_connectivity.astrocyte_endfeet(astro_id)
+
+        if endfeet_ids.size == 0:
+            continue
+
+        morphology_name = astrocytes.get_property("morphology", ids=astro_id)[0]
+
+        yield {
+            "index": astro_id,
+            "endfeet_ids": endfeet_ids,
+            "endfeet_surface_targets": gv_connectivity.vasculature_surface_targets(endfeet_ids),
+            "morphology_path": str(Path(morph_dir, morphology_name + ".h5")),
+            "morphology_position": astrocytes.positions(index=astro_id)[0],
+        }
+
+
+@pytest.mark.parametrize("beg, end", [(0, 5), (1, 4), (2, 2)])
+def test_dispatch_endfeet_data(inputs, beg, end):
+    astrocytes, gv_connectivity, vasculature, _, morph_dir = inputs
+
+    expected = [
+        data
+        for data in _per_astrocyte_data(astrocytes, gv_connectivity, morph_dir)
+        if beg <= data["index"] < end
+    ]
+    endfeet_data = tested._prefetch_endfeet_data(
+        astrocytes, gv_connectivity, vasculature, morph_dir
+    )
+    result = list(tested._dispatch_endfeet_data(endfeet_data, beg, end))
+
+    assert len(astrocytes) == 5
+    assert len(result) == len(expected)
+
+    for data, expected_data in zip(result, expected):
+        assert data["index"] == expected_data["index"]
+        assert data["morphology_path"] == expected_data["morphology_path"]
+
+        for name in ("endfeet_ids", "endfeet_surface_targets", "morphology_position"):
+            npt.assert_array_equal(data[name], expected_data[name])
+
+    # the segments of the endfeet grouped by astrocyte
+    vasc_segment_ids = gv_connectivity.vasculature_sections_segments(endfeet_data["endfeet_ids"])[
+        :, 0
+    ]
+    npt.assert_array_equal(
+        endfeet_data["vasculature_segments"],
+        vasculature.points[vasculature.edges[vasc_segment_ids]],
+    )
+
+
+def test_endfeet_mesh_properties__chunking_invariance():
+    paths = {
+        "astrocytes": BUILD_DIR / "sonata/nodes/glia.h5",
+        "gliovascular_connectivity": BUILD_DIR / "sonata.tmp/edges/gliovascular.connectivity.h5",
+        "vasculature": BUILD_DIR / "sonata/nodes/vasculature.h5",
+        "endfeet_meshes": BUILD_DIR / "endfeet_meshes.h5",
+        "morph_dir": BUILD_DIR / "morphologies",
+    }
+    expected = tested.endfeet_mesh_properties(0, paths)
+
+    for n_workers, chunk_size in [(1, 1), (1, 2), (2, 3)]:
+        result = tested.endfeet_mesh_properties(
+            0, paths, n_workers=n_workers, chunk_size=chunk_size
+        )
+        assert result.keys() == expected.keys()
+        for name, values in result.items():
+            npt.assert_array_equal(values, expected[name])
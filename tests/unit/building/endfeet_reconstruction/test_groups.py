@@ -54,6 +54,10 @@ def test_group_elements():
     npt.assert_array_equal(grouped_elements.get_group_ids(3), [4, 5])  #  2
     npt.assert_array_equal(grouped_elements.get_group_ids(4), [1, 2, 3])  #  3
 
+    grouped_elements = _g.group_elements(v_group_index, dtype=np.int32)
+    assert grouped_elements.ids.dtype == np.int32
+    npt.assert_array_equal(grouped_elements.ids, [0, 8, 9, 7, 6, 4, 5, 1, 2, 3])
+
 
 def test_vertex_to_triangle_groups():
     vertex_groups = np.array([-1, 0, 0, 0, 0, 0, 1, 1, 1, 1, -1, -1])
@@ -78,3 +82,7 @@ def test_vertex_to_triangle_groups():
     """
 
     npt.assert_array_equal(triangle_groups, [0, 0, 0, 0, 1, 1, 1, -1])
+
+    triangle_groups = _g.vertex_to_triangle_groups(vertex_groups, triangles, dtype=np.int32)
+    assert triangle_groups.dtype == np.int32
+    npt.assert_array_equal(triangle_groups, [0, 0, 0, 0, 1, 1, 1, -1])
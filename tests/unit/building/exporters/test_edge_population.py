@@ -61,3 +61,53 @@ def test_add_properties_to_edge_population__assertions(edge_population_file, pro
         tested.add_properties_to_edge_population(
             edge_population_file, "gliovascular", new_properties
         )
+
+
+def test_write_edge_population__storage(tmp_path):
+    import h5py
+    import libsonata
+    import pandas as pd
+    import voxcell
+
+    source = voxcell.CellCollection.from_dataframe(
+        pd.DataFrame(np.zeros((3, 3)), columns=["x", "y", "z"], index=np.arange(1, 4))
+    )
+    source.population_name = "source"
+    target = voxcell.CellCollection.from_dataframe(
+        pd.DataFrame(np.zeros((4, 3)), columns=["x", "y", "z"], index=np.arange(1, 5))
+    )
+    target.population_name = "target"
+
+    filepath = str(tmp_path / "edges.h5")
+    tested.write_edge_population(
+        output_path=filepath,
+        population_name="edges",
+        source_population=source,
+        target_population=target,
+        source_node_ids=np.array([0, 1, 2, 2, 0]),
+        target_node_ids=np.array([0, 0, 1, 2, 3]),
+        properties={"length": np.arange(5, dtype=np.float32)},
+        storage={"chunk_size": 2},
+    )
+
+    with h5py.File(filepath, mode="r") as fp:
+        for name in ("edge_type_id", "source_node_id", "target_node_id", "0/length"):
+            assert fp[f"edges/edges/{name}"].chunks == (2,)
+
+    population = libsonata.EdgeStorage(filepath).open_population("edges")
+    npt.assert_array_equal(population.source_nodes(population.select_all()), [0, 1, 2, 2, 0])
+    npt.assert_array_equal(
+        population.get_attribute("length", population.select_all()), np.arange(5)
+    )
+    npt.assert_array_equal(population.afferent_edges([0]).flatten(), [0, 1])
+
+
+def test_edge_population__storage_lzf(edge_population_file):
+    # lzf is an h5py filter that libsonata cannot read
+    with pytest.raises(NGVError, match="libsonata"):
+        tested.add_properties_to_edge_population(
+            edge_population_file,
+            "gliovascular",
+            {"john": np.arange(23)},
+            storage={"compression": "lzf"},
+        )
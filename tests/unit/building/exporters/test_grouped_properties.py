@@ -7,6 +7,7 @@ from numpy import testing as npt
 
 from archngv.building import exporters as tested
 from archngv.core.datasets import GroupedProperties
+from archngv.exceptions import NGVError
 
 
 @pytest.fixture(scope="session")
@@ -85,3 +86,272 @@ def test_export_grouped_properties_api(properties, output_file):
             )
 
             npt.assert_allclose(values, expected_values)
+
+
+@pytest.mark.parametrize("group_indices", [[], [0], [1, 0], [3, 1, 1, 2, 0], [4, 2, 3]])
+def test_export_grouped_properties_get_groups(properties, output_file, group_indices):
+    g = GroupedProperties(output_file)
+
+    for property_name, dct in properties.items():
+        expected_data, expected_offsets = dct["values"], dct["offsets"]
+
+        n_groups = len(expected_data) if expected_offsets is None else len(expected_offsets) - 1
+        indices = [i for i in group_indices if i < n_groups]
+
+        values, offsets = g.get_groups(property_name, indices)
+
+        assert values.dtype == expected_data.dtype
+
+        if expected_offsets is None:
+            assert offsets is None
+            npt.assert_allclose(values, expected_data[indices].reshape(values.shape))
+        else:
+            assert len(offsets) == len(indices) + 1
+            for i, group_index in enumerate(indices):
+                npt.assert_allclose(
+                    values[offsets[i] : offsets[i + 1]],
+                    expected_data[
+                        expected_offsets[group_index] : expected_offsets[group_index + 1]
+                    ],
+                )
+
+
+def test_export_grouped_properties_get_grouped_values(output_file):
+    g = GroupedProperties(output_file)
+
+    values, offsets = g._get_grouped_values("property3", np.array([1, 0], dtype=np.uint64))
+    expected_values, expected_offsets = g.get_groups("property3", [1, 0])
+    npt.assert_array_equal(values, expected_values)
+    npt.assert_array_equal(offsets, expected_offsets)
+
+    with pytest.raises(NGVError, match="one value per group"):
+        g._get_grouped_values("property5", [0])
+
+
+@pytest.mark.parametrize(
+    "storage",
+    [
+        {"chunk_size": 2},
+        {"compression": "gzip"},
+        {"compression": "lzf", "chunk_size": 100},
+        {"compression": "gzip", "compression_level": 9, "chunk_size": 1},
+    ],
+)
+def test_export_grouped_properties__storage(properties, tmp_path, storage):
+    filepath = tmp_path / "output.h5"
+    tested.export_grouped_properties(filepath, properties, storage=storage)
+
+    with h5py.File(filepath, mode="r") as fp:
+        for property_name, dct in properties.items():
+            dset = fp["data"][property_name]
+
+            assert dset.chunks is not None
+            assert dset.compression == storage.get("compression", None)
+            assert dset.shuffle == ("compression" in storage)
+
+            npt.assert_allclose(dset[:], dct["values"])
+
+    g = GroupedProperties(filepath)
+    for property_name, dct in properties.items():
+        if dct["offsets"] is not None:
+            npt.assert_allclose(g.get(property_name, 1), dct["values"][slice(*dct["offsets"][1:3])])
+
+
+def test_dataset_storage_options():
+    values = np.zeros((100000, 3), dtype=np.float32)
+
+    assert tested.dataset_storage_options(values) == {}
+    assert tested.dataset_storage_options(values, {"chunk_size": None, "compression": None}) == {}
+
+    assert tested.dataset_storage_options(values, {"chunk_size": 10}) == {"chunks": (10, 3)}
+
+    # chunk size is clipped to the dataset length
+    assert tested.dataset_storage_options(values[:5], {"chunk_size": 10}) == {"chunks": (5, 3)}
+
+    options = tested.dataset_storage_options(values, {"compression": "gzip"})
+    assert options == {
+        "compression": "gzip",
+        "compression_opts": 4,
+        "shuffle": True,
+        "chunks": (tested.DEFAULT_CHUNK_BYTES // 12, 3),
+    }
+
+    # multiple of the typical group length
+    offsets = np.arange(0, 100001, 1000)
+    options = tested.dataset_storage_options(values, {"compression": "lzf"}, offsets)
+    assert options == {"compression": "lzf", "shuffle": True, "chunks": (5000, 3)}
+
+    # empty datasets cannot be chunked
+    assert tested.dataset_storage_options(np.empty(0), {"compression": "gzip"}) == {}
+    assert tested.dataset_storage_options(values[:0], {"chunk_size": 10}) == {}
+
+    with pytest.raises(tested.NGVError):
+        tested.dataset_storage_options(values, {"compression": "zstd"})
+
+    with pytest.raises(tested.NGVError):
+        tested.dataset_storage_options(np.empty(0), {"compression": "zstd"})
+
+
+def test_resizable_storage_options():
+    dtype = np.dtype(np.float32)
+
+    # resizable datasets start empty but are chunked and compressed
+    assert tested._resizable_storage_options(dtype, (3,), {"compression": "gzip"}) == {
+        "compression": "gzip",
+        "compression_opts": 4,
+        "shuffle": True,
+        "chunks": (tested.DEFAULT_CHUNK_BYTES // 12, 3),
+        "maxshape": (None, 3),
+    }
+    assert tested._resizable_storage_options(dtype, (), {"chunk_size": 10}) == {
+        "chunks": (10,),
+        "maxshape": (None,),
+    }
+    assert tested._resizable_storage_options(dtype, (3,), None) == {
+        "chunks": (tested.DEFAULT_CHUNK_BYTES // 12, 3),
+        "maxshape": (None, 3),
+    }
+
+    with pytest.raises(tested.NGVError):
+        tested._resizable_storage_options(dtype, (3,), {"compression": "zstd"})
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 100])
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_export_grouped_properties_iter_groups(properties, output_file, batch_size, prefetch):
+    g = GroupedProperties(output_file)
+
+    names = ["property2", "property4"]
+    groups = list(g.iter_groups(names, batch_size=batch_size, prefetch=prefetch))
+
+    assert len(groups) == 7
+
+    for i, group in enumerate(groups):
+        assert list(group) == names
+        for name in names:
+            npt.assert_array_equal(group[name], g.get(name, i))
+
+
+def test_export_grouped_properties_iter_groups__no_offsets(properties, output_file):
+    g = GroupedProperties(output_file)
+
+    groups = list(g.iter_groups(["property1", "property3", "property6"], batch_size=1))
+
+    # the number of groups is determined by the first property
+    assert len(groups) == 2
+    for i, group in enumerate(groups):
+        npt.assert_array_equal(group["property6"], properties["property6"]["values"][i])
+        npt.assert_array_equal(group["property3"], g.get("property3", i))
+
+
+@pytest.mark.parametrize("buffer_bytes", [1, 40, 2**20])
+@pytest.mark.parametrize("storage", [None, {"compression": "gzip", "chunk_size": 2}])
+def test_grouped_properties_writer(tmp_path, buffer_bytes, storage):
+    group_indices = [1, 2, 4, 5]
+    points = [np.random.random((n, 3)) for n in (2, 0, 3, 1)]
+    ids = [np.arange(n) for n in (1, 4, 0, 2)]
+    areas = [1.0, 2.0, 3.0, 4.0]
+
+    expected_path = tmp_path / "expected.h5"
+    tested.export_grouped_properties(
+        expected_path,
+        {
+            "points": {
+                "values": np.vstack(points).astype(np.float32),
+                "offsets": np.array([0, 0, 2, 2, 2, 5, 6, 6, 6]),
+            },
+            "ids": {
+                "values": np.concatenate(ids),
+                "offsets": np.array([0, 0, 1, 5, 5, 5, 7, 7, 7]),
+            },
+            "area": {
+                "values": np.array([0.0, 1.0, 2.0, 0.0, 3.0, 4.0, 0.0, 0.0], dtype=np.float32),
+                "offsets": None,
+            },
+        },
+    )
+
+    filepath = tmp_path / "output.h5"
+    with tested.GroupedPropertiesWriter(
+        filepath,
+        n_groups=8,
+        grouped_properties={"points": (np.float32, (3,)), "ids": (np.int64, ())},
+        linear_properties={"area": np.float32},
+        storage=storage,
+        buffer_bytes=buffer_bytes,
+    ) as writer:
+        for index, group_points, group_ids, area in zip(group_indices, points, ids, areas):
+            writer.append(index, points=group_points, ids=group_ids, area=area)
+
+    with h5py.File(expected_path, mode="r") as expected, h5py.File(filepath, mode="r") as result:
+        for group_name in ("data", "offsets"):
+            assert list(result[group_name]) == list(expected[group_name])
+            for name, dset in expected[group_name].items():
+                assert result[group_name][name].dtype == dset.dtype
+                npt.assert_array_equal(result[group_name][name][:], dset[:])
+
+    # no groups, the empty datasets are not chunked
+    filepath = tmp_path / "empty.h5"
+    with tested.GroupedPropertiesWriter(
+        filepath,
+        n_groups=0,
+        grouped_properties={"points": (np.float32, (3,))},
+        linear_properties={"area": np.float32},
+        storage=storage,
+        buffer_bytes=buffer_bytes,
+    ):
+        pass
+
+    with h5py.File(filepath, mode="r") as result:
+        assert result["data/points"].shape == (0, 3)
+        assert result["data/area"].shape == (0,)
+        npt.assert_array_equal(result["offsets/points"][:], [0])
+
+
+@pytest.mark.parametrize(
+    "storage, compression, chunk_size",
+    [
+        ({"compression": "gzip"}, "gzip", None),
+        ({"compression": "gzip", "chunk_size": 2}, "gzip", 2),
+        ({"chunk_size": 2}, None, 2),
+    ],
+)
+def test_grouped_properties_writer__storage(tmp_path, storage, compression, chunk_size):
+    filepath = tmp_path / "output.h5"
+    with tested.GroupedPropertiesWriter(
+        filepath,
+        n_groups=8,
+        grouped_properties={"points": (np.float32, (3,))},
+        linear_properties={"area": np.float32},
+        storage=storage,
+    ) as writer:
+        for index in (1, 2, 4, 5):
+            writer.append(index, points=np.random.random((index, 3)), area=float(index))
+
+    with h5py.File(filepath, mode="r") as h5f:
+        datasets = {
+            "data/points": (chunk_size or tested.DEFAULT_CHUNK_BYTES // 12, 3),
+            # the default chunk size is clipped to the length of the fixed size datasets
+            "offsets/points": (chunk_size or 9,),
+            "data/area": (chunk_size or 8,),
+        }
+        for name, chunks in datasets.items():
+            dset = h5f[name]
+            assert dset.compression == compression, name
+            assert dset.shuffle == (compression is not None), name
+            assert dset.chunks == chunks, name
+
+
+def test_grouped_properties_writer__unordered(tmp_path):
+    from archngv.exceptions import NGVError
+
+    with tested.GroupedPropertiesWriter(
+        tmp_path / "output.h5", 3, {"ids": (np.int64, ())}, {}
+    ) as writer:
+        writer.append(1, ids=[1, 2])
+
+        with pytest.raises(NGVError, match="increasing order"):
+            writer.append(1, ids=[3])
+
+        with pytest.raises(NGVError, match="increasing order"):
+            writer.append(3, ids=[3])
@@ -6,7 +6,7 @@ import pytest
 from numpy import testing as npt
 
 from archngv.building.morphology_synthesis import endfoot_compartment as tested
-from archngv.core.datasets import EndfootMesh
+from archngv.core.datasets import EndfootMesh, PackedEndfootMeshes
 
 
 def _rot2D(p, theta):
@@ -154,3 +154,68 @@ def test_create_endfeet_compartment_data():
     npt.assert_allclose(lengths, [0.5, 0.0, 0.5, 0.0])
     npt.assert_allclose(diameters, [4.0, 0.0, 4.0, 0.0])
     npt.assert_allclose(perimeters, [8.0, 0.0, 8.0, 0.0])
+
+
+def test_create_packed_endfeet_compartment_data():
+    rng = np.random.default_rng(0)
+
+    n_endfeet = 20
+    segments = rng.uniform(-10.0, 10.0, size=(n_endfeet, 2, 3))
+    targets = rng.uniform(-10.0, 10.0, size=(n_endfeet, 3))
+
+    counts = rng.integers(0, 6, size=n_endfeet)
+    meshes = [
+        EndfootMesh(
+            index=i,
+            points=rng.uniform(-10.0, 10.0, size=(count, 3)),
+            triangles=np.zeros((count // 3, 3), dtype=np.int64),
+            area=rng.uniform(1.0, 5.0),
+            unreduced_area=6.0,
+            thickness=rng.uniform(0.1, 1.0),
+        )
+        for i, count in enumerate(counts)
+    ]
+    assert any(len(mesh.triangles) == 0 for mesh in meshes)
+
+    expected_lengths = np.zeros(n_endfeet)
+    for i, (segment, target, mesh) in enumerate(zip(segments, targets, meshes)):
+        if len(mesh.triangles) > 0:
+            expected_lengths[i] = tested._extent_across_vasculature_segment_medial_axis(
+                mesh.points, target, segment.copy()
+            )
+
+    packed = PackedEndfootMeshes(
+        indices=np.arange(n_endfeet),
+        points=np.concatenate([mesh.points for mesh in meshes]),
+        points_offsets=np.concatenate(([0], np.cumsum(counts))),
+        triangles=np.concatenate([mesh.triangles for mesh in meshes]),
+        triangles_offsets=np.concatenate(([0], np.cumsum(counts // 3))),
+        area=np.array([mesh.area for mesh in meshes]),
+        unreduced_area=np.full(n_endfeet, 6.0),
+        thickness=np.array([mesh.thickness for mesh in meshes]),
+    )
+    lengths, diameters, perimeters = tested.create_packed_endfeet_compartment_data(
+        segments, targets, packed
+    )
+    npt.assert_allclose(lengths, expected_lengths, rtol=1e-6)
+
+    mask = expected_lengths > 0.0
+    expected_diameters, expected_perimeters = tested._endfoot_compartment_features(
+        expected_lengths[mask], packed.area[mask], packed.thickness[mask]
+    )
+    npt.assert_allclose(diameters[mask], expected_diameters, rtol=1e-6)
+    npt.assert_allclose(perimeters[mask], expected_perimeters, rtol=1e-6)
+    npt.assert_array_equal(diameters[~mask], 0.0)
+    npt.assert_array_equal(perimeters[~mask], 0.0)
+
+    # the list of meshes gives the same result
+    for result, expected in zip(
+        tested.create_endfeet_compartment_data(segments, targets, meshes),
+        (lengths, diameters, perimeters),
+    ):
+        npt.assert_array_equal(result, expected)
+
+
+def test_create_endfeet_compartment_data__empty():
+    for result in tested.create_endfeet_compartment_data(np.empty((0, 2, 3)), np.empty((0, 3)), []):
+        assert result.shape == (0,)
@@ -158,3 +158,32 @@ def test_bulk_attributes(
     npt.assert_allclose(surface_areas, areas_per_entry)
     npt.assert_allclose(unreduced_surface_areas, initial_areas_per_entry)
     npt.assert_allclose(thicknesses, thicknesses_per_entry)
+
+
+def test__getitem__iterable(endfeet_surface_meshes):
+    indices = [3, 0, 5, 3, 1]
+
+    endfeet = endfeet_surface_meshes[indices]
+    assert len(endfeet) == len(indices)
+
+    for endfoot, endfoot_id in zip(endfeet, indices):
+        expected = endfeet_surface_meshes[endfoot_id]
+        assert endfoot.index == expected.index
+        npt.assert_allclose(endfoot.points, expected.points)
+        npt.assert_array_equal(endfoot.triangles, expected.triangles)
+        npt.assert_allclose(endfoot.area, expected.area)
+        npt.assert_allclose(endfoot.unreduced_area, expected.unreduced_area)
+        npt.assert_allclose(endfoot.thickness, expected.thickness)
+
+
+def test_packed_meshes(endfeet_surface_meshes, points_per_entry, triangles_per_entry):
+    packed = endfeet_surface_meshes.packed_meshes([2, 4, 0])
+
+    assert len(packed) == 3
+    npt.assert_array_equal(packed.indices, [2, 4, 0])
+    npt.assert_array_equal(packed.points_offsets, [0, 5, 5, 8])
+    npt.assert_array_equal(packed.triangles_offsets, [0, 3, 3, 4])
+    npt.assert_allclose(packed.points, np.vstack((points_per_entry[2], points_per_entry[0])))
+    npt.assert_array_equal(
+        packed.triangles, np.vstack((triangles_per_entry[2], triangles_per_entry[0]))
+    )
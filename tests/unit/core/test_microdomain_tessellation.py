@@ -150,3 +150,82 @@ def test_connectivity(microdomains):
 def test_export_mesh(microdomains, directory_path):
     filename = os.path.join(directory_path, "test_microdomains.stl")
     microdomains.export_mesh(filename)
+
+
+@pytest.fixture(scope="module")
+def cube_domains(tmpdir_factory):
+    """A 3x2x2 grid of overlapping cubes."""
+    from scipy.spatial import ConvexHull
+
+    unit_cube = np.array(
+        [[x, y, z] for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)], dtype=np.float32
+    )
+
+    domains = []
+    for corner in np.ndindex(3, 2, 2):
+        points = 1.2 * unit_cube + np.asarray(corner, dtype=np.float32)
+        triangles = ConvexHull(points).simplices
+        polygon_ids = np.arange(len(triangles))
+        domains.append(
+            Microdomain(
+                points,
+                np.column_stack((polygon_ids, triangles)),
+                np.full(len(triangles), fill_value=-1),
+            )
+        )
+
+    path = os.path.join(tmpdir_factory.mktemp("cubes"), "microdomains.h5")
+    export_microdomains(path, domains, np.ones(len(domains)))
+    return Microdomains(path)
+
+
+def _to_lists(domain_ids, offsets):
+    return [domain_ids[beg:end].tolist() for beg, end in zip(offsets[:-1], offsets[1:])]
+
+
+def test_domain_bounds(cube_domains):
+    bounds = cube_domains.domain_bounds
+    assert bounds.shape == (12, 6)
+    npt.assert_allclose(bounds[0], [0.0, 0.0, 0.0, 1.2, 1.2, 1.2], rtol=1e-6)
+    npt.assert_allclose(bounds[-1], [2.0, 1.0, 1.0, 3.2, 2.2, 2.2], rtol=1e-6)
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 8192])
+def test_domains_containing(cube_domains, block_size):
+    from archngv.spatial.collision import convex_shape_with_spheres
+
+    points = np.random.default_rng(0).uniform(-0.5, 3.5, size=(500, 3))
+
+    domain_ids, offsets = cube_domains.domains_containing(points, block_size=block_size)
+    assert len(offsets) == len(points) + 1
+
+    expected = [[] for _ in points]
+    for domain_id, domain in enumerate(cube_domains):
+        mask = convex_shape_with_spheres(
+            domain.face_points, domain.face_normals, points, np.zeros(len(points))
+        )
+        for point_id in np.flatnonzero(mask):
+            expected[point_id].append(domain_id)
+
+    assert _to_lists(domain_ids, offsets) == expected
+
+
+def test_domains_containing__overlap(cube_domains):
+    domain_ids, offsets = cube_domains.domains_containing([[1.1, 1.1, 1.1], [10.0, 0.0, 0.0]])
+    assert _to_lists(domain_ids, offsets) == [[0, 1, 2, 3, 4, 5, 6, 7], []]
+
+
+def test_domains_intersecting(cube_domains):
+    boxes = np.array(
+        [
+            [0.1, 0.1, 0.1, 0.2, 0.2, 0.2],
+            [-1.0, -1.0, -1.0, 10.0, 10.0, 10.0],
+            [5.0, 5.0, 5.0, 6.0, 6.0, 6.0],
+            [2.5, 1.5, 1.5, 4.0, 4.0, 4.0],
+        ]
+    )
+    domain_ids, offsets = cube_domains.domains_intersecting(boxes)
+    assert _to_lists(domain_ids, offsets) == [[0], list(range(12)), [], [11]]
+
+    domain_ids, offsets = cube_domains.domains_intersecting(boxes[0])
+    assert _to_lists(domain_ids, offsets) == [[0]]
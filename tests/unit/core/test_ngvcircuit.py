@@ -14,6 +14,7 @@ from voxcell import VoxelData
 import archngv.core.circuit as test_module
 from archngv.core.datasets import EndfootSurfaceMeshes, Microdomains
 from archngv.core.structures import Atlas
+from archngv.core.vasculature_mesh import VasculatureSurfaceMesh
 from archngv.exceptions import NGVError
 
 TEST_DIR = Path(__file__).resolve().parent
@@ -128,6 +129,27 @@ class TestCircuit:
         vasculature = self.circuit.vasculature
         assert isinstance(vasculature.surface_mesh, trimesh.base.Trimesh)
 
+    def test_vasculature_surface_mesh_arrays(self, tmp_path):
+        from archngv.building.exporters import export_vasculature_surface_mesh
+
+        vasculature = self.circuit.vasculature
+        assert "vasculature_mesh_cache" not in vasculature.config
+
+        expected = vasculature.surface_mesh_arrays
+        assert isinstance(expected, VasculatureSurfaceMesh)
+        assert len(expected.triangles) == len(vasculature.surface_mesh.faces)
+
+        cache_path = tmp_path / "vasculature_mesh.h5"
+        export_vasculature_surface_mesh(cache_path, expected)
+
+        vasculature = test_module.NGVCircuit(TEST_DATA_DIR / "circuit_config.json").vasculature
+        with patch.dict(vasculature.config, {"vasculature_mesh_cache": str(cache_path)}):
+            result = vasculature.surface_mesh_arrays
+
+        assert isinstance(result.points, np.memmap)
+        npt.assert_array_equal(result.points, expected.points)
+        npt.assert_array_equal(result.triangles, expected.triangles)
+
     def test_gliovascular_api(self):
         gv = self.circuit.gliovascular_connectome
 
@@ -0,0 +1,74 @@
+import numpy as np
+import numpy.testing as npt
+
+import archngv.core.vasculature_mesh as tested
+
+
+def test_vasculature_surface_mesh(tmp_path):
+    import openmesh
+
+    from archngv.building.exporters import export_vasculature_surface_mesh
+
+    mesh = openmesh.TriMesh()
+    vertices = [
+        mesh.add_vertex(point)
+        for point in np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]])
+    ]
+    mesh.add_face(vertices[0], vertices[1], vertices[2])
+    mesh.add_face(vertices[1], vertices[3], vertices[2])
+
+    surface_mesh = tested.VasculatureSurfaceMesh.from_openmesh(mesh)
+
+    npt.assert_array_equal(surface_mesh.triangles, [[0, 1, 2], [1, 3, 2]])
+    npt.assert_allclose(surface_mesh.triangle_areas, [0.5, 0.5])
+    npt.assert_array_equal(surface_mesh.neighbors_offsets, [0, 2, 5, 8, 10])
+    for vertex, expected in enumerate([[1, 2], [0, 2, 3], [0, 1, 3], [1, 2]]):
+        beg, end = surface_mesh.neighbors_offsets[vertex : vertex + 2]
+        npt.assert_array_equal(sorted(surface_mesh.neighbors[beg:end]), expected)
+
+    filepath = tmp_path / "vasculature_mesh.h5"
+    export_vasculature_surface_mesh(filepath, surface_mesh)
+
+    loaded = tested.VasculatureSurfaceMesh.load(filepath)
+    for name in ("points", "triangles", "neighbors", "neighbors_offsets", "triangle_areas"):
+        assert isinstance(getattr(loaded, name), np.memmap)
+        npt.assert_array_equal(getattr(loaded, name), getattr(surface_mesh, name))
+
+    trimesh_mesh = loaded.to_trimesh()
+    npt.assert_allclose(trimesh_mesh.vertices, surface_mesh.points)
+    npt.assert_array_equal(trimesh_mesh.faces, surface_mesh.triangles)
+
+    compact = loaded.compact()
+    for name, dtype in [
+        ("points", np.float32),
+        ("triangles", np.int32),
+        ("neighbors", np.int32),
+        ("neighbors_offsets", np.int32),
+        ("triangle_areas", np.float32),
+    ]:
+        assert getattr(compact, name).dtype == dtype
+        npt.assert_allclose(getattr(compact, name), getattr(surface_mesh, name))
+
+    # the arrays are not copied if they are already compact
+    assert compact.compact().points is compact.points
+
+
+def test_vasculature_surface_mesh__from_mesh_file(tmp_path):
+    import openmesh
+
+    mesh = openmesh.TriMesh()
+    vertices = [
+        mesh.add_vertex(point)
+        for point in np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]])
+    ]
+    mesh.add_face(vertices[0], vertices[1], vertices[2])
+    mesh.add_face(vertices[1], vertices[3], vertices[2])
+
+    filepath = tmp_path / "vasculature_mesh.obj"
+    openmesh.write_mesh(str(filepath), mesh)
+
+    expected = tested.VasculatureSurfaceMesh.from_openmesh(mesh)
+    result = tested.VasculatureSurfaceMesh.from_mesh_file(filepath)
+
+    for name in ("points", "triangles", "neighbors", "neighbors_offsets", "triangle_areas"):
+        npt.assert_allclose(getattr(result, name), getattr(expected, name))
@@ -131,3 +131,45 @@ def test_convex_shape_with_point():
 
     for point in points:
         assert check_func(point)
+
+
+def test_convex_shapes_with_boxes():
+    # unit cube
+    face_points = np.array(
+        [
+            [0.0, 0.0, 0.0],
+            [0.0, 0.0, 0.0],
+            [0.0, 0.0, 0.0],
+            [1.0, 1.0, 1.0],
+            [1.0, 1.0, 1.0],
+            [1.0, 1.0, 1.0],
+        ]
+    )
+    face_normals = np.vstack((-np.identity(3), np.identity(3)))
+
+    # the same cube twice, shifted by 10 in x for the second one
+    face_points = np.vstack((face_points, face_points + [10.0, 0.0, 0.0]))
+    face_normals = np.vstack((face_normals, face_normals))
+    face_offsets = np.array([0, 6, 12])
+
+    shape_ids = np.array([0, 0, 1, 1, 0])
+    centers = np.array(
+        [
+            [0.5, 0.5, 0.5],
+            [1.5, 0.5, 0.5],
+            [0.5, 0.5, 0.5],
+            [10.5, 0.5, 0.5],
+            [1.0, 1.0, 1.0],
+        ]
+    )
+
+    result = collision.convex_shapes_with_boxes(
+        face_points, face_normals, face_offsets, shape_ids, centers
+    )
+    np.testing.assert_array_equal(result, [True, False, False, True, True])
+
+    half_extents = np.full((5, 3), fill_value=0.6)
+    result = collision.convex_shapes_with_boxes(
+        face_points, face_normals, face_offsets, shape_ids, centers, half_extents
+    )
+    np.testing.assert_array_equal(result, [True, True, False, True, True])
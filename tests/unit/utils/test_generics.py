@@ -37,3 +37,13 @@ def test_ensure_list():
 
     testee = "aaaaa"
     assert tested.ensure_list(testee) == [testee]
+
+
+def test_file_checksum(tmp_path):
+    import hashlib
+
+    filepath = tmp_path / "file.txt"
+    filepath.write_bytes(b"ngv" * 1000)
+
+    assert tested.file_checksum(filepath) == hashlib.sha256(b"ngv" * 1000).hexdigest()
+    assert tested.file_checksum(filepath, chunk_size=7) == tested.file_checksum(filepath)
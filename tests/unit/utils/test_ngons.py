@@ -1,4 +1,5 @@
 import numpy as np
+import numpy.testing as npt
 import pytest
 
 from archngv.utils import ngons
@@ -370,3 +371,23 @@ def test_polygon_to_triangles__unique_triangulation():
             tris, tris_to_polys_map = ngons.polygons_to_triangles(points, faces)
             assert_equal_triangles(ref_tris, tris)
             np.testing.assert_allclose(tris_to_polys_map, ref_tris_to_polys_map)
+
+
+def test_segmented_global_to_local_triangles():
+    global_triangles = np.array(
+        [[6, 7, 8], [24, 25, 26], [45, 46, 47], [42, 43, 44], [9, 10, 11], [8, 7, 3], [7, 3, 1]]
+    )
+    offsets = np.array([0, 5, 5, 7])
+
+    vertices, vertices_offsets, local_triangles = ngons.segmented_global_to_local_triangles(
+        global_triangles, offsets
+    )
+
+    npt.assert_array_equal(
+        vertices, [6, 7, 8, 9, 10, 11, 24, 25, 26, 42, 43, 44, 45, 46, 47, 1, 3, 7, 8]
+    )
+    npt.assert_array_equal(vertices_offsets, [0, 15, 15, 19])
+    npt.assert_array_equal(
+        local_triangles,
+        [[0, 1, 2], [6, 7, 8], [12, 13, 14], [9, 10, 11], [3, 4, 5], [3, 2, 1], [2, 1, 0]],
+    )
@@ -0,0 +1,33 @@
+import numpy as np
+from numpy import testing as npt
+
+from archngv.utils import segmented as tested
+
+
+def test_offsets_from_counts():
+    npt.assert_array_equal(tested.offsets_from_counts([2, 0, 3]), [0, 2, 2, 5])
+    npt.assert_array_equal(tested.offsets_from_counts([]), [0])
+
+
+def test_segment_ids():
+    npt.assert_array_equal(tested.segment_ids([0, 2, 2, 5]), [0, 0, 2, 2, 2])
+    npt.assert_array_equal(tested.segment_ids([0]), [])
+
+
+def test_expand_ranges():
+    npt.assert_array_equal(tested.expand_ranges([5, 0, 10], [2, 0, 3]), [5, 6, 10, 11, 12])
+    npt.assert_array_equal(tested.expand_ranges([], []), [])
+
+
+def test_reduce_segments():
+    npt.assert_array_equal(tested.reduce_segments(np.add, [1, 2, 3, 4], [0, 1, 1, 4]), [1, 0, 9])
+    npt.assert_array_equal(
+        tested.reduce_segments(np.maximum, [1, 5, 3, 4], [0, 0, 2, 2, 4], empty_value=-1),
+        [-1, 5, -1, 4],
+    )
+    npt.assert_array_equal(
+        tested.reduce_segments(np.minimum, [[1, 5], [3, 4], [0, 9]], [0, 2, 3]),
+        [[1, 4], [0, 9]],
+    )
+    npt.assert_array_equal(tested.reduce_segments(np.add, [], [0, 0]), [0])
+    npt.assert_array_equal(tested.reduce_segments(np.add, [], [0]), [])
@@ -1,5 +1,7 @@
 import numpy as np
+import numpy.testing as npt
 
+from archngv.utils import statistics as tested
 from archngv.utils.statistics import truncated_normal
 
 
@@ -27,3 +29,16 @@ def test_truncated_normal():
 
     assert np.all(values > min_value)
     assert np.all(values < max_value)
+
+
+def test_histogram_summary():
+    summary = tested.histogram_summary(np.array([0, 1, 1, 2, 4]), bins=4)
+    assert summary["min"] == 0
+    assert summary["max"] == 4
+    npt.assert_allclose(summary["mean"], 1.6)
+    npt.assert_allclose(summary["bin_edges"], [0.0, 1.0, 2.0, 3.0, 4.0])
+    assert summary["counts"] == [1, 2, 1, 1]
+
+    summary = tested.histogram_summary(np.array([]))
+    assert summary["counts"] == []
+    assert summary["mean"] is None